@@ -213,6 +213,10 @@ OSCAR_DASHBOARD_NAVIGATION.append(      # noqa F405
                 'label': 'Profit/loss report',
                 'url_name': 'accounts_dashboard:report-profit-loss',
             },
+            {
+                'label': 'Report jobs',
+                'url_name': 'accounts_dashboard:report-jobs-list',
+            },
         ]
     })
 
@@ -1,16 +1,19 @@
-import hmac
+import copy
+import os
+import random
+import time
+from collections import OrderedDict
 from decimal import Decimal as D
 
-from django.conf import settings
-from django.db import models, transaction
-from django.db.models import Sum
+from django.db import IntegrityError, connections, models, transaction
+from django.db.models import F, Sum
 from django.urls import reverse
-from django.utils import six, timezone
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from oscar.core.compat import AUTH_USER_MODEL
 from treebeard.mp_tree import MP_Node
 
-from oscar_accounts import exceptions
+from oscar_accounts import exceptions, names, signals
 
 
 class ActiveAccountManager(models.Manager):
@@ -44,10 +47,21 @@ class AccountType(MP_Node):
 
     @property
     def full_name(self):
+        # Imported here as the registry needs the models to be loaded
+        from oscar_accounts import registry
+        full_name = registry.account_type_full_name(self)
+        if full_name is not None:
+            return full_name
         names = [a.name for a in self.get_ancestors()]
         names.append(self.name)
         return " / ".join(names)
 
+    def move(self, target, pos=None):
+        # Moves rewrite paths with raw SQL so no signals are sent
+        from oscar_accounts import registry
+        super().move(target, pos)
+        registry.invalidate_account_types()
+
 
 class Account(models.Model):
     # Metadata
@@ -123,6 +137,11 @@ class Account(models.Model):
 
     class Meta:
         abstract = True
+        indexes = [
+            # Finding expired, open accounts to close
+            models.Index(fields=['status', 'end_date'],
+                         name='accounts_account_status_end'),
+        ]
 
     def __str__(self):
         if self.code:
@@ -131,6 +150,18 @@ class Account(models.Model):
             return self.name
         return 'Anonymous'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The balance of a striped account lives in its shards.  Rather than
+        # summing them for every row loaded (eg each transfer of a listing,
+        # through select_related), the balance is deferred so that they are
+        # only read (by refresh_from_db) if it is used.
+        if 'balance' in field_names and 'name' in field_names \
+                and instance.is_striped:
+            del instance.__dict__['balance']
+        return instance
+
     def is_active(self):
         if self.start_date is None and self.end_date is None:
             return True
@@ -142,10 +173,28 @@ class Account(models.Model):
         return self.start_date <= now < self.end_date
 
     def save(self, *args, **kwargs):
+        """
+        Save the account, recalculating its balance from its transactions.
+
+        The balance is left untouched, and isn't written, when
+        `update_balance=False` is passed or when `update_fields` doesn't
+        include it.  Use this for status and other metadata changes: they
+        become a single UPDATE and can't overwrite the balance written by a
+        concurrent posting.
+        """
+        update_balance = kwargs.pop('update_balance', True)
+        update_fields = kwargs.get('update_fields')
         if self.code:
             self.code = self.code.upper()
-        # Ensure the balance is always correct when saving
-        self.balance = self._balance()
+        if update_fields is not None:
+            update_balance = update_balance and 'balance' in update_fields
+        elif not update_balance and not self._state.adding:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'balance']
+        if update_balance:
+            # Ensure the balance is always correct when saving
+            self.balance = self._balance()
         return super(Account, self).save(*args, **kwargs)
 
     def _balance(self):
@@ -153,6 +202,92 @@ class Account(models.Model):
         sum = aggregates['sum']
         return D('0.00') if sum is None else sum
 
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using, fields)
+        # from_db can't tell whether an account is striped when only its
+        # balance is loaded (eg when a deferred balance is accessed)
+        if fields is not None and 'balance' in fields \
+                and 'name' not in self.get_deferred_fields() \
+                and self.is_striped:
+            shard_balance = self.shard_balance()
+            if shard_balance is not None:
+                self.balance = shard_balance
+
+    def refresh_balance(self):
+        """
+        Reload the cached balance from the database
+        """
+        self.refresh_from_db(fields=['balance'])
+
+    def reconcile_balance(self):
+        """
+        Recalculate the cached balance from the full transaction history.
+
+        Postings only apply their delta to the cached balance so this is not
+        needed in normal operation.  It is the (expensive) way to repair a
+        balance that has drifted from the account's transactions.
+        """
+        with transaction.atomic():
+            # Lock the row (and shards) so no posting can slip in between the
+            # aggregate and the write
+            self.__class__.objects.select_for_update().only('pk').get(
+                pk=self.pk)
+            shards = self.balance_shards.select_for_update().order_by('number')
+            has_shards = len(shards) > 0
+            self.balance = self._balance()
+            self.__class__.objects.filter(pk=self.pk).update(
+                balance=self.balance)
+            if has_shards:
+                self.balance_shards.update(balance=D('0.00'))
+                self.balance_shards.filter(number=0).update(
+                    balance=self.balance)
+            self._invalidate_cached_balance()
+        return self.balance
+
+    def _invalidate_cached_balance(self):
+        # Imported here as the cache needs the models to be loaded
+        from oscar_accounts import balance_cache
+        if balance_cache.ENABLED and self.code:
+            # The balance is written with an UPDATE, which doesn't send the
+            # post_save signal the cache listens for
+            code = self.code
+            transaction.on_commit(lambda: balance_cache.invalidate(code))
+
+    @property
+    def is_striped(self):
+        """
+        Test whether postings to this account are spread over balance shards
+        """
+        return self.name is not None and self.name in names.STRIPED_ACCOUNTS
+
+    @property
+    def num_balance_shards(self):
+        return names.STRIPED_ACCOUNTS.get(self.name, 0)
+
+    def shard_balance(self):
+        """
+        Return the sum of the balance shards, or None if the account has none
+        """
+        return self.balance_shards.aggregate(sum=Sum('balance'))['sum']
+
+    def create_balance_shards(self):
+        """
+        Create the balance shards of a striped account, seeded with its
+        current balance.  Return False if the shards already exist.
+        """
+        with transaction.atomic():
+            self.__class__.objects.select_for_update().only('pk').get(
+                pk=self.pk)
+            if self.balance_shards.exists():
+                return False
+            balance = self._balance()
+            self.balance_shards.bulk_create([
+                self.balance_shards.model(
+                    account=self, number=number,
+                    balance=balance if number == 0 else D('0.00'))
+                for number in range(self.num_balance_shards)])
+        return True
+
     def num_transactions(self):
         return self.transactions.all().count()
 
@@ -240,7 +375,10 @@ class Account(models.Model):
         if self.balance > 0:
             raise exceptions.AccountNotEmpty()
         self.status = self.__class__.CLOSED
-        self.save()
+        if self._state.adding:
+            self.save()
+        else:
+            self.save(update_fields=['status'])
 
     def as_dict(self):
         data = {
@@ -269,11 +407,64 @@ class PostingManager(models.Manager):
     """
 
     def create(self, source, destination, amount, parent=None,
-               user=None, merchant_reference=None, description=None):
+               user=None, merchant_reference=None, description=None,
+               idempotency_key=None):
+        # A transfer that was already made with the passed idempotency key is
+        # returned instead of being posted again
+        if idempotency_key is not None:
+            transfer = self.replay(
+                idempotency_key, source, destination, amount)
+            if transfer is not None:
+                return transfer
+        try:
+            return self._create(source, destination, amount, parent, user,
+                                merchant_reference, description,
+                                idempotency_key)
+        except IntegrityError:
+            # A concurrent request with the same key got there first
+            transfer = None
+            if idempotency_key is not None:
+                transfer = self.replay(
+                    idempotency_key, source, destination, amount)
+            if transfer is None:
+                raise
+            return transfer
+
+    def replay(self, idempotency_key, source, destination, amount):
+        """
+        Return the transfer made with the passed idempotency key, or None if
+        there isn't one.
+
+        Raises IdempotencyKeyReused if the key was used for a different
+        transfer.
+        """
+        transfer = self.get_queryset().filter(
+            idempotency_key=idempotency_key).first()
+        if transfer is None:
+            return None
+        if (transfer.source_id, transfer.destination_id, transfer.amount) != (
+                source.pk, destination.pk, amount):
+            raise exceptions.IdempotencyKeyReused(
+                "Idempotency key '%s' has already been used for a different "
+                "transfer" % idempotency_key)
+        # As with a new transfer, the passed accounts are used rather than
+        # being loaded again (eg by as_dict)
+        transfer.source, transfer.destination = source, destination
+        return transfer
+
+    def _create(self, source, destination, amount, parent, user,
+                merchant_reference, description, idempotency_key):
         # Write out transfer (which involves multiple writes).  We use a
         # database transaction to ensure that all get written out correctly.
         self.verify_transfer(source, destination, amount, user)
         with transaction.atomic():
+            # The checks above used the passed instances, which may be stale.
+            # Lock both rows and check again so that concurrent postings from
+            # the same account cannot both pass verification.
+            locked = self.lock_accounts(
+                [source, destination], debited=[source])
+            self.verify_transfer(
+                locked[source.pk], locked[destination.pk], amount, user)
             transfer = self.get_queryset().create(
                 source=source,
                 destination=destination,
@@ -281,17 +472,261 @@ class PostingManager(models.Manager):
                 parent=parent,
                 user=user,
                 merchant_reference=merchant_reference,
-                description=description)
+                description=description,
+                idempotency_key=idempotency_key)
             # Create transaction records for audit trail
             transfer.transactions.create(
                 account=source, amount=-amount)
             transfer.transactions.create(
                 account=destination, amount=amount)
             # Update the cached balances on the accounts
-            source.save()
-            destination.save()
+            self._update_balance(source, locked[source.pk], -amount)
+            self._update_balance(destination, locked[destination.pk], amount)
+            self._update_refunded_amounts([transfer])
+            self._update_rollups([transfer])
+            self._send_posted([transfer])
             return self._wrap(transfer)
 
+    def create_many(self, legs, grouped=False):
+        """
+        Post several transfers in a single database transaction.
+
+        Each leg is a dict of the keyword arguments accepted by `create`.  The
+        legs are verified in order, as though they were posted one after the
+        other, and either all of them are posted or none is.  Accounts are
+        locked once, the transfers and transactions are written with bulk
+        inserts and each account's balance is updated once (accounts moved by
+        the same amount in one statement).
+
+        With `grouped`, the transfers are recorded as one payment: each gets
+        the reference of the first as its `group_reference`.
+
+        Returns the list of created transfers.
+        """
+        legs = [dict(leg) for leg in legs]
+        for leg in legs:
+            leg.setdefault('user', None)
+            self.verify_transfer(
+                leg['source'], leg['destination'], leg['amount'], leg['user'])
+        if not legs:
+            return []
+        instances = OrderedDict()
+        for leg in legs:
+            for account in (leg['source'], leg['destination']):
+                instances.setdefault(account.pk, []).append(account)
+        with transaction.atomic():
+            locked = self.lock_accounts(
+                [accounts[0] for accounts in instances.values()],
+                debited=[leg['source'] for leg in legs])
+            # Verify each leg against the balances left by the legs before it
+            running = {pk: copy.copy(account) for pk, account in locked.items()}
+            deltas = OrderedDict((pk, D('0.00')) for pk in instances)
+            for leg in legs:
+                source = running[leg['source'].pk]
+                destination = running[leg['destination'].pk]
+                self.verify_transfer(
+                    source, destination, leg['amount'], leg['user'])
+                source.balance -= leg['amount']
+                destination.balance += leg['amount']
+                deltas[source.pk] -= leg['amount']
+                deltas[destination.pk] += leg['amount']
+
+            transfers = [self._build_transfer(**leg) for leg in legs]
+            if grouped:
+                for transfer in transfers:
+                    transfer.group_reference = transfers[0].reference
+            self.bulk_create(transfers)
+            if transfers[0].pk is None:
+                # The database can't return the primary keys of bulk inserted
+                # rows so we look them up by reference
+                pks = dict(self.get_queryset().filter(
+                    reference__in=[t.reference for t in transfers]
+                ).values_list('reference', 'pk'))
+                for transfer in transfers:
+                    transfer.pk = pks[transfer.reference]
+
+            # Create transaction records for audit trail
+            transaction_model = self.model._meta.get_field(
+                'transactions').related_model
+            transaction_model.objects.bulk_create([
+                transaction_model(transfer=transfer, account=account,
+                                  amount=amount)
+                for transfer in transfers
+                for account, amount in ((transfer.source, -transfer.amount),
+                                        (transfer.destination,
+                                         transfer.amount))])
+
+            # Update the cached balances on the accounts, once per account
+            self._update_balances(instances, locked, deltas)
+            self._update_refunded_amounts(transfers)
+            self._update_rollups(transfers)
+            self._send_posted(transfers)
+            return transfers
+
+    def _build_transfer(self, source, destination, amount, parent=None,
+                        user=None, merchant_reference=None, description=None,
+                        idempotency_key=None):
+        # Bulk inserts bypass Transfer.save so we fill in what it would
+        # have done here
+        transfer = self.model(
+            source=source,
+            destination=destination,
+            amount=amount,
+            parent=parent,
+            user=user,
+            merchant_reference=merchant_reference,
+            description=description,
+            idempotency_key=idempotency_key)
+        transfer.reference = transfer._generate_reference()
+        if user:
+            transfer.username = user.get_username()
+        return transfer
+
+    def lock_accounts(self, accounts, debited=()):
+        """
+        Lock the rows of the passed accounts until the end of the current
+        database transaction and return fresh copies of them, keyed by
+        primary key.
+
+        Rows are always locked in primary key order so that two postings
+        touching the same accounts cannot deadlock.
+
+        Striped accounts are not locked for update as that would defeat the
+        point of striping.  Instead their rows are locked for share, so that
+        concurrent postings don't wait on each other but a change of status
+        (eg closing the account) waits for them, and their status and credit
+        limit are read again.  When one of them is being debited (ie it is in
+        `debited`) and has a credit limit, all of its shards are locked too so
+        its balance can be checked.
+        """
+        model = self.model._meta.get_field('source').related_model
+        striped = {
+            account.pk: account for account in accounts if account.is_striped}
+        pks = sorted(set(account.pk for account in accounts) - set(striped))
+        qs = model.objects.select_for_update().filter(
+            pk__in=pks).order_by('pk')
+        locked = {account.pk: account for account in qs}
+        for pk in striped:
+            locked[pk] = copy.copy(striped[pk])
+        if striped:
+            rows = self._lock_for_share(model.objects.filter(
+                pk__in=striped).order_by('pk').values_list(
+                    'pk', 'status', 'credit_limit'))
+            for pk, status, credit_limit in rows:
+                locked[pk].status = status
+                locked[pk].credit_limit = credit_limit
+        debited_pks = set(account.pk for account in debited)
+        for pk in sorted(striped):
+            account = locked[pk]
+            if pk in debited_pks and account.has_credit_limit:
+                shards = account.balance_shards.select_for_update().order_by(
+                    'number')
+                balances = [shard.balance for shard in shards]
+                if balances:
+                    account.balance = sum(balances, D('0.00'))
+        return locked
+
+    def _lock_for_share(self, queryset):
+        # Django can only lock rows for update, so the shared lock is added to
+        # the query's SQL on the databases that support one.  SQLite locks the
+        # whole database on write, so there is nothing to lock.
+        connection = connections[queryset.db]
+        suffix = {'postgresql': ' FOR SHARE',
+                  'mysql': ' LOCK IN SHARE MODE'}.get(connection.vendor)
+        if suffix is None:
+            if connection.vendor != 'sqlite':
+                queryset = queryset.select_for_update()
+            return list(queryset)
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(sql + suffix, params)
+            return cursor.fetchall()
+
+    def _update_balance(self, account, locked_account, delta):
+        # Apply the delta in the database rather than recalculating the
+        # balance from the account's whole transaction history, so the cost of
+        # a posting does not grow with the age of the account.  As the row is
+        # locked, the new balance can be worked out without reading it again.
+        if account.is_striped:
+            # The account's row isn't locked (and its balance may not have
+            # been loaded), so the balance is read again from the shards,
+            # which include this posting, when it is next used
+            self._update_shard_balance(account, delta)
+            account.__dict__.pop('balance', None)
+            return
+        account.__class__.objects.filter(pk=account.pk).update(
+            balance=F('balance') + delta)
+        account.balance = locked_account.balance + delta
+
+    def _update_balances(self, instances, locked, deltas):
+        # Accounts moved by the same amount (eg a batch of accounts being
+        # loaded) are updated together, with a single UPDATE
+        pks_by_delta = OrderedDict()
+        for pk, delta in deltas.items():
+            account = instances[pk][0]
+            if account.is_striped:
+                self._update_balance(account, locked[pk], delta)
+            else:
+                pks_by_delta.setdefault(delta, []).append(pk)
+        model = self.model._meta.get_field('source').related_model
+        for delta, pks in pks_by_delta.items():
+            model.objects.filter(pk__in=pks).update(
+                balance=F('balance') + delta)
+        for pk, delta in deltas.items():
+            accounts = instances[pk]
+            if accounts[0].is_striped:
+                for account in accounts[1:]:
+                    account.__dict__.pop('balance', None)
+                continue
+            accounts[0].balance = locked[pk].balance + delta
+            for account in accounts[1:]:
+                account.balance = accounts[0].balance
+
+    def _update_shard_balance(self, account, delta):
+        # Credit or debit a random shard so that concurrent postings to the
+        # same account are unlikely to wait on each other.
+        number = random.randrange(account.num_balance_shards)
+        updated = account.balance_shards.filter(number=number).update(
+            balance=F('balance') + delta)
+        if not updated and not account.create_balance_shards():
+            # The shards were created by a concurrent posting
+            account.balance_shards.filter(number=number).update(
+                balance=F('balance') + delta)
+        # Otherwise the new shards were seeded from the transactions, which
+        # include the one for this posting.
+
+    def _update_refunded_amounts(self, transfers):
+        # Refunds (transfers back to the source of their parent) are added to
+        # the parent's refunded amount, so that max_refund doesn't need to
+        # total them.
+        totals = OrderedDict()
+        parents = {}
+        for transfer in transfers:
+            if transfer.parent_id is None:
+                continue
+            parent = transfer.parent
+            if transfer.source_id != parent.destination_id:
+                continue
+            totals[parent.pk] = totals.get(parent.pk, D('0.00')) + transfer.amount
+            # Several legs may share the same parent instance
+            parents.setdefault(parent.pk, {})[id(parent)] = parent
+        for pk, amount in totals.items():
+            self.get_queryset().filter(pk=pk).update(
+                refunded_amount=F('refunded_amount') + amount)
+            for parent in parents[pk].values():
+                parent.refunded_amount += amount
+
+    def _update_rollups(self, transfers):
+        # Imported here as the rollups need the models to be loaded
+        from oscar_accounts import rollups
+        rollups.add_transfers(transfers)
+
+    def _send_posted(self, transfers):
+        # Listeners (eg caches of balances) are only told about the transfers
+        # if and when they are committed
+        transaction.on_commit(lambda: signals.transfers_posted.send(
+            sender=self.model, transfers=transfers))
+
     def _wrap(self, obj):
         # Dumb method that is here only so that it can be mocked to test the
         # transaction behaviour.
@@ -342,10 +777,25 @@ class Transfer(models.Model):
     parent = models.ForeignKey('self', models.CASCADE, null=True,
                                related_name='related_transfers')
 
+    # The total of the refunds made against this transfer, maintained by the
+    # posting engine
+    refunded_amount = models.DecimalField(decimal_places=2, max_digits=12,
+                                          default=D('0.00'))
+
     # Optional meta-data about transfer
     merchant_reference = models.CharField(max_length=128, null=True)
     description = models.CharField(max_length=256, null=True)
 
+    # Transfers posted together as one payment (eg the legs of an order paid
+    # with several giftcards) share the reference of the first of them.  This
+    # isn't done with a parent as transfers back to the parent's source are
+    # treated as refunds of it.
+    group_reference = models.CharField(max_length=64, null=True)
+
+    # A key chosen by the client so that a retried request returns the
+    # original transfer instead of posting it twice
+    idempotency_key = models.CharField(max_length=128, unique=True, null=True)
+
     # We record who the user was who authorised this transaction.  As
     # transactions should never be deleted, we allow this field to be null and
     # also record some audit information.
@@ -364,6 +814,21 @@ class Transfer(models.Model):
     class Meta:
         abstract = True
         ordering = ('-date_created',)
+        indexes = [
+            # The reports total the transfers between two accounts over a
+            # date range
+            models.Index(fields=['source', 'destination', 'date_created'],
+                         name='accounts_transfer_src_dst_date'),
+            # The default ordering, and the dashboard's date filters
+            models.Index(fields=['date_created'],
+                         name='accounts_transfer_date'),
+            # Looking up the transfers for an order
+            models.Index(fields=['merchant_reference'],
+                         name='accounts_transfer_merchant_ref'),
+            # Looking up the legs of a payment
+            models.Index(fields=['group_reference'],
+                         name='accounts_transfer_group_ref'),
+        ]
 
     def delete(self, *args, **kwargs):
         raise RuntimeError("Transfers cannot be deleted")
@@ -372,17 +837,20 @@ class Transfer(models.Model):
         # Store audit information about authorising user (if one is set)
         if self.user:
             self.username = self.user.get_username()
-        # We generate a transaction reference using the PK of the transfer so
-        # we save the transfer first
-        super().save(*args, **kwargs)
+        # The reference doesn't depend on the PK so it is set before the row
+        # is inserted.  Existing references are never changed.
         if not self.reference:
             self.reference = self._generate_reference()
-            super().save()
+        super().save(*args, **kwargs)
 
     def _generate_reference(self):
-        obj = hmac.new(key=settings.SECRET_KEY.encode(),
-                       msg=six.text_type(self.id).encode())
-        return obj.hexdigest().upper()
+        # A time-ordered random identifier: 48 bits of milliseconds since the
+        # epoch followed by 80 random bits, as 32 uppercase hex characters.
+        # The random part makes collisions practically impossible and
+        # references unguessable, while the time prefix keeps inserts into
+        # the unique index close together.
+        millis = int(time.time() * 1000) & 0xFFFFFFFFFFFF
+        return ('%012x%s' % (millis, os.urandom(10).hex())).upper()
 
     @property
     def authorisor_username(self):
@@ -390,18 +858,25 @@ class Transfer(models.Model):
             return self.user.get_username()
         return self.username
 
+    def group(self):
+        """
+        Return the transfers posted together with this one as a payment,
+        including this one
+        """
+        if self.group_reference is None:
+            return self.__class__.objects.filter(pk=self.pk)
+        return self.__class__.objects.filter(
+            group_reference=self.group_reference)
+
     def max_refund(self):
         """
         Return the maximum amount that can be refunded against this transfer
         """
-        aggregates = self.related_transfers.filter(
-            source=self.destination).aggregate(sum=Sum('amount'))
-        already_refunded = aggregates['sum']
-        if already_refunded is None:
-            return self.amount
-        return self.amount - already_refunded
+        return self.amount - self.refunded_amount
 
     def as_dict(self):
+        # The accounts should be loaded with the transfer (eg with
+        # select_related) to avoid a query for each
         return {
             'reference': self.reference,
             'source_code': self.source.code,
@@ -442,11 +917,212 @@ class Transaction(models.Model):
     class Meta:
         unique_together = ('transfer', 'account')
         abstract = True
+        indexes = [
+            # An account's statement, newest first
+            models.Index(fields=['account', 'date_created'],
+                         name='accounts_txn_account_date'),
+        ]
 
     def delete(self, *args, **kwargs):
         raise RuntimeError("Transactions cannot be deleted")
 
 
+class BalanceShard(models.Model):
+    """
+    One of the rows that together hold the balance of a striped account.
+
+    The balance of a striped account is the sum of its shards.  Each posting
+    updates a single, randomly chosen, shard.
+    """
+    account = models.ForeignKey('oscar_accounts.Account', models.CASCADE,
+                                related_name='balance_shards')
+    number = models.PositiveSmallIntegerField()
+    balance = models.DecimalField(decimal_places=2, max_digits=12,
+                                  default=D('0.00'))
+
+    class Meta:
+        abstract = True
+        unique_together = ('account', 'number')
+
+    def __str__(self):
+        return "Shard %d of %s" % (self.number, self.account_id)
+
+
+class BalanceCheckpoint(models.Model):
+    """
+    The balance of an account at a point in time.
+
+    Checkpoints are taken for all accounts at once, at the end of each day or
+    month, so that historic balances can be worked out from the latest
+    checkpoint and the (few) transactions since, rather than from the whole
+    transaction history.  No checkpoint is stored for accounts with a zero
+    balance.
+    """
+    account = models.ForeignKey('oscar_accounts.Account', models.CASCADE,
+                                related_name='balance_checkpoints')
+
+    # The balance is the sum of the account's transactions created before
+    # this date
+    date = models.DateTimeField(db_index=True)
+    balance = models.DecimalField(decimal_places=2, max_digits=12)
+
+    class Meta:
+        abstract = True
+        unique_together = ('account', 'date')
+        ordering = ('-date',)
+
+    def __str__(self):
+        return "Balance of account #%d at %s" % (self.account_id, self.date)
+
+
+class DailyFlow(models.Model):
+    """
+    The total of the transfers made from one account to another on a day
+    (UTC).
+
+    Like ``DailyMovement``, flows are rolled up by the ``update_rollups``
+    command, once a day is over, so that reports can total long date ranges
+    without reading every transfer.
+    """
+    date = models.DateField()
+    source = models.ForeignKey('oscar_accounts.Account', models.CASCADE,
+                               related_name='+')
+    destination = models.ForeignKey('oscar_accounts.Account', models.CASCADE,
+                                    related_name='+')
+    total = models.DecimalField(decimal_places=2, max_digits=12)
+    num_transfers = models.PositiveIntegerField()
+
+    class Meta:
+        abstract = True
+        unique_together = ('date', 'source', 'destination')
+
+    def __str__(self):
+        return "Transfers from #%d to #%d on %s" % (
+            self.source_id, self.destination_id, self.date)
+
+
+class DailyMovement(models.Model):
+    """
+    The net total of an account's transactions on a day (UTC)
+    """
+    date = models.DateField()
+    account = models.ForeignKey('oscar_accounts.Account', models.CASCADE,
+                                related_name='+')
+    total = models.DecimalField(decimal_places=2, max_digits=12)
+    num_transactions = models.PositiveIntegerField()
+
+    class Meta:
+        abstract = True
+        unique_together = ('date', 'account')
+
+    def __str__(self):
+        return "Movement of account #%d on %s" % (self.account_id, self.date)
+
+
+class RollupDay(models.Model):
+    """
+    A day whose flows and movements have been rolled up.
+
+    Days are rolled up in order, so every day up to the latest one is covered.
+    """
+    date = models.DateField(unique=True)
+    date_created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        abstract = True
+        ordering = ('-date',)
+
+    def __str__(self):
+        return "Rollup of %s" % self.date
+
+
+class PostingRequest(models.Model):
+    """
+    A transfer waiting in the posting queue.
+
+    With group commit enabled, transfers are first written to this journal and
+    then posted in batches, many to a database transaction, by whichever
+    process drains the queue next.  See `oscar_accounts.posting_queue`.
+    """
+    source = models.ForeignKey('oscar_accounts.Account', models.CASCADE,
+                               related_name='+')
+    destination = models.ForeignKey('oscar_accounts.Account', models.CASCADE,
+                                    related_name='+')
+    amount = models.DecimalField(decimal_places=2, max_digits=12)
+    parent = models.ForeignKey('oscar_accounts.Transfer', models.CASCADE,
+                               null=True, related_name='+')
+    user = models.ForeignKey(AUTH_USER_MODEL, models.SET_NULL, null=True,
+                             related_name='+')
+    merchant_reference = models.CharField(max_length=128, null=True)
+    description = models.CharField(max_length=256, null=True)
+    idempotency_key = models.CharField(max_length=128, null=True)
+
+    PENDING, POSTED, FAILED = 'Pending', 'Posted', 'Failed'
+    status = models.CharField(max_length=32, default=PENDING, db_index=True)
+
+    # Set once the request has been processed.  Retried requests (with the
+    # same idempotency key) share the transfer they replay.
+    transfer = models.ForeignKey('oscar_accounts.Transfer', models.CASCADE,
+                                 null=True, related_name='posting_requests')
+    error = models.TextField(blank=True)
+    # The name of the exception (from `oscar_accounts.exceptions`) a failed
+    # request raised, so that it can be raised again to the caller
+    error_type = models.CharField(max_length=64, blank=True)
+
+    date_created = models.DateTimeField(auto_now_add=True)
+    date_processed = models.DateTimeField(null=True)
+
+    class Meta:
+        abstract = True
+
+    def __str__(self):
+        return "Posting request #%d (%s)" % (self.id, self.status)
+
+    def is_pending(self):
+        return self.status == self.__class__.PENDING
+
+
+class ReportJob(models.Model):
+    """
+    A dashboard report run in the background.
+
+    Jobs are run by a pool of worker threads in the process that submitted
+    them, or by the ``run_report_jobs`` command.  See
+    `oscar_accounts.report_jobs`.
+    """
+    report = models.CharField(max_length=32)
+    # The (inclusive) dates the report covers.  The deferred income report
+    # only has an end date.
+    start_date = models.DateField(null=True)
+    end_date = models.DateField()
+    user = models.ForeignKey(AUTH_USER_MODEL, models.SET_NULL, null=True,
+                             related_name='+')
+
+    PENDING, RUNNING, COMPLETE, FAILED = (
+        'Pending', 'Running', 'Complete', 'Failed')
+    status = models.CharField(max_length=32, default=PENDING, db_index=True)
+    # Percentage
+    progress = models.PositiveSmallIntegerField(default=0)
+
+    # The report's results, as JSON
+    result = models.TextField(blank=True)
+    error = models.TextField(blank=True)
+
+    date_created = models.DateTimeField(auto_now_add=True)
+    date_started = models.DateTimeField(null=True)
+    date_finished = models.DateTimeField(null=True)
+
+    class Meta:
+        abstract = True
+        ordering = ('-date_created',)
+
+    def __str__(self):
+        return "Report job #%d (%s)" % (self.id, self.status)
+
+    def is_finished(self):
+        return self.status in (self.__class__.COMPLETE, self.__class__.FAILED)
+
+
 class IPAddressRecord(models.Model):
     ip_address = models.GenericIPAddressField(_("IP address"), unique=True)
     total_failures = models.PositiveIntegerField(default=0)
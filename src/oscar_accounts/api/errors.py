@@ -7,6 +7,7 @@ AMOUNT_TOO_HIGH = 'C102'
 CANNOT_CREATE_TRANSFER = 'T100'
 INSUFFICIENT_FUNDS = 'T101'
 ACCOUNT_INACTIVE = 'T102'
+IDEMPOTENCY_KEY_REUSED = 'T103'
 
 MESSAGES = {
     CANNOT_CREATE_ACCOUNT: "Cannot create account",
@@ -15,6 +16,7 @@ MESSAGES = {
     CANNOT_CREATE_TRANSFER: "Cannot create transfer",
     INSUFFICIENT_FUNDS: "Insufficient funds",
     ACCOUNT_INACTIVE: "Account inactive",
+    IDEMPOTENCY_KEY_REUSED: "Idempotency key already used for a different request",
 }
 
 
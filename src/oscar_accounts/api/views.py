@@ -11,7 +11,8 @@ from django.utils import timezone
 from django.views import generic
 from oscar.core.loading import get_model
 
-from oscar_accounts import codes, exceptions, facade, names
+from oscar_accounts import (
+    balance_cache, codes, core, exceptions, facade, names, registry)
 from oscar_accounts.api import errors
 
 Account = get_model('oscar_accounts', 'Account')
@@ -33,6 +34,10 @@ class JSONView(generic.View):
     required_keys = ()
     optional_keys = ()
 
+    # Clients can pass an 'Idempotency-Key' header so that retrying a request
+    # returns the original transfer rather than making a second one
+    idempotency_key = None
+
     # Error handlers
 
     def forbidden(self, code=None, msg=None):
@@ -63,6 +68,26 @@ class JSONView(generic.View):
         return http.HttpResponse(json.dumps(data),
                                  content_type='application/json')
 
+    def transfer_created(self, transfer):
+        return self.created(
+            reverse('oscar_accounts_api:transfer', kwargs={'reference': transfer.reference}),
+            transfer.as_dict())
+
+    # Idempotency
+
+    def replayed_transfer(self, source, destination, amount):
+        """
+        Return the transfer made by an earlier request with the same
+        idempotency key, if there was one
+        """
+        if self.idempotency_key is None:
+            return None
+        try:
+            return Transfer.objects.replay(
+                self.idempotency_key, source, destination, amount)
+        except exceptions.IdempotencyKeyReused:
+            raise ValidationError(errors.IDEMPOTENCY_KEY_REUSED)
+
     def post(self, request, *args, **kwargs):
         # Only accept JSON
         if request.META['CONTENT_TYPE'] != 'application/json':
@@ -73,6 +98,10 @@ class JSONView(generic.View):
         except ValueError:
             return self.bad_request(
                 msg="JSON payload could not be decoded")
+        self.idempotency_key = request.META.get('HTTP_IDEMPOTENCY_KEY') or None
+        if self.idempotency_key is not None and len(self.idempotency_key) > 128:
+            return self.bad_request(
+                msg="Idempotency keys must be at most 128 characters")
         try:
             self.validate_payload(payload)
         except InvalidPayload as e:
@@ -145,7 +174,7 @@ class AccountsView(JSONView):
         if value not in names.DEFERRED_INCOME_ACCOUNT_TYPES:
             raise InvalidPayload('Unrecognised account type')
         try:
-            acc_type = AccountType.objects.get(name=value)
+            acc_type = registry.account_type(name=value)
         except AccountType.DoesNotExist:
             raise InvalidPayload('Unrecognised account type')
         return acc_type
@@ -156,6 +185,11 @@ class AccountsView(JSONView):
                 'Start date must be before end date')
 
     def valid_payload(self, payload):
+        account = self.replayed_account(payload)
+        if account is not None:
+            return self.created(
+                reverse('oscar_accounts_api:account', kwargs={'code': account.code}),
+                account.as_dict())
         account = self.create_account(payload)
         try:
             self.load_account(account, payload)
@@ -169,6 +203,21 @@ class AccountsView(JSONView):
                 reverse('oscar_accounts_api:account', kwargs={'code': account.code}),
                 account.as_dict())
 
+    def replayed_account(self, payload):
+        # The account created by an earlier request with the same idempotency
+        # key is found through the transfer that loaded it
+        if self.idempotency_key is None:
+            return None
+        transfer = Transfer.objects.filter(
+            idempotency_key=self.idempotency_key).select_related(
+                'destination').first()
+        if transfer is None:
+            return None
+        if (transfer.source_id, transfer.amount) != (
+                registry.account_id(names.BANK), payload['amount']):
+            raise ValidationError(errors.IDEMPOTENCY_KEY_REUSED)
+        return transfer.destination
+
     def create_account(self, payload):
         return Account.objects.create(
             account_type=payload['account_type'],
@@ -178,9 +227,10 @@ class AccountsView(JSONView):
         )
 
     def load_account(self, account, payload):
-        bank = Account.objects.get(name=names.BANK)
+        bank = core.bank_account()
         facade.transfer(bank, account, payload['amount'],
-                        description="Load from bank")
+                        description="Load from bank",
+                        idempotency_key=self.idempotency_key)
 
 
 class AccountView(JSONView):
@@ -188,7 +238,10 @@ class AccountView(JSONView):
     Fetch details of an account
     """
     def get(self, request, *args, **kwargs):
-        account = get_object_or_404(Account, code=kwargs['code'])
+        try:
+            account = balance_cache.get_account(kwargs['code'])
+        except Account.DoesNotExist:
+            raise http.Http404
         return self.ok(account.as_dict())
 
 
@@ -210,24 +263,30 @@ class AccountRedemptionsView(JSONView):
         Redeem an amount from the selected giftcard
         """
         account = get_object_or_404(Account, code=self.kwargs['code'])
+        amt = payload['amount']
+        redemptions = core.redemptions_account()
+        transfer = self.replayed_transfer(account, redemptions, amt)
+        if transfer is not None:
+            return self.transfer_created(transfer)
+
         if not account.is_active():
             raise ValidationError(errors.ACCOUNT_INACTIVE)
-        amt = payload['amount']
         if not account.is_debit_permitted(amt):
             raise ValidationError(errors.INSUFFICIENT_FUNDS)
 
-        redemptions = Account.objects.get(name=names.REDEMPTIONS)
         try:
             transfer = facade.transfer(
                 account, redemptions, amt,
-                merchant_reference=payload.get('merchant_reference', None))
+                merchant_reference=payload.get('merchant_reference', None),
+                idempotency_key=self.idempotency_key)
+        except exceptions.IdempotencyKeyReused:
+            # A concurrent request with the same key made a different transfer
+            raise ValidationError(errors.IDEMPOTENCY_KEY_REUSED)
         except exceptions.AccountException as e:
             return self.forbidden(
                 code=errors.CANNOT_CREATE_TRANSFER,
                 msg=e.message)
-        return self.created(
-            reverse('oscar_accounts_api:transfer', kwargs={'reference': transfer.reference}),
-            transfer.as_dict())
+        return self.transfer_created(transfer)
 
 
 class AccountRefundsView(JSONView):
@@ -245,25 +304,33 @@ class AccountRefundsView(JSONView):
 
     def valid_payload(self, payload):
         account = get_object_or_404(Account, code=self.kwargs['code'])
+        redemptions = core.redemptions_account()
+        transfer = self.replayed_transfer(
+            redemptions, account, payload['amount'])
+        if transfer is not None:
+            return self.transfer_created(transfer)
         if not account.is_active():
             raise ValidationError(errors.ACCOUNT_INACTIVE)
-        redemptions = Account.objects.get(name=names.REDEMPTIONS)
         try:
             transfer = facade.transfer(
                 redemptions, account, payload['amount'],
-                merchant_reference=payload.get('merchant_reference', None))
+                merchant_reference=payload.get('merchant_reference', None),
+                idempotency_key=self.idempotency_key)
+        except exceptions.IdempotencyKeyReused:
+            # A concurrent request with the same key made a different transfer
+            raise ValidationError(errors.IDEMPOTENCY_KEY_REUSED)
         except exceptions.AccountException as e:
             return self.forbidden(
                 code=errors.CANNOT_CREATE_TRANSFER,
                 msg=e.message)
-        return self.created(
-            reverse('oscar_accounts_api:transfer', kwargs={'reference': transfer.reference}),
-            transfer.as_dict())
+        return self.transfer_created(transfer)
 
 
 class TransferView(JSONView):
     def get(self, request, *args, **kwargs):
-        transfer = get_object_or_404(Transfer, reference=kwargs['reference'])
+        transfer = get_object_or_404(
+            Transfer.objects.select_related('source', 'destination'),
+            reference=kwargs['reference'])
         return self.ok(transfer.as_dict())
 
 
@@ -273,19 +340,25 @@ class TransferReverseView(JSONView):
     def valid_payload(self, payload):
         to_reverse = get_object_or_404(Transfer,
                                        reference=self.kwargs['reference'])
+        transfer = self.replayed_transfer(
+            to_reverse.destination, to_reverse.source, to_reverse.amount)
+        if transfer is not None:
+            return self.transfer_created(transfer)
         if not to_reverse.source.is_active():
             raise ValidationError(errors.ACCOUNT_INACTIVE)
         merchant_reference = payload.get('merchant_reference', None)
         try:
             transfer = facade.reverse(to_reverse,
-                                      merchant_reference=merchant_reference)
+                                      merchant_reference=merchant_reference,
+                                      idempotency_key=self.idempotency_key)
+        except exceptions.IdempotencyKeyReused:
+            # A concurrent request with the same key made a different transfer
+            raise ValidationError(errors.IDEMPOTENCY_KEY_REUSED)
         except exceptions.AccountException as e:
             return self.forbidden(
                 code=errors.CANNOT_CREATE_TRANSFER,
                 msg=e.message)
-        return self.created(
-            reverse('oscar_accounts_api:transfer', kwargs={'reference': transfer.reference}),
-            transfer.as_dict())
+        return self.transfer_created(transfer)
 
 
 class TransferRefundsView(JSONView):
@@ -305,6 +378,10 @@ class TransferRefundsView(JSONView):
         to_refund = get_object_or_404(Transfer,
                                       reference=self.kwargs['reference'])
         amount = payload['amount']
+        transfer = self.replayed_transfer(
+            to_refund.destination, to_refund.source, amount)
+        if transfer is not None:
+            return self.transfer_created(transfer)
         max_refund = to_refund.max_refund()
         if amount > max_refund:
             return self.forbidden(
@@ -316,11 +393,13 @@ class TransferRefundsView(JSONView):
             transfer = facade.transfer(
                 to_refund.destination, to_refund.source,
                 payload['amount'], parent=to_refund,
-                merchant_reference=payload.get('merchant_reference', None))
+                merchant_reference=payload.get('merchant_reference', None),
+                idempotency_key=self.idempotency_key)
+        except exceptions.IdempotencyKeyReused:
+            # A concurrent request with the same key made a different transfer
+            raise ValidationError(errors.IDEMPOTENCY_KEY_REUSED)
         except exceptions.AccountException as e:
             return self.forbidden(
                 code=errors.CANNOT_CREATE_TRANSFER,
                 msg=e.message)
-        return self.created(
-            reverse('oscar_accounts_api:transfer', kwargs={'reference': transfer.reference}),
-            transfer.as_dict())
+        return self.transfer_created(transfer)
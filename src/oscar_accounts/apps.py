@@ -7,3 +7,8 @@ class AccountsConfig(OscarConfig):
     name = 'oscar_accounts'
     verbose_name = _('Accounts')
     namespace = 'oscar_accounts'
+
+    def ready(self):
+        # Connects the signal handlers that keep the caches up to date
+        from oscar_accounts import (  # noqa
+            balance_cache, registry, report_cache)
@@ -0,0 +1,118 @@
+"""
+Optional read-through cache of accounts looked up by code (eg for giftcard
+balance checks), using Django's cache framework.
+
+Each account is cached as a snapshot of its fields, stored under a version
+number for its code.  The version is bumped once a transfer to or from the
+account, or a change to the account itself, is committed, so older snapshots
+are never read again.
+
+With the default local-memory cache, each process has its own cache and only
+sees the changes made by that process: use a shared cache (eg memcached or
+Redis) when running more than one process.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from oscar.core.loading import get_model
+
+from oscar_accounts import signals
+
+Account = get_model('oscar_accounts', 'Account')
+
+# Whether accounts looked up by code are cached
+ENABLED = getattr(settings, 'ACCOUNTS_BALANCE_CACHE', False)
+
+# The cache to use, from the CACHES setting
+CACHE_ALIAS = getattr(settings, 'ACCOUNTS_BALANCE_CACHE_ALIAS', 'default')
+
+# How long (in seconds) a snapshot is kept
+TIMEOUT = getattr(settings, 'ACCOUNTS_BALANCE_CACHE_TIMEOUT', 300)
+
+
+def _cache():
+    return caches[CACHE_ALIAS]
+
+
+def _key(code):
+    # Codes are stored in upper case but looked up as typed, which matches
+    # them on databases with case-insensitive collations, so are normalised
+    # for the key to be the one invalidated.  They are user input so are
+    # hashed to give a safe key.
+    digest = hashlib.md5(code.upper().encode('utf-8')).hexdigest()
+    return 'oscar_accounts:account:%s' % digest
+
+
+def _version(code):
+    cache = _cache()
+    key = '%s:version' % _key(code)
+    version = cache.get(key)
+    if version is None:
+        # Start from a value that wasn't used before, in case an earlier
+        # version number was evicted while its snapshot wasn't
+        cache.add(key, int(time.time() * 1000000), None)
+        version = cache.get(key)
+    return version
+
+
+def get_account(code):
+    """
+    Return the account with the passed code.
+
+    Raises Account.DoesNotExist if there is no such account.
+    """
+    if not ENABLED:
+        return Account.objects.get(code=code)
+    cache = _cache()
+    key = '%s:%s' % (_key(code), _version(code))
+    values = cache.get(key)
+    if values is None:
+        account = Account.objects.get(code=code)
+        values = dict((field.attname, getattr(account, field.attname))
+                      for field in Account._meta.concrete_fields)
+        cache.set(key, values, TIMEOUT)
+        return account
+    account = Account(**values)
+    account._state.adding = False
+    account._state.db = Account.objects.db
+    return account
+
+
+def invalidate(code):
+    """
+    Stop serving the cached snapshot of the account with the passed code
+    """
+    try:
+        _cache().incr('%s:version' % _key(code))
+    except ValueError:
+        # No version, so nothing has been cached
+        pass
+
+
+def _transfers_posted(sender, transfers, **kwargs):
+    if not ENABLED:
+        return
+    codes = set()
+    for transfer in transfers:
+        codes.update((transfer.source.code, transfer.destination.code))
+    for code in codes:
+        if code:
+            invalidate(code)
+
+
+def _account_changed(sender, instance, **kwargs):
+    if ENABLED and instance.code:
+        code = instance.code
+        transaction.on_commit(lambda: invalidate(code))
+
+
+signals.transfers_posted.connect(
+    _transfers_posted, dispatch_uid='oscar_accounts.balance_cache.posted')
+post_save.connect(_account_changed, sender=Account,
+                  dispatch_uid='oscar_accounts.balance_cache.save')
+post_delete.connect(_account_changed, sender=Account,
+                    dispatch_uid='oscar_accounts.balance_cache.delete')
@@ -5,6 +5,8 @@ from django.utils.translation import ugettext_lazy as _
 from oscar.core.loading import get_model
 from oscar.templatetags.currency_filters import currency
 
+from oscar_accounts import balance_cache
+
 Account = get_model('oscar_accounts', 'Account')
 
 
@@ -19,8 +21,7 @@ class ValidAccountForm(forms.Form):
         code = self.cleaned_data['code'].strip().upper()
         code = code.replace('-', '')
         try:
-            self.account = Account.objects.get(
-                code=code)
+            self.account = balance_cache.get_account(code)
         except Account.DoesNotExist:
             raise forms.ValidationError(_(
                 "No account found with this code"))
@@ -5,7 +5,6 @@ from oscar.core.loading import get_model
 from oscar_accounts import codes, core, exceptions, facade
 
 Account = get_model('oscar_accounts', 'Account')
-Transfer = get_model('oscar_accounts', 'Transfer')
 
 
 def user_accounts(user):
@@ -19,34 +18,30 @@ def redeem(order_number, user, allocations):
     """
     Settle payment for the passed set of account allocations
 
-    Will raise UnableToTakePayment if any of the transfers is invalid
+    The allocations are redeemed together, in a single database transaction,
+    so the order is either paid in full or not at all.  Will raise
+    UnableToTakePayment if any of the transfers is invalid
     """
-    # First, we need to check if the allocations are still valid.  The accounts
-    # may have changed status since the allocations were written to the
-    # session.
-    transfers = []
-    destination = core.redemptions_account()
+    # The accounts may have changed status since the allocations were written
+    # to the session, so only active accounts are used.
+    accounts = dict((account.code, account) for account in
+                    Account.active.filter(code__in=[
+                        code for code, amount in allocations.items()]))
+    sources = []
     for code, amount in allocations.items():
-        try:
-            account = Account.active.get(code=code)
-        except Account.DoesNotExist:
+        if code not in accounts:
             raise UnableToTakePayment(
                 _("No active account found with code %s") % code)
-
-        # We verify each transaction
-        try:
-            Transfer.objects.verify_transfer(
-                account, destination, amount, user)
-        except exceptions.AccountException as e:
-            raise UnableToTakePayment(str(e))
-
-        transfers.append((account, destination, amount))
-
-    # All transfers verified, now redeem
-    for account, destination, amount in transfers:
-        facade.transfer(account, destination, amount,
-                        user=user, merchant_reference=order_number,
-                        description="Redeemed to pay for order %s" % order_number)
+        sources.append((accounts[code], amount))
+
+    # Each leg is verified before anything is posted
+    try:
+        return facade.split_transfer(
+            sources, core.redemptions_account(), user=user,
+            merchant_reference=order_number,
+            description="Redeemed to pay for order %s" % order_number)
+    except exceptions.AccountException as e:
+        raise UnableToTakePayment(str(e))
 
 
 def create_giftcard(order_number, user, amount):
@@ -0,0 +1,186 @@
+import datetime
+from decimal import Decimal as D
+
+from dateutil.relativedelta import relativedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import DecimalField, Max, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from oscar.core.loading import get_model
+
+BalanceCheckpoint = get_model('oscar_accounts', 'BalanceCheckpoint')
+Transaction = get_model('oscar_accounts', 'Transaction')
+
+DAILY, MONTHLY = 'daily', 'monthly'
+INTERVALS = (DAILY, MONTHLY)
+
+# How often checkpoints are taken by the create_balance_checkpoints command
+INTERVAL = getattr(settings, 'ACCOUNTS_CHECKPOINT_INTERVAL', DAILY)
+
+# How long after the end of a period its checkpoint is taken, so that
+# postings still being committed at the boundary are included
+SETTLE_TIME = datetime.timedelta(minutes=5)
+
+
+def latest_checkpoint_date(before=None):
+    """
+    Return the date of the latest checkpoint (at or before the passed date) or
+    None if there isn't one.
+    """
+    qs = BalanceCheckpoint.objects.all()
+    if before is not None:
+        qs = qs.filter(date__lte=before)
+    return qs.aggregate(date=Max('date'))['date']
+
+
+def balances_at(accounts, date):
+    """
+    Return a dict mapping the ID of each passed account to its balance at the
+    passed date, ie the sum of its transactions created before that date.
+
+    This costs three queries however many accounts and transactions there are,
+    plus the transactions since the latest checkpoint.
+    """
+    ids = [account.id for account in accounts]
+    balances = dict((account_id, D('0.00')) for account_id in ids)
+    transactions = Transaction.objects.filter(
+        account_id__in=ids, date_created__lt=date)
+
+    checkpoint_date = latest_checkpoint_date(date)
+    if checkpoint_date is not None:
+        checkpoints = BalanceCheckpoint.objects.filter(
+            account_id__in=ids, date=checkpoint_date)
+        for account_id, balance in checkpoints.values_list(
+                'account_id', 'balance'):
+            balances[account_id] = balance
+        transactions = transactions.filter(date_created__gte=checkpoint_date)
+
+    deltas = transactions.values('account_id').annotate(
+        total=Sum('amount')).order_by()
+    for row in deltas:
+        balances[row['account_id']] += row['total']
+    return balances
+
+
+def balance_expression(date):
+    """
+    Return an expression for the balance of each account at the passed date,
+    to annotate an ``Account`` queryset with.
+
+    Like ``balances_at``, it starts from the latest checkpoint, but the
+    balances are computed by the database as part of the annotated query.
+    """
+    output_field = DecimalField(max_digits=12, decimal_places=2)
+    zero = Value(D('0.00'), output_field=output_field)
+    transactions = Transaction.objects.filter(
+        account=OuterRef('pk'), date_created__lt=date)
+    balance = zero
+
+    checkpoint_date = latest_checkpoint_date(date)
+    if checkpoint_date is not None:
+        checkpoints = BalanceCheckpoint.objects.filter(
+            account=OuterRef('pk'), date=checkpoint_date).values('balance')
+        balance = Coalesce(
+            Subquery(checkpoints, output_field=output_field), zero)
+        transactions = transactions.filter(date_created__gte=checkpoint_date)
+
+    deltas = transactions.order_by().values('account').annotate(
+        total=Sum('amount')).values('total')
+    return balance + Coalesce(Subquery(deltas, output_field=output_field), zero)
+
+
+def balance_at(account, date):
+    """
+    Return the balance of the passed account at the passed date
+    """
+    return balances_at([account], date)[account.id]
+
+
+def create_checkpoint(date):
+    """
+    Record the balance of every account at the passed date.
+
+    Checkpoints can only be added after the latest existing one, and only for
+    dates in the past.  Returns the number of balances recorded.
+    """
+    if date > timezone.now():
+        raise ValueError("Checkpoints can't be taken in the future")
+    with transaction.atomic():
+        previous_date = latest_checkpoint_date()
+        if previous_date is not None and date <= previous_date:
+            raise ValueError(
+                "A checkpoint already exists at or after %s" % date)
+
+        balances = {}
+        transactions = Transaction.objects.filter(date_created__lt=date)
+        if previous_date is not None:
+            balances = dict(BalanceCheckpoint.objects.filter(
+                date=previous_date).values_list('account_id', 'balance'))
+            transactions = transactions.filter(
+                date_created__gte=previous_date)
+        deltas = transactions.values('account_id').annotate(
+            total=Sum('amount')).order_by()
+        for row in deltas:
+            balances[row['account_id']] = balances.get(
+                row['account_id'], D('0.00')) + row['total']
+
+        checkpoints = BalanceCheckpoint.objects.bulk_create([
+            BalanceCheckpoint(account_id=account_id, date=date,
+                              balance=balance)
+            for account_id, balance in balances.items() if balance])
+    return len(checkpoints)
+
+
+def period_start(date, interval=INTERVAL):
+    """
+    Return the start (midnight UTC) of the day or month containing the passed
+    date
+    """
+    date = date.astimezone(timezone.utc)
+    start = datetime.datetime.combine(
+        date.date(), datetime.time(tzinfo=timezone.utc))
+    if interval == MONTHLY:
+        start = start.replace(day=1)
+    return start
+
+
+def due_checkpoint_dates(now=None, interval=INTERVAL):
+    """
+    Return the period boundaries that don't have a checkpoint yet, up to the
+    start of the current period (once it is ``SETTLE_TIME`` old)
+    """
+    if interval not in INTERVALS:
+        raise ValueError("Unknown checkpoint interval '%s'" % interval)
+    if now is None:
+        now = timezone.now()
+    step = relativedelta(months=1) if interval == MONTHLY else relativedelta(
+        days=1)
+    end = period_start(now - SETTLE_TIME, interval)
+
+    latest = latest_checkpoint_date()
+    if latest is not None:
+        date = period_start(latest, interval) + step
+    else:
+        first = Transaction.objects.order_by('date_created').values_list(
+            'date_created', flat=True).first()
+        if first is None:
+            return []
+        date = period_start(first, interval) + step
+
+    dates = []
+    while date <= end:
+        dates.append(date)
+        date += step
+    return dates
+
+
+def create_due_checkpoints(now=None, interval=INTERVAL):
+    """
+    Create all missing checkpoints up to the start of the current period and
+    return their dates
+    """
+    dates = due_checkpoint_dates(now, interval)
+    for date in dates:
+        create_checkpoint(date)
+    return dates
@@ -22,3 +22,29 @@ def generate(size=12, chars=None):
     except Account.DoesNotExist:
         return code
     return generate(size=size, chars=chars)
+
+
+def generate_many(count, size=12, chars=None):
+    """
+    Generate ``count`` new, distinct account codes
+
+    Candidates are checked against the existing accounts with one query per
+    batch rather than one per code.
+
+    :count: Number of codes
+    :size: Length of each code
+    :chars: Character set to choose from
+    """
+    if chars is None:
+        chars = string.ascii_uppercase + string.digits
+    codes = set()
+    while len(codes) < count:
+        candidates = set()
+        while len(candidates) < count - len(codes):
+            code = ''.join(random.choice(chars) for x in range(size))
+            if code not in codes:
+                candidates.add(code)
+        taken = Account.objects.filter(code__in=candidates).values_list(
+            'code', flat=True)
+        codes.update(candidates.difference(taken))
+    return list(codes)
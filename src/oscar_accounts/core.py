@@ -1,13 +1,13 @@
-from oscar.core.loading import get_model
-
-from oscar_accounts import names
-
-Account = get_model('oscar_accounts', 'Account')
+from oscar_accounts import names, registry
 
 
 def redemptions_account():
-    return Account.objects.get(name=names.REDEMPTIONS)
+    return registry.account(names.REDEMPTIONS)
 
 
 def lapsed_account():
-    return Account.objects.get(name=names.LAPSED)
+    return registry.account(names.LAPSED)
+
+
+def bank_account():
+    return registry.account(names.BANK)
@@ -15,18 +15,26 @@ class AccountsDashboardConfig(OscarDashboardConfig):
         from . import views
         self.account_list_view = views.AccountListView
         self.account_create_view = views.AccountCreateView
+        self.account_issue_view = views.AccountIssueView
         self.account_update_view = views.AccountUpdateView
         self.account_transactions_view = views.AccountTransactionsView
+        self.account_transactions_export_view = (
+            views.AccountTransactionsExportView)
         self.account_freeze_view = views.AccountFreezeView
         self.account_thaw_view = views.AccountThawView
         self.account_top_up_view = views.AccountTopUpView
         self.account_withdraw_view = views.AccountWithdrawView
 
         self.transfer_list_view = views.TransferListView
+        self.transfer_export_view = views.TransferExportView
         self.transfer_detail_view = views.TransferDetailView
 
         self.report_deferred_income = views.DeferredIncomeReportView
         self.report_profit_loss = views.ProfitLossReportView
+        self.report_job_list_view = views.ReportJobListView
+        self.report_job_create_view = views.ReportJobCreateView
+        self.report_job_detail_view = views.ReportJobDetailView
+        self.report_job_download_view = views.ReportJobDownloadView
 
     def get_urls(self):
         urls = [
@@ -35,10 +43,15 @@ class AccountsDashboardConfig(OscarDashboardConfig):
                 name='accounts-list'),
             url(r'^create/$', self.account_create_view.as_view(),
                 name='accounts-create'),
+            url(r'^issue/$', self.account_issue_view.as_view(),
+                name='accounts-issue'),
             url(r'^(?P<pk>\d+)/update/$', self.account_update_view.as_view(),
                 name='accounts-update'),
             url(r'^(?P<pk>\d+)/$', self.account_transactions_view.as_view(),
                 name='accounts-detail'),
+            url(r'^(?P<pk>\d+)/export/$',
+                self.account_transactions_export_view.as_view(),
+                name='accounts-export'),
             url(r'^(?P<pk>\d+)/freeze/$', self.account_freeze_view.as_view(),
                 name='accounts-freeze'),
             url(r'^(?P<pk>\d+)/thaw/$', self.account_thaw_view.as_view(),
@@ -49,6 +62,8 @@ class AccountsDashboardConfig(OscarDashboardConfig):
                 name='accounts-withdraw'),
             url(r'^transfers/$', self.transfer_list_view.as_view(),
                 name='transfers-list'),
+            url(r'^transfers/export/$', self.transfer_export_view.as_view(),
+                name='transfers-export'),
             url(r'^transfers/(?P<reference>[A-Z0-9]{32})/$',
                 self.transfer_detail_view.as_view(),
                 name='transfers-detail'),
@@ -58,5 +73,16 @@ class AccountsDashboardConfig(OscarDashboardConfig):
             url(r'^reports/profit-loss/$',
                 self.report_profit_loss.as_view(),
                 name='report-profit-loss'),
+            url(r'^reports/jobs/$', self.report_job_list_view.as_view(),
+                name='report-jobs-list'),
+            url(r'^reports/jobs/create/$',
+                self.report_job_create_view.as_view(),
+                name='report-jobs-create'),
+            url(r'^reports/jobs/(?P<pk>\d+)/$',
+                self.report_job_detail_view.as_view(),
+                name='report-jobs-detail'),
+            url(r'^reports/jobs/(?P<pk>\d+)/download/$',
+                self.report_job_download_view.as_view(),
+                name='report-jobs-download'),
         ]
         return self.post_process_urls(urls)
@@ -8,7 +8,7 @@ from oscar.core.loading import get_model
 from oscar.forms.widgets import DatePickerInput
 from oscar.templatetags.currency_filters import currency
 
-from oscar_accounts import codes, names
+from oscar_accounts import codes, names, registry, report_cache
 
 Account = get_model('oscar_accounts', 'Account')
 AccountType = get_model('oscar_accounts', 'AccountType')
@@ -27,39 +27,51 @@ class SearchForm(forms.Form):
 
 class TransferSearchForm(forms.Form):
     reference = forms.CharField(required=False)
+    merchant_reference = forms.CharField(
+        label=_("Order number"), required=False)
     start_date = forms.DateField(required=False, widget=DatePickerInput)
     end_date = forms.DateField(required=False, widget=DatePickerInput)
 
 
-class EditAccountForm(forms.ModelForm):
-    name = forms.CharField(label=_("Name"), required=True)
-
-    class Meta:
-        model = Account
-        exclude = ['status', 'code', 'credit_limit', 'balance']
-        widgets = {
-            'start_date': DatePickerInput,
-            'end_date': DatePickerInput,
-        }
+class AccountTypeMixin(object):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.fields['product_range'].help_text = (
-            "You may need to create a product range first")
 
         # Add field for account type (if there is a choice)
-        deferred_income = AccountType.objects.get(name=names.DEFERRED_INCOME)
-        types = deferred_income.get_children()
-        if types.count() > 1:
+        deferred_income = registry.account_type(name=names.DEFERRED_INCOME)
+        types = registry.account_type_children(deferred_income)
+        if len(types) > 1:
             self.fields['account_type'] = forms.ModelChoiceField(
-                queryset=types)
-        elif types.count() == 1:
+                queryset=AccountType.objects.filter(
+                    pk__in=[t.pk for t in types]))
+        elif len(types) == 1:
             del self.fields['account_type']
             self._account_type = types[0]
         else:
             raise exceptions.ImproperlyConfigured(
                 "You need to define some 'deferred income' account types")
 
+    def get_account_type(self):
+        if 'account_type' in self.cleaned_data:
+            return self.cleaned_data['account_type']
+        return self._account_type
+
+
+class EditAccountForm(AccountTypeMixin, forms.ModelForm):
+    name = forms.CharField(label=_("Name"), required=True)
+
+    class Meta:
+        model = Account
+        exclude = ['status', 'code', 'credit_limit', 'balance']
+        widgets = {
+            'start_date': DatePickerInput,
+            'end_date': DatePickerInput,
+        }
+        help_texts = {
+            'product_range': "You may need to create a product range first",
+        }
+
 
 class SourceAccountMixin(object):
 
@@ -67,7 +79,7 @@ class SourceAccountMixin(object):
         super().__init__(*args, **kwargs)
 
         # Add field for source account (if there is a choice)
-        unpaid_sources = AccountType.objects.get(
+        unpaid_sources = registry.account_type(
             name=names.UNPAID_ACCOUNT_TYPE)
         sources = unpaid_sources.accounts.all()
         if sources.count() > 1:
@@ -95,7 +107,7 @@ class NewAccountForm(SourceAccountMixin, EditAccountForm):
         super().__init__(*args, **kwargs)
 
         # Add field for source account (if there is a choice)
-        unpaid_sources = AccountType.objects.get(
+        unpaid_sources = registry.account_type(
             name=names.UNPAID_ACCOUNT_TYPE)
         sources = unpaid_sources.accounts.all()
         if sources.count() > 1:
@@ -123,8 +135,46 @@ class NewAccountForm(SourceAccountMixin, EditAccountForm):
         return self._source_account
 
 
+class IssueAccountsForm(SourceAccountMixin, AccountTypeMixin,
+                        forms.ModelForm):
+    # The accounts are issued within the request, so larger batches are left
+    # to the issue_accounts command
+    count = forms.IntegerField(
+        label=_("Number of accounts"), min_value=1,
+        max_value=getattr(settings, 'ACCOUNTS_ISSUANCE_MAX_COUNT', 5000),
+        help_text=_("Larger batches can be issued with the issue_accounts "
+                    "management command"))
+    initial_amount = forms.DecimalField(
+        min_value=getattr(settings, 'ACCOUNTS_MIN_LOAD_VALUE', D('0.00')),
+        max_value=getattr(settings, 'ACCOUNTS_MAX_ACCOUNT_VALUE', None),
+        decimal_places=2)
+
+    # The fields shared by the issued accounts, as edited for a single one
+    class Meta(EditAccountForm.Meta):
+        exclude = None
+        fields = ['description', 'start_date', 'end_date', 'product_range',
+                  'can_be_used_for_non_products', 'account_type']
+
+
 class UpdateAccountForm(EditAccountForm):
-    pass
+
+    def save(self, commit=True):
+        account = super().save(commit=False)
+        if commit:
+            # Only the columns edited by the form are written, so the balance
+            # and any change of status or credit limit made since the form
+            # was loaded are left alone
+            account.save(update_fields=self._update_fields())
+            self.save_m2m()
+        return account
+
+    def _update_fields(self):
+        fields = []
+        for name in self.fields:
+            field = Account._meta.get_field(name)
+            if field.concrete and not field.many_to_many:
+                fields.append(name)
+        return fields
 
 
 class ChangeStatusForm(forms.ModelForm):
@@ -135,6 +185,12 @@ class ChangeStatusForm(forms.ModelForm):
         kwargs['initial']['status'] = self.new_status
         super().__init__(*args, **kwargs)
 
+    def save(self, commit=True):
+        account = super().save(commit=False)
+        if commit:
+            account.save(update_fields=['status'])
+        return account
+
     class Meta:
         model = Account
         exclude = ['name', 'account_type', 'description', 'category', 'code', 'start_date',
@@ -214,3 +270,22 @@ class DateForm(forms.Form):
 class DateRangeForm(forms.Form):
     start_date = forms.DateField(label=_("From"), widget=DatePickerInput)
     end_date = forms.DateField(label=_("To"), widget=DatePickerInput)
+
+
+class ReportJobForm(forms.Form):
+    REPORT_CHOICES = (
+        (report_cache.PROFIT_LOSS, _("Profit/loss report")),
+        (report_cache.DEFERRED_INCOME, _("Deferred income report")))
+    report = forms.ChoiceField(choices=REPORT_CHOICES)
+    start_date = forms.DateField(
+        label=_("From"), required=False, widget=DatePickerInput,
+        help_text=_("Not needed for the deferred income report"))
+    end_date = forms.DateField(label=_("To"), widget=DatePickerInput)
+
+    def clean(self):
+        data = super().clean()
+        needs_start = data.get('report') == report_cache.PROFIT_LOSS
+        if needs_start and not data.get('start_date'):
+            raise forms.ValidationError(
+                _("The profit/loss report needs a start date"))
+        return data
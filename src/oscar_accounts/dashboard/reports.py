@@ -1,26 +1,122 @@
+import datetime
 from decimal import Decimal as D
 
-from django.db.models import Sum
+from django.db.models import (
+    Case, Count, DecimalField, IntegerField, Q, Sum, Value, When)
+from django.utils import timezone
 from oscar.core.loading import get_model
 
-from oscar_accounts import names
+from oscar_accounts import core, names, registry, report_cache, rollups
 
-AccountType = get_model('oscar_accounts', 'AccountType')
 Account = get_model('oscar_accounts', 'Account')
+DailyFlow = get_model('oscar_accounts', 'DailyFlow')
 Transfer = get_model('oscar_accounts', 'Transfer')
 
 
+class DeferredIncomeReport(object):
+    """
+    The balances of the deferred income accounts at a date, by account type
+    and by how soon the accounts expire.
+
+    The balances are totalled and bucketed by the database, in one grouped
+    query over all the accounts.  With rollups enabled, each balance is worked
+    out from the account's daily movements.
+    """
+    buckets = ('expiring_within_30', 'expiring_within_60',
+               'expiring_within_90', 'expiring_outside_90', 'open_ended')
+
+    def __init__(self, threshold_datetime):
+        self.threshold = threshold_datetime
+
+    def run(self, progress=None):
+        types = [registry.account_type(name=name)
+                 for name in names.DEFERRED_INCOME_ACCOUNT_TYPES]
+        totals_by_type = dict(
+            (row.pop('account_type'), row) for row in self.get_totals(types))
+        if progress is not None:
+            progress(90)
+        rows = []
+        totals = {'total': D('0.00'),
+                  'num_accounts': 0}
+        for acc_type in types:
+            data = {'name': acc_type.name,
+                    'total': D('0.00'),
+                    'num_accounts': 0}
+            for bucket in self.buckets:
+                data['num_%s' % bucket] = 0
+                data['total_%s' % bucket] = D('0.00')
+            row = totals_by_type.get(acc_type.id, {})
+            data.update((key, value) for key, value in row.items()
+                        if value is not None)
+            totals['total'] += data['total']
+            totals['num_accounts'] += data['num_accounts']
+            rows.append(data)
+        return {'rows': rows, 'totals': totals}
+
+    def get_buckets(self):
+        """
+        Return a dict mapping the name of each expiry bucket to the condition
+        an account in it matches
+        """
+        # Account.days_remaining is (end_date - threshold).days (or 0 once
+        # the account has expired), so an account has at most n days left
+        # if it ends less than n + 1 days after the threshold
+        def cutoff(days):
+            return self.threshold + datetime.timedelta(days=days + 1)
+
+        return {
+            'expiring_within_30': Q(end_date__lt=cutoff(30)),
+            'expiring_within_60': Q(end_date__gte=cutoff(30),
+                                    end_date__lt=cutoff(60)),
+            'expiring_within_90': Q(end_date__gte=cutoff(60),
+                                    end_date__lt=cutoff(90)),
+            'expiring_outside_90': Q(end_date__gte=cutoff(90)),
+            'open_ended': Q(end_date__isnull=True),
+        }
+
+    def get_totals(self, types):
+        output_field = DecimalField(max_digits=12, decimal_places=2)
+        aggregates = {
+            'num_accounts': Count('id'),
+            'total': Sum('balance_at', output_field=output_field),
+        }
+        for bucket, condition in self.get_buckets().items():
+            aggregates['num_%s' % bucket] = Count(
+                Case(When(condition, then=Value(1)),
+                     output_field=IntegerField()))
+            aggregates['total_%s' % bucket] = Sum(
+                Case(When(condition, then='balance_at'),
+                     output_field=output_field))
+        accounts = Account.objects.filter(account_type__in=types).annotate(
+            balance_at=rollups.balance_expression(self.threshold))
+        return accounts.values('account_type').annotate(
+            **aggregates).order_by()
+
+
 class ProfitLossReport(object):
+    """
+    The movements in and out of the deferred income accounts over a date
+    range.
+
+    Each section is totalled by a query grouping the transfers in the range,
+    so the cost depends on the number of transfers rather than the number of
+    accounts.  With rollups enabled, the days that have been rolled up are
+    totalled from their daily flows instead.
+    """
 
     def __init__(self, start_datetime, end_datetime):
         self.start = start_datetime
         self.end = end_datetime
 
-    def run(self):
+    def run(self, progress=None):
         ctx = {}
-        self.get_paid_loading_data(ctx)
-        self.get_unpaid_loading_data(ctx)
-        self.get_deferred_income_data(ctx)
+        sections = (self.get_paid_loading_data,
+                    self.get_unpaid_loading_data,
+                    self.get_deferred_income_data)
+        for i, section in enumerate(sections, 1):
+            section(ctx)
+            if progress is not None:
+                progress(100 * i // len(sections))
 
         # Totals
         ctx['increase_total'] = (
@@ -31,68 +127,99 @@ class ProfitLossReport(object):
 
         return ctx
 
-    def transfer_total(self, qs):
-        filters = {
-            'date_created__gte': self.start,
-            'date_created__lt': self.end}
-        transfers = qs.filter(**filters)
-        total = transfers.aggregate(sum=Sum('amount'))['sum']
-        return total if total is not None else D('0.00')
+    def flows(self):
+        """
+        Return a list of querysets that together cover the transfers in the
+        range, each paired with the name of its amount field
+        """
+        days, ranges = rollups.split_range(self.start, self.end)
+        querysets = [
+            (Transfer.objects.filter(
+                date_created__gte=start, date_created__lt=end), 'amount')
+            for start, end in ranges]
+        if days is not None:
+            querysets.append((DailyFlow.objects.filter(
+                date__gte=days[0], date__lt=days[1]), 'total'))
+        return querysets
+
+    def transfer_totals(self, filters, group_by, **conditions):
+        """
+        Return a dict mapping each value of the ``group_by`` field of the
+        transfers matching the passed filters to their total, or (given
+        keyword arguments mapping names to ``Q`` objects) to a dict of the
+        total of the transfers matching each condition.
+        """
+        output_field = DecimalField(max_digits=12, decimal_places=2)
+        totals = {}
+        for qs, amount in self.flows():
+            if conditions:
+                aggregates = dict(
+                    (name, Sum(Case(When(condition, then=amount)),
+                               output_field=output_field))
+                    for name, condition in conditions.items())
+            else:
+                aggregates = {'total': Sum(amount, output_field=output_field)}
+            rows = qs.filter(**filters).values(group_by).annotate(
+                **aggregates).order_by()
+            for row in rows:
+                key = row.pop(group_by)
+                subtotals = totals.setdefault(key, {})
+                for name, total in row.items():
+                    subtotals[name] = subtotals.get(name, D('0.00')) + (
+                        total if total is not None else D('0.00'))
+        if conditions:
+            return totals
+        return dict((key, row['total']) for key, row in totals.items())
+
+    def get_loading_rows(self, acc_type):
+        # The cash and unpaid source accounts are few, so they are listed
+        # with their totals looked up from one grouped query
+        accounts = list(acc_type.accounts.all())
+        totals = self.transfer_totals(
+            {'source__account_type': acc_type}, 'source')
+        rows = [{'name': account.name,
+                 'total': totals.get(account.id, D('0.00'))}
+                for account in accounts]
+        return rows, sum((row['total'] for row in rows), D('0.00'))
 
     def get_paid_loading_data(self, ctx):
-        cash = AccountType.objects.get(name=names.CASH)
-        cash_rows = []
-        cash_total = D('0.00')
-        for account in cash.accounts.all():
-            total = self.transfer_total(account.source_transfers)
-            cash_rows.append({
-                'name': account.name,
-                'total': total})
-            cash_total += total
-        ctx['cash_rows'] = cash_rows
-        ctx['cash_total'] = cash_total
+        cash = registry.account_type(name=names.CASH)
+        ctx['cash_rows'], ctx['cash_total'] = self.get_loading_rows(cash)
 
     def get_unpaid_loading_data(self, ctx):
-        unpaid = AccountType.objects.get(name=names.UNPAID_ACCOUNT_TYPE)
-        unpaid_rows = []
-        unpaid_total = D('0.00')
-        for account in unpaid.accounts.all():
-            total = self.transfer_total(account.source_transfers)
-            unpaid_rows.append({
-                'name': account.name,
-                'total': total})
-            unpaid_total += total
-        ctx['unpaid_rows'] = unpaid_rows
-        ctx['unpaid_total'] = unpaid_total
+        unpaid = registry.account_type(name=names.UNPAID_ACCOUNT_TYPE)
+        ctx['unpaid_rows'], ctx['unpaid_total'] = self.get_loading_rows(
+            unpaid)
 
     def get_deferred_income_data(self, ctx):
-        deferred_income = AccountType.objects.get(
-            name=names.DEFERRED_INCOME)
+        deferred_income = registry.account_type(name=names.DEFERRED_INCOME)
+        children = registry.account_type_children(deferred_income)
+        redemptions_id = core.redemptions_account().id
+        lapsed_id = core.lapsed_account().id
+
+        # Transfers to the redemptions and expired accounts, by the type of
+        # their source, and transfers from the redemptions account (ie
+        # refunds), by the type of their destination
+        reductions = self.transfer_totals(
+            {'source__account_type__in': children,
+             'destination_id__in': [redemptions_id, lapsed_id]},
+            'source__account_type',
+            redeem=Q(destination_id=redemptions_id),
+            closure=Q(destination_id=lapsed_id))
+        refunds = self.transfer_totals(
+            {'source_id': redemptions_id,
+             'destination__account_type__in': children},
+            'destination__account_type')
+
         redeem_rows = []
         closure_rows = []
         refund_rows = []
         redeem_total = closure_total = refund_total = D('0.00')
-        redemptions_act = Account.objects.get(name=names.REDEMPTIONS)
-        lapsed_act = Account.objects.get(name=names.LAPSED)
-        for child in deferred_income.get_children():
-            child_redeem_total = D('0.00')
-            child_closure_total = D('0.00')
-            child_refund_total = D('0.00')
-            for account in child.accounts.all():
-                # Look for transfers to the redemptions account
-                qs = account.source_transfers.filter(
-                    destination=redemptions_act)
-                total = self.transfer_total(qs)
-                child_redeem_total += total
-                # Look for transfers to expired account
-                qs = account.source_transfers.filter(
-                    destination=lapsed_act)
-                total = self.transfer_total(qs)
-                child_closure_total += total
-                # Look for transfers from redemptions account
-                qs = redemptions_act.source_transfers.filter(
-                    destination=account)
-                child_refund_total += self.transfer_total(qs)
+        for child in children:
+            child_reductions = reductions.get(child.id, {})
+            child_redeem_total = child_reductions.get('redeem', D('0.00'))
+            child_closure_total = child_reductions.get('closure', D('0.00'))
+            child_refund_total = refunds.get(child.id, D('0.00'))
             redeem_rows.append({
                 'name': child.name,
                 'total': child_redeem_total})
@@ -112,3 +239,64 @@ class ProfitLossReport(object):
         ctx['closure_total'] = closure_total
         ctx['refund_rows'] = refund_rows
         ctx['refund_total'] = refund_total
+
+
+def run_report(report, start_date=None, end_date=None, progress=None):
+    """
+    Return the results of the named report (see ``report_cache``) for the
+    passed dates, which are inclusive, using the report cache.
+
+    The deferred income report shows the position at the end of
+    ``end_date``.
+    """
+    end = end_date + datetime.timedelta(days=1)
+    if report == report_cache.DEFERRED_INCOME:
+        # Take cutoff as the first second of the following day, which we
+        # convert to a datetime instance in UTC
+        start = None
+        end = datetime.datetime.combine(
+            end, datetime.time(tzinfo=timezone.utc))
+        instance = DeferredIncomeReport(end)
+    elif report == report_cache.PROFIT_LOSS:
+        start = start_date
+        instance = ProfitLossReport(start, end)
+    else:
+        raise ValueError("Unknown report '%s'" % report)
+    return report_cache.get_or_run(
+        report, start, end, lambda: instance.run(progress))
+
+
+def _format(value):
+    # Amounts are written as they are in the other exports
+    return "%.2f" % value if isinstance(value, D) else value
+
+
+def csv_rows(report, data):
+    """
+    Return the header and rows of a CSV export of the passed results of the
+    named report
+    """
+    header, rows = _csv_rows(report, data)
+    return header, [[_format(value) for value in row] for row in rows]
+
+
+def _csv_rows(report, data):
+    if report == report_cache.DEFERRED_INCOME:
+        header = ['account_type', 'total', 'num_accounts']
+        for bucket in DeferredIncomeReport.buckets:
+            header += ['total_%s' % bucket, 'num_%s' % bucket]
+        rows = [[row[field] if field != 'account_type' else row['name']
+                 for field in header] for row in data['rows']]
+        rows.append(['', data['totals']['total'],
+                     data['totals']['num_accounts']])
+        return header, rows
+    header = ['section', 'name', 'total']
+    rows = []
+    for section in ('cash', 'unpaid', 'refund', 'redeem', 'closure'):
+        for row in data['%s_rows' % section]:
+            rows.append([section, row['name'], row['total']])
+        rows.append([section, '', data['%s_total' % section]])
+    for total in ('increase_total', 'reduction_total',
+                  'position_difference'):
+        rows.append([total, '', data[total]])
+    return header, rows
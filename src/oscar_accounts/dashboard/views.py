@@ -4,20 +4,22 @@ from decimal import Decimal as D
 from django import http
 from django.conf import settings
 from django.contrib import messages
-from django.db.models import Sum
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
 from django.shortcuts import get_object_or_404
 from django.urls import reverse
-from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 from django.views import generic
 from oscar.core.loading import get_model
 from oscar.templatetags.currency_filters import currency
 
-from oscar_accounts import exceptions, facade, names
+from oscar_accounts import (
+    exceptions, exports, facade, issuance, names, report_cache, report_jobs)
 from oscar_accounts.dashboard import forms, reports
+from oscar_accounts.pagination import KeysetPaginationMixin
 
-AccountType = get_model('oscar_accounts', 'AccountType')
 Account = get_model('oscar_accounts', 'Account')
+ReportJob = get_model('oscar_accounts', 'ReportJob')
 Transfer = get_model('oscar_accounts', 'Transfer')
 Transaction = get_model('oscar_accounts', 'Transaction')
 
@@ -39,7 +41,13 @@ class AccountListView(generic.ListView):
         return ctx
 
     def get_queryset(self):
-        queryset = Account.objects.all()
+        # Each account's transactions are counted by a subquery, which the
+        # database only runs for the rows on the page
+        transaction_counts = Transaction.objects.filter(
+            account=OuterRef('pk')).order_by().values('account').annotate(
+                count=Count('id')).values('count')
+        queryset = Account.objects.annotate(transaction_count=Coalesce(
+            Subquery(transaction_counts, output_field=IntegerField()), 0))
 
         if 'code' not in self.request.GET:
             # Form not submitted
@@ -195,7 +203,7 @@ class AccountWithdrawView(generic.UpdateView):
                                                  kwargs={'pk': account.id}))
 
 
-class AccountTransactionsView(generic.ListView):
+class AccountTransactionsView(KeysetPaginationMixin, generic.ListView):
     model = Transaction
     context_object_name = 'transactions'
     template_name = 'accounts/dashboard/account_detail.html'
@@ -206,7 +214,7 @@ class AccountTransactionsView(generic.ListView):
         return super().get(request, *args, **kwargs)
 
     def get_queryset(self):
-        return self.account.transactions.all().order_by('-date_created')
+        return self.account.transactions.all()
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
@@ -214,7 +222,70 @@ class AccountTransactionsView(generic.ListView):
         return ctx
 
 
-class TransferListView(generic.ListView):
+class ExportMixin(object):
+    """
+    Streams an export, so that it is never held in memory as a whole
+    """
+
+    def get_format(self):
+        format = self.request.GET.get('format', exports.CSV)
+        if format not in exports.FORMATS:
+            raise http.Http404(_("Unknown export format"))
+        return format
+
+    def render_export(self, lines, filename, format):
+        response = http.StreamingHttpResponse(
+            lines, content_type=exports.CONTENT_TYPES[format])
+        response['Content-Disposition'] = 'attachment; filename="%s.%s"' % (
+            filename, format)
+        return response
+
+
+class AccountIssueView(ExportMixin, generic.FormView):
+    """
+    Issue a batch of accounts and download their codes
+    """
+    form_class = forms.IssueAccountsForm
+    template_name = 'accounts/dashboard/account_issue.html'
+
+    def get_context_data(self, **kwargs):
+        ctx = super().get_context_data(**kwargs)
+        ctx['title'] = _("Issue %s") % names.UNIT_NAME_PLURAL.lower()
+        return ctx
+
+    def form_valid(self, form):
+        data = form.cleaned_data
+        amount = data['initial_amount']
+        try:
+            accounts = issuance.issue_accounts(
+                form.get_account_type(), data['count'], amount,
+                form.get_source_account(), start_date=data['start_date'],
+                end_date=data['end_date'], description=data['description'],
+                product_range=data['product_range'],
+                can_be_used_for_non_products=data[
+                    'can_be_used_for_non_products'],
+                user=self.request.user,
+                transfer_description=_("Creation of account"))
+        except exceptions.AccountException as e:
+            messages.error(
+                self.request, _("Unable to issue accounts: %s") % e)
+            return self.form_invalid(form)
+        lines = exports.csv_lines(
+            issuance.csv_rows(accounts, amount), issuance.CSV_FIELDS)
+        return self.render_export(lines, 'issued-accounts', exports.CSV)
+
+
+class AccountTransactionsExportView(ExportMixin, generic.View):
+
+    def get(self, request, *args, **kwargs):
+        account = get_object_or_404(Account, id=kwargs['pk'])
+        format = self.get_format()
+        lines = exports.export_transactions(account.transactions.all(), format)
+        return self.render_export(
+            lines, 'account-%d-transactions' % account.id, format)
+
+
+class TransferListView(KeysetPaginationMixin, generic.ListView):
     model = Transfer
     context_object_name = 'transfers'
     template_name = 'accounts/dashboard/transfer_list.html'
@@ -244,36 +315,48 @@ class TransferListView(generic.ListView):
         # Form valid - build queryset and description
         data = self.form.cleaned_data
         desc_template = _(
-            "Transfers %(reference)s %(date)s")
+            "Transfers %(reference)s %(merchant_reference)s %(date)s")
         desc_ctx = {
             'reference': "",
+            'merchant_reference': "",
             'date': "",
         }
+        queryset = exports.filter_transfers(queryset, **data)
         if data['reference']:
-            queryset = queryset.filter(reference=data['reference'])
             desc_ctx['reference'] = _(
                 " with reference '%s'") % data['reference']
 
+        if data['merchant_reference']:
+            desc_ctx['merchant_reference'] = _(
+                " for order '%s'") % data['merchant_reference']
+
         if data['start_date'] and data['end_date']:
-            # Add 24 hours to make search inclusive
-            date_from = data['start_date']
-            date_to = data['end_date'] + datetime.timedelta(days=1)
-            queryset = queryset.filter(date_created__gte=date_from).filter(date_created__lt=date_to)
             desc_ctx['date'] = _(" created between %(start_date)s and %(end_date)s") % {
                 'start_date': data['start_date'],
                 'end_date': data['end_date']}
         elif data['start_date']:
-            queryset = queryset.filter(date_created__gte=data['start_date'])
             desc_ctx['date'] = _(" created since %s") % data['start_date']
         elif data['end_date']:
-            date_to = data['end_date'] + datetime.timedelta(days=1)
-            queryset = queryset.filter(date_created__lt=date_to)
             desc_ctx['date'] = _(" created before %s") % data['end_date']
 
         self.description = desc_template % desc_ctx
         return queryset
 
 
+class TransferExportView(ExportMixin, generic.View):
+    form_class = forms.TransferSearchForm
+
+    def get(self, request, *args, **kwargs):
+        format = self.get_format()
+        form = self.form_class(request.GET)
+        if not form.is_valid():
+            return http.HttpResponseBadRequest()
+        queryset = exports.filter_transfers(
+            Transfer.objects.all(), **form.cleaned_data)
+        return self.render_export(
+            exports.export_transfers(queryset, format), 'transfers', format)
+
+
 class TransferDetailView(generic.DetailView):
     model = Transfer
     context_object_name = 'transfer'
@@ -319,65 +402,10 @@ class DeferredIncomeReportView(generic.FormView):
             return self.form_invalid(form)
 
     def form_valid(self, form):
-        # Take cutoff as the first second of the following day, which we
-        # convert to a datetime instane in UTC
-        threshold_date = form.cleaned_data['date'] + datetime.timedelta(days=1)
-        threshold_datetime = datetime.datetime.combine(
-            threshold_date, datetime.time(tzinfo=timezone.utc))
-
-        # Get data
-        rows = []
-        totals = {'total': D('0.00'),
-                  'num_accounts': 0}
-        for acc_type_name in names.DEFERRED_INCOME_ACCOUNT_TYPES:
-            acc_type = AccountType.objects.get(name=acc_type_name)
-            data = {
-                'name': acc_type_name,
-                'total': D('0.00'),
-                'num_accounts': 0,
-                'num_expiring_within_30': 0,
-                'num_expiring_within_60': 0,
-                'num_expiring_within_90': 0,
-                'num_expiring_outside_90': 0,
-                'num_open_ended': 0,
-                'total_expiring_within_30': D('0.00'),
-                'total_expiring_within_60': D('0.00'),
-                'total_expiring_within_90': D('0.00'),
-                'total_expiring_outside_90': D('0.00'),
-                'total_open_ended': D('0.00'),
-            }
-            for account in acc_type.accounts.all():
-                data['num_accounts'] += 1
-                total = account.transactions.filter(
-                    date_created__lt=threshold_datetime).aggregate(
-                        total=Sum('amount'))['total']
-                if total is None:
-                    total = D('0.00')
-                data['total'] += total
-                days_remaining = account.days_remaining(threshold_datetime)
-                if days_remaining is None:
-                    data['num_open_ended'] += 1
-                    data['total_open_ended'] += total
-                else:
-                    if days_remaining <= 30:
-                        data['num_expiring_within_30'] += 1
-                        data['total_expiring_within_30'] += total
-                    elif days_remaining <= 60:
-                        data['num_expiring_within_60'] += 1
-                        data['total_expiring_within_60'] += total
-                    elif days_remaining <= 90:
-                        data['num_expiring_within_90'] += 1
-                        data['total_expiring_within_90'] += total
-                    else:
-                        data['num_expiring_outside_90'] += 1
-                        data['total_expiring_outside_90'] += total
-
-            totals['total'] += data['total']
-            totals['num_accounts'] += data['num_accounts']
-            rows.append(data)
+        data = reports.run_report(
+            report_cache.DEFERRED_INCOME, end_date=form.cleaned_data['date'])
         ctx = self.get_context_data(form=form)
-        ctx['rows'] = rows
-        ctx['totals'] = totals
+        ctx.update(data)
         ctx['report_date'] = form.cleaned_data['date']
         return self.render_to_response(ctx)
 
@@ -418,8 +446,8 @@ class ProfitLossReportView(generic.FormView):
     def form_valid(self, form):
         start = form.cleaned_data['start_date']
         end = form.cleaned_data['end_date'] + datetime.timedelta(days=1)
-        report = reports.ProfitLossReport(start, end)
-        data = report.run()
+        data = reports.run_report(
+            report_cache.PROFIT_LOSS, start, form.cleaned_data['end_date'])
 
         ctx = self.get_context_data(form=form)
         ctx.update(data)
@@ -432,3 +460,90 @@ class ProfitLossReportView(generic.FormView):
     def total(self, qs):
         sales_amt = qs.aggregate(sum=Sum('amount'))['sum']
         return sales_amt if sales_amt is not None else D('0.00')
+
+
+class ReportJobListView(generic.ListView):
+    model = ReportJob
+    context_object_name = 'jobs'
+    template_name = 'accounts/dashboard/reports/job_list.html'
+    paginate_by = getattr(settings, 'OSCAR_ACCOUNTS_DASHBOARD_ITEMS_PER_PAGE', 20)
+
+    def get_queryset(self):
+        return ReportJob.objects.select_related('user').order_by(
+            '-date_created', '-id')
+
+    def get_context_data(self, **kwargs):
+        ctx = super().get_context_data(**kwargs)
+        ctx['stale_before'] = report_jobs.stale_before()
+        return ctx
+
+
+class ReportJobCreateView(generic.FormView):
+    form_class = forms.ReportJobForm
+    template_name = 'accounts/dashboard/reports/job_form.html'
+
+    def get_initial(self):
+        # Prefilled from the report pages
+        initial = self.request.GET.dict()
+        if 'date' in initial:
+            initial['end_date'] = initial.pop('date')
+        return initial
+
+    def form_valid(self, form):
+        data = form.cleaned_data
+        start_date = data['start_date']
+        if data['report'] == report_cache.DEFERRED_INCOME:
+            start_date = None
+        job = report_jobs.submit(
+            data['report'], start_date, data['end_date'], self.request.user)
+        messages.success(self.request, _("The report is being run"))
+        return http.HttpResponseRedirect(reverse(
+            'accounts_dashboard:report-jobs-detail', kwargs={'pk': job.id}))
+
+
+class ReportJobDetailView(generic.DetailView):
+    model = ReportJob
+    context_object_name = 'job'
+    template_name = 'accounts/dashboard/reports/job_detail.html'
+
+    def get_template_names(self):
+        if self.object.status != ReportJob.COMPLETE:
+            return [self.template_name]
+        if self.object.report == report_cache.DEFERRED_INCOME:
+            return ['accounts/dashboard/reports/deferred_income.html']
+        return ['accounts/dashboard/reports/profit_loss.html']
+
+    def get_context_data(self, **kwargs):
+        ctx = super().get_context_data(**kwargs)
+        job = self.object
+        if job.status != ReportJob.COMPLETE:
+            ctx['is_stale'] = job.status == ReportJob.RUNNING and (
+                job.date_started < report_jobs.stale_before())
+            return ctx
+        # Rendered with the template of the report itself
+        ctx.update(report_jobs.decode_result(job.result))
+        if job.report == report_cache.DEFERRED_INCOME:
+            ctx['title'] = 'Deferred income report'
+            ctx['form'] = forms.DateForm(initial={'date': job.end_date})
+            ctx['report_date'] = job.end_date
+        else:
+            ctx['title'] = 'Profit and loss report'
+            ctx['form'] = forms.DateRangeForm(initial={
+                'start_date': job.start_date, 'end_date': job.end_date})
+            ctx['show_report'] = True
+            ctx['start_date'] = job.start_date
+            ctx['end_date'] = job.end_date + datetime.timedelta(days=1)
+        return ctx
+
+
+class ReportJobDownloadView(ExportMixin, generic.View):
+
+    def get(self, request, *args, **kwargs):
+        job = get_object_or_404(
+            ReportJob, id=kwargs['pk'], status=ReportJob.COMPLETE)
+        header, rows = reports.csv_rows(
+            job.report, report_jobs.decode_result(job.result))
+        lines = exports.csv_lines(
+            (dict(zip(header, row)) for row in rows), header)
+        return self.render_export(
+            lines, '%s-%d' % (job.report, job.id), exports.CSV)
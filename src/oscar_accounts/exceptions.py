@@ -20,3 +20,11 @@ class InactiveAccount(AccountException):
 
 class ClosedAccount(AccountException):
     pass
+
+
+class PostingTimeout(AccountException):
+    pass
+
+
+class IdempotencyKeyReused(AccountException):
+    pass
@@ -0,0 +1,141 @@
+import csv
+import datetime
+import json
+
+CSV, JSONL = 'csv', 'jsonl'
+FORMATS = (CSV, JSONL)
+CONTENT_TYPES = {
+    CSV: 'text/csv',
+    JSONL: 'application/x-ndjson',
+}
+
+CHUNK_SIZE = 2000
+
+TRANSFER_FIELDS = (
+    'reference', 'date_created', 'source_id', 'source', 'destination_id',
+    'destination', 'amount', 'refunded_amount', 'merchant_reference',
+    'description', 'user')
+TRANSACTION_FIELDS = (
+    'transfer', 'date_created', 'account_id', 'amount', 'merchant_reference',
+    'description', 'user')
+
+
+def filter_transfers(queryset, reference=None, merchant_reference=None,
+                     start_date=None, end_date=None):
+    """
+    Filter transfers as the dashboard's transfer search does.  Both dates are
+    inclusive.
+    """
+    if reference:
+        queryset = queryset.filter(reference=reference)
+    if merchant_reference:
+        queryset = queryset.filter(merchant_reference=merchant_reference)
+    return filter_dates(queryset, start_date, end_date)
+
+
+def filter_dates(queryset, start_date=None, end_date=None):
+    """
+    Filter the passed transfers or transactions by the (inclusive) dates they
+    were created between
+    """
+    if start_date:
+        queryset = queryset.filter(date_created__gte=start_date)
+    if end_date:
+        queryset = queryset.filter(
+            date_created__lt=end_date + datetime.timedelta(days=1))
+    return queryset
+
+
+def _username(user):
+    return user.get_username() if user is not None else ''
+
+
+def transfer_rows(queryset, chunk_size=CHUNK_SIZE):
+    """
+    Yield a dict for each of the passed transfers, reading them from the
+    database a chunk at a time
+    """
+    queryset = queryset.select_related(
+        'source', 'destination', 'user').order_by('date_created', 'id')
+    for transfer in queryset.iterator(chunk_size=chunk_size):
+        yield {
+            'reference': transfer.reference,
+            'date_created': transfer.date_created.isoformat(),
+            'source_id': transfer.source_id,
+            'source': str(transfer.source),
+            'destination_id': transfer.destination_id,
+            'destination': str(transfer.destination),
+            'amount': "%.2f" % transfer.amount,
+            'refunded_amount': "%.2f" % transfer.refunded_amount,
+            'merchant_reference': transfer.merchant_reference or '',
+            'description': transfer.description or '',
+            'user': _username(transfer.user),
+        }
+
+
+def transaction_rows(queryset, chunk_size=CHUNK_SIZE):
+    """
+    Yield a dict for each of the passed transactions (eg an account's
+    statement), reading them from the database a chunk at a time
+    """
+    queryset = queryset.select_related(
+        'transfer', 'transfer__user').order_by('date_created', 'id')
+    for txn in queryset.iterator(chunk_size=chunk_size):
+        yield {
+            'transfer': txn.transfer.reference,
+            'date_created': txn.date_created.isoformat(),
+            'account_id': txn.account_id,
+            'amount': "%.2f" % txn.amount,
+            'merchant_reference': txn.transfer.merchant_reference or '',
+            'description': txn.transfer.description or '',
+            'user': _username(txn.transfer.user),
+        }
+
+
+class _Echo(object):
+    # A file-like object that hands back what is written to it, so that
+    # csv.writer can format one row at a time
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows, fields):
+    """
+    Yield the passed rows as CSV lines, starting with a header
+    """
+    writer = csv.DictWriter(_Echo(), fields)
+    yield writer.writerow(dict(zip(fields, fields)))
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def jsonl_lines(rows):
+    """
+    Yield the passed rows as JSON objects, one per line
+    """
+    for row in rows:
+        yield json.dumps(row, sort_keys=True) + "\n"
+
+
+def lines(rows, fields, format=CSV):
+    if format not in FORMATS:
+        raise ValueError("Unknown export format '%s'" % format)
+    if format == JSONL:
+        return jsonl_lines(rows)
+    return csv_lines(rows, fields)
+
+
+def export_transfers(queryset, format=CSV, chunk_size=CHUNK_SIZE):
+    """
+    Return an iterator over the lines of an export of the passed transfers
+    """
+    return lines(transfer_rows(queryset, chunk_size), TRANSFER_FIELDS, format)
+
+
+def export_transactions(queryset, format=CSV, chunk_size=CHUNK_SIZE):
+    """
+    Return an iterator over the lines of an export of the passed transactions
+    """
+    return lines(transaction_rows(queryset, chunk_size), TRANSACTION_FIELDS,
+                 format)
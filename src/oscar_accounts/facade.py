@@ -2,7 +2,7 @@ import logging
 
 from oscar.core.loading import get_model
 
-from oscar_accounts import core, exceptions
+from oscar_accounts import core, exceptions, posting_queue
 
 Account = get_model('oscar_accounts', 'Account')
 Transfer = get_model('oscar_accounts', 'Transfer')
@@ -34,12 +34,15 @@ def close_expired_accounts():
 
 def transfer(source, destination, amount,
              parent=None, user=None, merchant_reference=None,
-             description=None):
+             description=None, idempotency_key=None):
     """
     Transfer funds between source and destination accounts.
 
     Will raise a accounts.exceptions.AccountException if anything goes wrong.
 
+    If a transfer has already been made with the passed idempotency key, it is
+    returned instead of making the transfer again.
+
     :source: Account to debit
     :destination: Account to credit
     :amount: Amount to transfer
@@ -47,6 +50,8 @@ def transfer(source, destination, amount,
     :user: Authorising user
     :merchant_reference: An optional merchant ref associated with this transfer
     :description: Description of transaction
+    :idempotency_key: An optional key identifying this transfer, unique
+                      across all transfers
     """
     if source.id == destination.id:
         raise exceptions.AccountException(
@@ -60,9 +65,14 @@ def transfer(source, destination, amount,
     if description:
         msg += " '%s'" % description
     try:
-        transfer = Transfer.objects.create(
-            source, destination, amount, parent, user,
-            merchant_reference, description)
+        if posting_queue.is_enabled():
+            transfer = posting_queue.post(
+                source, destination, amount, parent, user,
+                merchant_reference, description, idempotency_key)
+        else:
+            transfer = Transfer.objects.create(
+                source, destination, amount, parent, user,
+                merchant_reference, description, idempotency_key)
     except exceptions.AccountException as e:
         logger.warning("%s - failed: '%s'", msg, e)
         raise
@@ -76,7 +86,74 @@ def transfer(source, destination, amount,
         return transfer
 
 
-def reverse(transfer, user=None, merchant_reference=None, description=None):
+def transfer_many(legs, grouped=False):
+    """
+    Post several transfers at once, in a single database transaction.
+
+    Either all of the transfers are made or, if any of them is not permitted,
+    none is.  Will raise a accounts.exceptions.AccountException if anything
+    goes wrong.
+
+    :legs: A list of dicts, each holding the keyword arguments of `transfer`
+           (source, destination, amount and optionally parent, user,
+           merchant_reference and description)
+    :grouped: Whether the transfers are recorded as one payment, sharing a
+              `group_reference`
+
+    Returns the list of created transfers.
+    """
+    for leg in legs:
+        if leg['source'].id == leg['destination'].id:
+            raise exceptions.AccountException(
+                "The source and destination accounts for a transfer "
+                "must be different."
+            )
+    msg = "Bulk transfer of %d legs totalling %.2f" % (
+        len(legs), sum(leg['amount'] for leg in legs))
+    try:
+        transfers = Transfer.objects.create_many(legs, grouped)
+    except exceptions.AccountException as e:
+        logger.warning("%s - failed: '%s'", msg, e)
+        raise
+    except Exception as e:
+        logger.error("%s - failed: '%s'", msg, e)
+        raise exceptions.AccountException(
+            "Unable to complete transfers: %s" % e)
+    else:
+        logger.info("%s - successful", msg)
+        return transfers
+
+
+def split_transfer(sources, destination, parent=None, user=None,
+                   merchant_reference=None, description=None):
+    """
+    Transfer funds from several source accounts to one destination account
+    (eg to pay for an order with more than one giftcard).
+
+    The legs are posted together, in a single database transaction, so either
+    the whole amount is transferred or nothing is, and share a
+    `group_reference` (see `Transfer.group`).  Will raise a
+    accounts.exceptions.AccountException if anything goes wrong.
+
+    :sources: A sequence of (account, amount) pairs to debit
+    :destination: Account to credit
+    :parent: Parent transfer for each leg to reference
+    :user: Authorising user
+    :merchant_reference: An optional merchant ref associated with each leg
+    :description: Description of transaction
+
+    Returns the list of created transfers, one per source.
+    """
+    return transfer_many([
+        {'source': source, 'destination': destination, 'amount': amount,
+         'parent': parent, 'user': user,
+         'merchant_reference': merchant_reference,
+         'description': description}
+        for source, amount in sources], grouped=True)
+
+
+def reverse(transfer, user=None, merchant_reference=None, description=None,
+            idempotency_key=None):
     """
     Reverse a previous transfer, returning the money to the original source.
     """
@@ -91,7 +168,8 @@ def reverse(transfer, user=None, merchant_reference=None, description=None):
             destination=transfer.source,
             amount=transfer.amount, user=user,
             merchant_reference=merchant_reference,
-            description=description)
+            description=description,
+            idempotency_key=idempotency_key)
     except exceptions.AccountException as e:
         logger.warning("%s - failed: '%s'", msg, e)
         raise
@@ -2,6 +2,8 @@ from django import forms
 from django.utils.translation import ugettext_lazy as _
 from oscar.core.loading import get_model
 
+from oscar_accounts import balance_cache
+
 Account = get_model('oscar_accounts', 'Account')
 
 
@@ -11,8 +13,7 @@ class AccountForm(forms.Form):
     def clean_code(self):
         code = self.cleaned_data['code'].strip()
         try:
-            self.account = Account.objects.get(
-                code=code)
+            self.account = balance_cache.get_account(code)
         except Account.DoesNotExist:
             raise forms.ValidationError(_(
                 "No account found with this code"))
@@ -0,0 +1,108 @@
+"""
+Issue accounts that are activated by a code (eg promotional giftcards) in
+bulk.
+
+The codes of a batch are generated together, the accounts are written with
+bulk inserts and the loading transfers are posted with
+``Transfer.objects.create_many``, so the cost of issuing accounts is a few
+queries per ``BATCH_SIZE`` accounts rather than several per account.
+"""
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from oscar.core.loading import get_model
+
+from oscar_accounts import codes, exceptions, report_cache
+
+Account = get_model('oscar_accounts', 'Account')
+Transfer = get_model('oscar_accounts', 'Transfer')
+
+# Number of accounts written (and loaded) at a time
+BATCH_SIZE = getattr(settings, 'ACCOUNTS_ISSUANCE_BATCH_SIZE', 500)
+
+# Number of times the codes of a batch are generated before giving up, if
+# one of them is taken by a concurrent issuer before the batch is written
+MAX_ATTEMPTS = 3
+
+CSV_FIELDS = ('code', 'amount', 'start_date', 'end_date')
+
+
+def issue_accounts(account_type, count, amount, source, start_date=None,
+                   end_date=None, description=None, product_range=None,
+                   can_be_used_for_non_products=True, user=None,
+                   transfer_description="Creation of account",
+                   batch_size=BATCH_SIZE):
+    """
+    Create ``count`` accounts of the passed type, each with a new code, and
+    load ``amount`` onto each of them from ``source``.
+
+    The accounts are issued in a single database transaction, so either all
+    of them are or, if a loading transfer is not permitted, none is.  Will
+    raise an accounts.exceptions.AccountException if anything goes wrong.
+
+    Returns the list of issued accounts.
+    """
+    if count < 1:
+        raise exceptions.AccountException(
+            "At least one account must be issued")
+    issued = []
+    with transaction.atomic():
+        for offset in range(0, count, batch_size):
+            accounts = _create_accounts(
+                min(batch_size, count - offset), account_type=account_type,
+                start_date=start_date, end_date=end_date,
+                description=description, product_range=product_range,
+                can_be_used_for_non_products=can_be_used_for_non_products)
+            if accounts[0].pk is None:
+                # The database can't return the primary keys of bulk inserted
+                # rows so we look them up by code
+                pks = dict(Account.objects.filter(
+                    code__in=[account.code for account in accounts]
+                ).values_list('code', 'pk'))
+                for account in accounts:
+                    account.pk = pks[account.code]
+            Transfer.objects.create_many([
+                {'source': source, 'destination': account, 'amount': amount,
+                 'user': user, 'description': transfer_description}
+                for account in accounts])
+            issued.extend(accounts)
+        if report_cache.ENABLED:
+            # Bulk inserts don't send the signals that invalidate the cached
+            # reports
+            transaction.on_commit(
+                lambda: report_cache.invalidate(report_cache.DEFERRED_INCOME))
+    return issued
+
+
+def _create_accounts(count, **fields):
+    # The codes are checked when they are generated, but may be taken by a
+    # concurrent issuer before they are written, in which case the batch is
+    # generated again
+    for attempt in range(MAX_ATTEMPTS):
+        accounts = [Account(code=code, **fields)
+                    for code in codes.generate_many(count)]
+        try:
+            with transaction.atomic():
+                Account.objects.bulk_create(accounts)
+        except IntegrityError:
+            continue
+        return accounts
+    raise exceptions.AccountException(
+        "Unable to generate unique codes for the accounts")
+
+
+def _date(value):
+    return value.isoformat() if value is not None else ''
+
+
+def csv_rows(accounts, amount):
+    """
+    Yield a dict for each of the passed (just issued) accounts, for
+    ``exports.csv_lines``
+    """
+    for account in accounts:
+        yield {
+            'code': account.code,
+            'amount': "%.2f" % amount,
+            'start_date': _date(account.start_date),
+            'end_date': _date(account.end_date),
+        }
@@ -0,0 +1,36 @@
+from decimal import Decimal as D
+
+from django.core.management.base import BaseCommand
+from django.db.models import Max, Min, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from oscar.core.loading import get_model
+
+Transfer = get_model('oscar_accounts', 'Transfer')
+
+
+class Command(BaseCommand):
+    help = ("Recalculate the refunded amount of each transfer from the refunds "
+            "made against it")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=10000,
+            help="Number of transfers updated per query (default: 10000)")
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        refunds = Transfer.objects.filter(
+            parent=OuterRef('pk'), source=OuterRef('destination'))
+        refunds = refunds.order_by().values('parent').annotate(
+            total=Sum('amount')).values('total')
+        bounds = Transfer.objects.aggregate(first=Min('id'), last=Max('id'))
+        if bounds['first'] is None:
+            return
+        num_updated = 0
+        for start in range(bounds['first'], bounds['last'] + 1, chunk_size):
+            # Each row is recalculated in a single statement, so refunds
+            # posted while this runs are not lost
+            num_updated += Transfer.objects.filter(
+                id__gte=start, id__lt=start + chunk_size).update(
+                    refunded_amount=Coalesce(Subquery(refunds), D('0.00')))
+        self.stdout.write("Updated %d transfers" % num_updated)
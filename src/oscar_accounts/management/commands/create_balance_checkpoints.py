@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from oscar_accounts import checkpoints
+
+
+class Command(BaseCommand):
+    help = ("Record the balance of every account at the end of each day (or "
+            "month) that doesn't have a checkpoint yet")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', choices=checkpoints.INTERVALS,
+            default=checkpoints.INTERVAL,
+            help="How often to take checkpoints (default: %s)" % (
+                checkpoints.INTERVAL))
+
+    def handle(self, *args, **options):
+        dates = checkpoints.create_due_checkpoints(
+            interval=options['interval'])
+        for date in dates:
+            self.stdout.write("Created checkpoint at %s" % date.isoformat())
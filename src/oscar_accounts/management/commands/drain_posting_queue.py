@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from oscar_accounts import posting_queue
+
+
+class Command(BaseCommand):
+    help = ("Post the transfers waiting in the posting queue, in batches of "
+            "many transfers per database transaction")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=posting_queue.BATCH_SIZE,
+            help="Maximum number of transfers posted per database transaction")
+        parser.add_argument(
+            '--interval', type=float, default=0.01,
+            help="Seconds to wait when the queue is empty")
+        parser.add_argument(
+            '--once', action='store_true',
+            help="Exit once the queue is empty")
+
+    def handle(self, *args, **options):
+        while True:
+            if posting_queue.drain(options['batch_size']):
+                continue
+            if options['once']:
+                break
+            time.sleep(options['interval'])
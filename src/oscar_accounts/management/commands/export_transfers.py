@@ -0,0 +1,68 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from oscar.core.loading import get_model
+
+from oscar_accounts import exports
+
+Account = get_model('oscar_accounts', 'Account')
+Transfer = get_model('oscar_accounts', 'Transfer')
+
+
+def date(value):
+    parsed = parse_date(value)
+    if parsed is None:
+        raise ValueError(value)
+    return parsed
+
+
+class Command(BaseCommand):
+    help = ("Export transfers, or the transactions of one account, as CSV or "
+            "JSON lines.  Rows are streamed from the database, so exports of "
+            "any size can be made.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--account', metavar='CODE',
+            help="Export the transactions of the account with this code "
+                 "instead of transfers")
+        parser.add_argument('--reference', help="Transfer reference")
+        parser.add_argument('--merchant-reference', help="Order number")
+        parser.add_argument(
+            '--start-date', type=date, help="First date (YYYY-MM-DD)")
+        parser.add_argument(
+            '--end-date', type=date, help="Last date (YYYY-MM-DD)")
+        parser.add_argument(
+            '--format', choices=exports.FORMATS, default=exports.CSV)
+        parser.add_argument(
+            '--chunk-size', type=int, default=exports.CHUNK_SIZE,
+            help="Number of rows fetched from the database at a time")
+        parser.add_argument(
+            '--output', help="File to write the export to (default: stdout)")
+
+    def handle(self, *args, **options):
+        if options['account']:
+            try:
+                account = Account.objects.get(code=options['account'])
+            except Account.DoesNotExist:
+                raise CommandError(
+                    "No account with code '%s'" % options['account'])
+            queryset = exports.filter_dates(
+                account.transactions.all(), options['start_date'],
+                options['end_date'])
+            lines = exports.export_transactions(
+                queryset, options['format'], options['chunk_size'])
+        else:
+            queryset = exports.filter_transfers(
+                Transfer.objects.all(), options['reference'],
+                options['merchant_reference'], options['start_date'],
+                options['end_date'])
+            lines = exports.export_transfers(
+                queryset, options['format'], options['chunk_size'])
+
+        if not options['output']:
+            for line in lines:
+                self.stdout.write(line, ending='')
+            return
+        with open(options['output'], 'w', newline='') as output:
+            for line in lines:
+                output.write(line)
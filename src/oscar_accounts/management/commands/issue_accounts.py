@@ -0,0 +1,91 @@
+import datetime
+from decimal import Decimal as D
+from decimal import InvalidOperation
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from oscar.core.loading import get_model
+
+from oscar_accounts import core, exceptions, exports, issuance
+
+Account = get_model('oscar_accounts', 'Account')
+AccountType = get_model('oscar_accounts', 'AccountType')
+
+
+def date(value):
+    parsed = parse_date(value)
+    if parsed is None:
+        raise ValueError(value)
+    return timezone.make_aware(
+        datetime.datetime.combine(parsed, datetime.time()))
+
+
+def amount(value):
+    try:
+        return D(value)
+    except InvalidOperation:
+        raise ValueError(value)
+
+
+class Command(BaseCommand):
+    help = ("Issue a batch of accounts activated by a code (eg giftcards), "
+            "load an amount onto each and write their codes as CSV")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--type', required=True, help="Name of the account type")
+        parser.add_argument(
+            '--count', type=int, required=True,
+            help="Number of accounts to issue")
+        parser.add_argument(
+            '--amount', type=amount, required=True,
+            help="Amount loaded onto each account")
+        parser.add_argument(
+            '--source', help="Name of the account the amounts are loaded "
+                             "from (default: the bank account)")
+        parser.add_argument(
+            '--start-date', type=date, help="First date (YYYY-MM-DD)")
+        parser.add_argument(
+            '--end-date', type=date, help="Expiry date (YYYY-MM-DD)")
+        parser.add_argument('--description')
+        parser.add_argument(
+            '--batch-size', type=int, default=issuance.BATCH_SIZE,
+            help="Number of accounts written at a time")
+        parser.add_argument(
+            '--output', help="File to write the codes to (default: stdout)")
+
+    def handle(self, *args, **options):
+        try:
+            account_type = AccountType.objects.get(name=options['type'])
+        except AccountType.DoesNotExist:
+            raise CommandError(
+                "No account type named '%s'" % options['type'])
+        try:
+            if options['source']:
+                source = Account.objects.get(name=options['source'])
+            else:
+                source = core.bank_account()
+        except Account.DoesNotExist:
+            raise CommandError(
+                "No account named '%s'" % (options['source'] or 'bank'))
+        try:
+            accounts = issuance.issue_accounts(
+                account_type, options['count'], options['amount'], source,
+                start_date=options['start_date'],
+                end_date=options['end_date'],
+                description=options['description'],
+                batch_size=options['batch_size'])
+        except exceptions.AccountException as e:
+            raise CommandError("Unable to issue accounts: %s" % e)
+
+        lines = exports.csv_lines(
+            issuance.csv_rows(accounts, options['amount']),
+            issuance.CSV_FIELDS)
+        if not options['output']:
+            for line in lines:
+                self.stdout.write(line, ending='')
+            return
+        with open(options['output'], 'w', newline='') as output:
+            for line in lines:
+                output.write(line)
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from oscar_accounts import report_jobs
+
+
+class Command(BaseCommand):
+    help = "Run the dashboard reports that are waiting in the background"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float, default=1.0,
+            help="Seconds to wait when there are no jobs")
+        parser.add_argument(
+            '--once', action='store_true',
+            help="Exit once there are no jobs left")
+
+    def handle(self, *args, **options):
+        while True:
+            if report_jobs.run_pending_jobs():
+                continue
+            if options['once']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from oscar_accounts import rollups
+
+
+class Command(BaseCommand):
+    help = ("Roll up the transfers and transactions of each day that is over "
+            "and hasn't been rolled up yet")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild-from', metavar='YYYY-MM-DD',
+            help="Also roll up again the days from this one on")
+
+    def handle(self, *args, **options):
+        days = []
+        if options['rebuild_from']:
+            since = parse_date(options['rebuild_from'])
+            if since is None:
+                raise CommandError(
+                    "Invalid date '%s'" % options['rebuild_from'])
+            days += rollups.rebuild(since)
+        days += rollups.create_due_rollups()
+        for day in days:
+            self.stdout.write("Rolled up %s" % day.isoformat())
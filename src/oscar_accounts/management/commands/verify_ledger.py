@@ -0,0 +1,39 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from oscar_accounts import verification
+
+
+class Command(BaseCommand):
+    help = ("Check that the transactions of each transfer (and of the whole "
+            "ledger) sum to zero and that every cached account balance "
+            "matches its transactions.  Discrepancies are written as JSON, "
+            "one per line.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help="Number of processes checking account balances")
+        parser.add_argument(
+            '--chunk-size', type=int, default=verification.CHUNK_SIZE,
+            help="Number of rows fetched from the database at a time")
+        parser.add_argument(
+            '--output', help="File to write discrepancies to (default: stdout)")
+
+    def handle(self, *args, **options):
+        output = self.stdout
+        if options['output']:
+            output = open(options['output'], 'w')
+        num_discrepancies = 0
+        try:
+            for discrepancy in verification.verify_ledger(
+                    options['workers'], options['chunk_size']):
+                output.write(json.dumps(discrepancy, sort_keys=True) + "\n")
+                num_discrepancies += 1
+        finally:
+            if options['output']:
+                output.close()
+        if num_discrepancies:
+            raise CommandError(
+                "Found %d discrepancies in the ledger" % num_discrepancies)
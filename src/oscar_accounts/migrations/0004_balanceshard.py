@@ -0,0 +1,29 @@
+# Generated by Django 2.2.28 on 2026-10-16 20:16
+
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oscar_accounts', '0003_alter_ip_address'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceShard',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveSmallIntegerField()),
+                ('balance', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_shards', to='oscar_accounts.Account')),
+            ],
+            options={
+                'abstract': False,
+                'unique_together': {('account', 'number')},
+            },
+        ),
+    ]
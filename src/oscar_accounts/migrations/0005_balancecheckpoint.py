@@ -0,0 +1,28 @@
+# Generated by Django 2.2.28 on 2026-10-16 20:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oscar_accounts', '0004_balanceshard'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceCheckpoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateTimeField(db_index=True)),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_checkpoints', to='oscar_accounts.Account')),
+            ],
+            options={
+                'ordering': ('-date',),
+                'abstract': False,
+                'unique_together': {('account', 'date')},
+            },
+        ),
+    ]
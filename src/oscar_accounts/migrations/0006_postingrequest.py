@@ -0,0 +1,37 @@
+# Generated by Django 2.2.28 on 2026-10-16 20:22
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('oscar_accounts', '0005_balancecheckpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostingRequest',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('merchant_reference', models.CharField(max_length=128, null=True)),
+                ('description', models.CharField(max_length=256, null=True)),
+                ('status', models.CharField(db_index=True, default='Pending', max_length=32)),
+                ('error', models.TextField(blank=True)),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('date_processed', models.DateTimeField(null=True)),
+                ('destination', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='oscar_accounts.Account')),
+                ('parent', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='oscar_accounts.Transfer')),
+                ('source', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='oscar_accounts.Account')),
+                ('transfer', models.OneToOneField(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='posting_request', to='oscar_accounts.Transfer')),
+                ('user', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 2.2.28 on 2026-10-16 20:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oscar_accounts', '0006_postingrequest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='postingrequest',
+            name='idempotency_key',
+            field=models.CharField(max_length=128, null=True),
+        ),
+        migrations.AddField(
+            model_name='transfer',
+            name='idempotency_key',
+            field=models.CharField(max_length=128, null=True, unique=True),
+        ),
+    ]
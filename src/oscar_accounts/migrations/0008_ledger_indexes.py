@@ -0,0 +1,48 @@
+# Generated by Django 2.2.28 on 2026-10-16 20:28
+
+# Indexes for the ledger's main access patterns.  The initial migration only
+# indexed the foreign keys and unique fields, so these queries had to scan or
+# sort:
+#
+# - account, date_created on Transaction: an account's statement in the
+#   dashboard, ordered by -date_created.  The index returns the rows already
+#   in order, so a page doesn't sort all of the account's transactions.
+# - source, destination, date_created on Transfer: the profit and loss report
+#   totals the transfers from one account to another over a date range.
+# - date_created on Transfer: the default ordering of transfers and the date
+#   filters of the transfer list.
+# - merchant_reference on Transfer: finding the transfers for an order.
+# - status, end_date on Account: Account.expired and close_expired_accounts
+#   look for open accounts whose end date has passed.
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oscar_accounts', '0007_idempotency_keys'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='account',
+            index=models.Index(fields=['status', 'end_date'], name='accounts_account_status_end'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['account', 'date_created'], name='accounts_txn_account_date'),
+        ),
+        migrations.AddIndex(
+            model_name='transfer',
+            index=models.Index(fields=['source', 'destination', 'date_created'], name='accounts_transfer_src_dst_date'),
+        ),
+        migrations.AddIndex(
+            model_name='transfer',
+            index=models.Index(fields=['date_created'], name='accounts_transfer_date'),
+        ),
+        migrations.AddIndex(
+            model_name='transfer',
+            index=models.Index(fields=['merchant_reference'], name='accounts_transfer_merchant_ref'),
+        ),
+    ]
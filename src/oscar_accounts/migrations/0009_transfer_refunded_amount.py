@@ -0,0 +1,49 @@
+# Generated by Django 2.2.28 on 2026-10-16 20:37
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Max, Min, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+CHUNK_SIZE = 10000
+
+
+def backfill_refunded_amounts(apps, schema_editor):
+    # The total of the refunds (children moving money back from the
+    # destination) made against each existing transfer, as recalculated by
+    # the backfill_refunded_amounts command
+    Transfer = apps.get_model('oscar_accounts', 'Transfer')
+    refunds = Transfer.objects.filter(
+        parent=OuterRef('pk'), source=OuterRef('destination'))
+    refunds = refunds.order_by().values('parent').annotate(
+        total=Sum('amount')).values('total')
+    # The new column defaults to zero so only the transfers with children
+    # need updating
+    bounds = Transfer.objects.aggregate(
+        first=Min('parent_id'), last=Max('parent_id'))
+    if bounds['first'] is None:
+        return
+    for start in range(bounds['first'], bounds['last'] + 1, CHUNK_SIZE):
+        parent_ids = Transfer.objects.filter(
+            parent_id__gte=start, parent_id__lt=start + CHUNK_SIZE
+        ).values('parent_id')
+        Transfer.objects.filter(id__in=parent_ids).update(
+            refunded_amount=Coalesce(Subquery(refunds), Decimal('0.00')))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oscar_accounts', '0008_ledger_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transfer',
+            name='refunded_amount',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12),
+        ),
+        migrations.RunPython(
+            backfill_refunded_amounts, migrations.RunPython.noop),
+    ]
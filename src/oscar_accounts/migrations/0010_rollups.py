@@ -0,0 +1,55 @@
+# Generated by Django 2.2.28 on 2026-10-16 20:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oscar_accounts', '0009_transfer_refunded_amount'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupDay',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ('-date',),
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyMovement',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('total', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('num_transactions', models.PositiveIntegerField()),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='oscar_accounts.Account')),
+            ],
+            options={
+                'abstract': False,
+                'unique_together': {('date', 'account')},
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyFlow',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('total', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('num_transfers', models.PositiveIntegerField()),
+                ('destination', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='oscar_accounts.Account')),
+                ('source', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='oscar_accounts.Account')),
+            ],
+            options={
+                'abstract': False,
+                'unique_together': {('date', 'source', 'destination')},
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 2.2.28 on 2026-10-16 21:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oscar_accounts', '0011_reportjob'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='postingrequest',
+            name='transfer',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='posting_requests', to='oscar_accounts.Transfer'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 2.2.28 on 2026-10-16 21:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oscar_accounts', '0012_postingrequest_transfer'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transfer',
+            name='group_reference',
+            field=models.CharField(max_length=64, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='transfer',
+            index=models.Index(fields=['group_reference'], name='accounts_transfer_group_ref'),
+        ),
+    ]
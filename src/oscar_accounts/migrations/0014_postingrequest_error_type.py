@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-16 22:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oscar_accounts', '0013_transfer_group_reference'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='postingrequest',
+            name='error_type',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
@@ -22,6 +22,41 @@ if not is_model_registered('oscar_accounts', 'Transaction'):
         pass
 
 
+if not is_model_registered('oscar_accounts', 'BalanceShard'):
+    class BalanceShard(abstract_models.BalanceShard):
+        pass
+
+
+if not is_model_registered('oscar_accounts', 'BalanceCheckpoint'):
+    class BalanceCheckpoint(abstract_models.BalanceCheckpoint):
+        pass
+
+
+if not is_model_registered('oscar_accounts', 'DailyFlow'):
+    class DailyFlow(abstract_models.DailyFlow):
+        pass
+
+
+if not is_model_registered('oscar_accounts', 'DailyMovement'):
+    class DailyMovement(abstract_models.DailyMovement):
+        pass
+
+
+if not is_model_registered('oscar_accounts', 'RollupDay'):
+    class RollupDay(abstract_models.RollupDay):
+        pass
+
+
+if not is_model_registered('oscar_accounts', 'PostingRequest'):
+    class PostingRequest(abstract_models.PostingRequest):
+        pass
+
+
+if not is_model_registered('oscar_accounts', 'ReportJob'):
+    class ReportJob(abstract_models.ReportJob):
+        pass
+
+
 if not is_model_registered('oscar_accounts', 'IPAddressRecord'):
     class IPAddressRecord(abstract_models.IPAddressRecord):
         pass
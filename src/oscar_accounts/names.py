@@ -20,6 +20,11 @@ UNPAID_ACCOUNTS = getattr(settings, 'ACCOUNTS_UNPAID_SOURCES',
 # Account where money is transferred from when creating a giftcard
 BANK = getattr(settings, 'ACCOUNTS_BANK_NAME', "Bank")
 
+# Busy system accounts whose balance is spread over several rows ("shards") so
+# that concurrent postings don't all queue up on a single row lock.  Maps
+# account name to the number of shards, eg {REDEMPTIONS: 16}.
+STRIPED_ACCOUNTS = getattr(settings, 'ACCOUNTS_STRIPED_ACCOUNTS', {})
+
 # Account types
 # =============
 
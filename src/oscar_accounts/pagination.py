@@ -0,0 +1,165 @@
+import base64
+import json
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Q
+from django.http import Http404
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+from django.utils.translation import ugettext_lazy as _
+
+# Whether keyset-paginated listings show the planner's estimate of the number
+# of rows (only available on PostgreSQL)
+ESTIMATE_COUNTS = getattr(
+    settings, 'OSCAR_ACCOUNTS_DASHBOARD_ESTIMATE_COUNTS', False)
+
+NEXT, PREVIOUS = 'n', 'p'
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(obj, direction):
+    """
+    Return an opaque cursor for the page after (or before) the passed object
+    """
+    data = json.dumps([direction, obj.date_created.isoformat(), obj.id])
+    return base64.urlsafe_b64encode(data.encode('utf8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """
+    Return the (direction, date_created, id) of the passed cursor
+    """
+    try:
+        direction, date_created, pk = json.loads(
+            base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf8'))
+        date_created = parse_datetime(date_created)
+    except (TypeError, ValueError):
+        raise InvalidCursor("Invalid cursor")
+    valid = (direction in (NEXT, PREVIOUS), date_created is not None,
+             isinstance(pk, int))
+    if not all(valid):
+        raise InvalidCursor("Invalid cursor")
+    return direction, date_created, pk
+
+
+def estimate_count(queryset):
+    """
+    Return the query planner's estimate of the number of rows in the passed
+    queryset, or None if the database doesn't provide one.
+
+    Unlike ``COUNT(*)`` this doesn't read the rows, but it is only as accurate
+    as the table statistics.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class KeysetPage(object):
+
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator(object):
+    """
+    Paginates a queryset newest first, on ``(date_created, id)``.
+
+    Each page is fetched with a range condition on the last row of the page
+    before it, so (with an index on ``date_created``) a page costs the same
+    however deep into the listing it is, and no ``COUNT(*)`` is needed.  Pages
+    are addressed by opaque cursors rather than numbers.
+    """
+
+    def __init__(self, queryset, per_page, estimate_count=ESTIMATE_COUNTS):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.estimate_count = estimate_count
+
+    @cached_property
+    def estimated_count(self):
+        if not self.estimate_count:
+            return None
+        return estimate_count(self.queryset)
+
+    def page(self, cursor=None):
+        """
+        Return the page starting after the passed cursor, or the first page
+        """
+        queryset = self.queryset
+        direction = NEXT
+        if cursor:
+            direction, date_created, pk = decode_cursor(cursor)
+            if direction == NEXT:
+                after = Q(date_created=date_created, id__lt=pk)
+                queryset = queryset.filter(
+                    Q(date_created__lt=date_created) | after)
+            else:
+                before = Q(date_created=date_created, id__gt=pk)
+                queryset = queryset.filter(
+                    Q(date_created__gt=date_created) | before)
+        if direction == NEXT:
+            queryset = queryset.order_by('-date_created', '-id')
+        else:
+            queryset = queryset.order_by('date_created', 'id')
+
+        # One extra row tells us whether there is another page
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if direction == NEXT:
+            has_next, has_previous = has_more, bool(cursor)
+        else:
+            rows.reverse()
+            has_next, has_previous = True, has_more
+
+        next_cursor = previous_cursor = None
+        if rows and has_next:
+            next_cursor = encode_cursor(rows[-1], NEXT)
+        if rows and has_previous:
+            previous_cursor = encode_cursor(rows[0], PREVIOUS)
+        return KeysetPage(rows, next_cursor, previous_cursor)
+
+
+class KeysetPaginationMixin(object):
+    """
+    Paginates a ListView with a ``KeysetPaginator``, taking the cursor from the
+    ``cursor`` query parameter
+    """
+    cursor_kwarg = 'cursor'
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator = KeysetPaginator(queryset, page_size)
+        try:
+            page = paginator.page(self.request.GET.get(self.cursor_kwarg))
+        except InvalidCursor:
+            raise Http404(_("Invalid page"))
+        return paginator, page, page.object_list, page.has_other_pages()
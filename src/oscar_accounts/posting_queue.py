@@ -0,0 +1,179 @@
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from oscar.core.loading import get_model
+
+from oscar_accounts import exceptions
+
+PostingRequest = get_model('oscar_accounts', 'PostingRequest')
+Transfer = get_model('oscar_accounts', 'Transfer')
+
+# Whether facade.transfer goes through the posting queue
+ENABLED = getattr(settings, 'ACCOUNTS_GROUP_COMMIT', False)
+
+# Maximum number of postings made in one database transaction
+BATCH_SIZE = getattr(settings, 'ACCOUNTS_GROUP_COMMIT_BATCH_SIZE', 100)
+
+# How long (in seconds) to wait for a posting to be confirmed
+TIMEOUT = getattr(settings, 'ACCOUNTS_GROUP_COMMIT_TIMEOUT', 10)
+
+POLL_INTERVAL = 0.005
+
+
+def is_enabled():
+    # The queue only helps when the request is committed straight away, so
+    # that other processes can pick it up.  Inside a transaction we post
+    # directly.
+    return ENABLED and not connection.in_atomic_block
+
+
+def submit(source, destination, amount, parent=None, user=None,
+           merchant_reference=None, description=None, idempotency_key=None):
+    """
+    Append a transfer to the posting queue and return the posting request.
+
+    A retried transfer (one with the idempotency key of a request that is
+    still pending) returns that request rather than queueing it again.
+    """
+    if idempotency_key is not None:
+        request = PostingRequest.objects.filter(
+            idempotency_key=idempotency_key, status=PostingRequest.PENDING,
+            source=source, destination=destination, amount=amount).first()
+        if request is not None:
+            return request
+    return PostingRequest.objects.create(
+        source=source, destination=destination, amount=amount,
+        parent=parent, user=user, merchant_reference=merchant_reference,
+        description=description, idempotency_key=idempotency_key)
+
+
+def drain(batch_size=BATCH_SIZE):
+    """
+    Post a batch of pending requests in a single database transaction, and
+    return the number processed.
+
+    Each request is posted (and verified) exactly as `Transfer.objects.create`
+    would, within its own savepoint, so a request that is invalid (or fails
+    for any other reason) fails on its own without affecting the rest of the
+    batch.  Requests being processed by
+    another process are skipped.
+    """
+    skip_locked = connection.features.has_select_for_update_skip_locked
+    with transaction.atomic():
+        ids = list(PostingRequest.objects.select_for_update(
+            skip_locked=skip_locked).filter(
+                status=PostingRequest.PENDING).order_by('id').values_list(
+                    'id', flat=True)[:batch_size])
+        # Fetched separately so that only the requests themselves are locked
+        requests = list(PostingRequest.objects.filter(
+            id__in=ids).select_related(
+                'source', 'destination', 'parent', 'user').order_by('id'))
+        # The accounts of the whole batch are locked up front, in primary key
+        # order, as for a single posting.  Otherwise they would be locked
+        # request by request, and concurrent drains touching the same
+        # accounts in a different order could deadlock.
+        Transfer.objects.lock_accounts(
+            [account for request in requests
+             for account in (request.source, request.destination)],
+            debited=[request.source for request in requests])
+        for request in requests:
+            try:
+                with transaction.atomic():
+                    request.transfer = Transfer.objects.create(
+                        request.source, request.destination, request.amount,
+                        parent=request.parent, user=request.user,
+                        merchant_reference=request.merchant_reference,
+                        description=request.description,
+                        idempotency_key=request.idempotency_key)
+            except Exception as e:
+                # Any failure (not only a refused transfer) is confined to the
+                # request, otherwise the batch would be rolled back and fail
+                # again on every drain
+                request.status = PostingRequest.FAILED
+                request.error = str(e)
+                if isinstance(e, exceptions.AccountException):
+                    request.error_type = e.__class__.__name__
+            else:
+                request.status = PostingRequest.POSTED
+            request.date_processed = timezone.now()
+            request.save()
+    return len(ids)
+
+
+def error_for(request):
+    """
+    Return the exception raised by the passed failed request.
+
+    Refused transfers raise the same AccountException subclass as when posted
+    directly (eg InsufficientFunds); any other failure raises
+    AccountException.
+    """
+    exc_class = getattr(exceptions, request.error_type or '', None)
+    if not isinstance(exc_class, type):
+        exc_class = exceptions.AccountException
+    elif not issubclass(exc_class, exceptions.AccountException):
+        exc_class = exceptions.AccountException
+    return exc_class(request.error)
+
+
+def wait_for(request, timeout=TIMEOUT):
+    """
+    Wait for the passed request to be processed and return its transfer.
+
+    Rather than only waiting, the caller drains the queue itself whenever its
+    request is still pending, so a request never waits for a separate worker
+    and the postings of concurrent callers are committed together.
+
+    Raises an AccountException if the transfer was not permitted, or
+    PostingTimeout if it wasn't processed in time.  A request that times out
+    is failed, so that it is never posted once the caller has given up on it.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        request.refresh_from_db(
+            fields=['status', 'transfer', 'error', 'error_type'])
+        if request.status == PostingRequest.POSTED:
+            return request.transfer
+        if request.status == PostingRequest.FAILED:
+            raise error_for(request)
+        if time.monotonic() > deadline:
+            error = "Posting request #%d was not processed within %s seconds" % (
+                request.id, timeout)
+            # Only fail the request if it is still pending.  If it is being
+            # posted by another process this waits for that batch to commit,
+            # and the request's outcome is read again.
+            failed = PostingRequest.objects.filter(
+                id=request.id, status=PostingRequest.PENDING).update(
+                    status=PostingRequest.FAILED, error=error,
+                    error_type=exceptions.PostingTimeout.__name__,
+                    date_processed=timezone.now())
+            if failed:
+                raise exceptions.PostingTimeout(error)
+            continue
+        if not drain():
+            # Our request is in a batch being posted by another process
+            time.sleep(POLL_INTERVAL)
+
+
+def post(source, destination, amount, parent=None, user=None,
+         merchant_reference=None, description=None, idempotency_key=None,
+         timeout=TIMEOUT):
+    """
+    Post a transfer through the queue and return it once it is committed
+    """
+    if idempotency_key is not None:
+        transfer = Transfer.objects.replay(
+            idempotency_key, source, destination, amount)
+        if transfer is not None:
+            return transfer
+    request = submit(source, destination, amount, parent, user,
+                     merchant_reference, description, idempotency_key)
+    transfer = wait_for(request, timeout)
+    # The balances were changed by the process that posted the transfer
+    source.refresh_balance()
+    destination.refresh_balance()
+    # As with a direct posting, the transfer refers to the passed accounts
+    transfer.source, transfer.destination = source, destination
+    return transfer
@@ -0,0 +1,213 @@
+"""
+Process-local registries of the system accounts (eg the redemptions and
+lapsed accounts) and of the account type tree, which are looked up on most
+requests but rarely change.
+
+Each system account's row is read once per process and then handed out as a
+lightweight handle: a copy of the account built from the cached values, whose
+balance is only read from the database if it is used.  The posting engine
+locks and re-reads the rows it posts to, so a handle can be used as the
+source or destination of a transfer.
+
+The account type tree is read in one query, in materialized path order, and
+serves lookups by name and code, children and full names.
+
+Entries are invalidated when an account or account type is saved, moved or
+deleted in this process.  The account type tree is also stored under a
+generation number in Django's cache, which is bumped once a change to an
+account type is committed, so other processes rebuild their tree on their next
+lookup.  With the default local-memory cache, each process only sees its own
+changes: use a shared cache (eg memcached or Redis) when running more than one
+process.
+"""
+import copy
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from oscar.core.loading import get_model
+
+Account = get_model('oscar_accounts', 'Account')
+AccountType = get_model('oscar_accounts', 'AccountType')
+
+# The cache holding the account type tree's generation number, from the
+# CACHES setting
+CACHE_ALIAS = getattr(settings, 'ACCOUNTS_REGISTRY_CACHE_ALIAS', 'default')
+
+GENERATION_KEY = 'oscar_accounts:account_types:generation'
+
+_lock = threading.Lock()
+
+# Maps account names to the values of their (non-balance) fields
+_accounts = {}
+
+# The account type tree and the generation it was built for, loaded on first
+# use
+_account_types = None
+
+
+def _field_names():
+    return [field.attname for field in Account._meta.concrete_fields
+            if field.name != 'balance']
+
+
+def _values(name):
+    values = _accounts.get(name)
+    if values is None:
+        values = Account.objects.filter(name=name).values(
+            *_field_names()).get()
+        with _lock:
+            _accounts[name] = values
+    return values
+
+
+def account(name):
+    """
+    Return a handle for the account with the passed name.
+
+    Raises Account.DoesNotExist if there is no such account.
+    """
+    handle = Account(**_values(name))
+    handle._state.adding = False
+    handle._state.db = Account.objects.db
+    # Balances change with every posting so it is loaded on first access
+    del handle.__dict__['balance']
+    return handle
+
+
+def account_id(name):
+    """
+    Return the primary key of the account with the passed name
+    """
+    return _values(name)['id']
+
+
+class AccountTypeTree(object):
+    """
+    An account type tree, built from its nodes in path order
+    """
+
+    def __init__(self, nodes):
+        steplen = AccountType.steplen
+        self.nodes = dict((node.path, node) for node in nodes)
+        self.full_names = {}
+        self.children = dict((path, []) for path in self.nodes)
+        self.by_name = {}
+        self.by_code = {}
+        for node in nodes:
+            parent_path = node.path[:-steplen]
+            if parent_path:
+                self.children[parent_path].append(node)
+                self.full_names[node.path] = "%s / %s" % (
+                    self.full_names[parent_path], node.name)
+            else:
+                self.full_names[node.path] = node.name
+            self.by_name.setdefault(node.name, []).append(node)
+            if node.code:
+                self.by_code[node.code] = node
+
+
+def _generation():
+    cache = caches[CACHE_ALIAS]
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        # Start from a value that wasn't used before, in case an earlier
+        # generation number was evicted
+        cache.add(GENERATION_KEY, int(time.time() * 1000000), None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def _bump_generation():
+    try:
+        caches[CACHE_ALIAS].incr(GENERATION_KEY)
+    except ValueError:
+        # No generation, so no process has built a tree for it
+        pass
+
+
+def _tree():
+    global _account_types
+    # The generation is read before the nodes, so a tree built from nodes
+    # that were changed meanwhile is rebuilt on the next lookup
+    generation = _generation()
+    cached = _account_types
+    if cached is None or cached[0] != generation:
+        tree = AccountTypeTree(list(AccountType.objects.order_by('path')))
+        with _lock:
+            _account_types = (generation, tree)
+        return tree
+    return cached[1]
+
+
+def account_type(name=None, code=None):
+    """
+    Return the account type with the passed name or code.
+
+    Raises AccountType.DoesNotExist if there is no such account type, and
+    AccountType.MultipleObjectsReturned if several have the passed name.
+    """
+    tree = _tree()
+    if code is not None:
+        nodes = [tree.by_code[code]] if code in tree.by_code else []
+    else:
+        nodes = tree.by_name.get(name, [])
+    if not nodes:
+        raise AccountType.DoesNotExist(
+            "No account type with name %r or code %r" % (name, code))
+    if len(nodes) > 1:
+        raise AccountType.MultipleObjectsReturned(
+            "Several account types are named %r" % name)
+    # Copies, so that callers can't change the cached nodes
+    return copy.copy(nodes[0])
+
+
+def account_type_children(parent):
+    """
+    Return the children of the passed account type, in tree order
+    """
+    return [copy.copy(node)
+            for node in _tree().children.get(parent.path, [])]
+
+
+def account_type_full_name(node):
+    """
+    Return the full name of the passed account type (eg
+    "Liabilities / Deferred income"), or None if it isn't in the tree
+    """
+    return _tree().full_names.get(node.path)
+
+
+def invalidate(sender, instance, **kwargs):
+    with _lock:
+        for name, values in list(_accounts.items()):
+            if name == instance.name or values['id'] == instance.pk:
+                del _accounts[name]
+
+
+def invalidate_account_types(sender=None, **kwargs):
+    global _account_types
+    with _lock:
+        _account_types = None
+    # Other processes could rebuild their tree from the old nodes until the
+    # change is committed
+    transaction.on_commit(_bump_generation)
+
+
+def clear():
+    with _lock:
+        _accounts.clear()
+    invalidate_account_types()
+
+
+post_save.connect(invalidate, sender=Account,
+                  dispatch_uid='oscar_accounts.registry.save')
+post_delete.connect(invalidate, sender=Account,
+                    dispatch_uid='oscar_accounts.registry.delete')
+post_save.connect(invalidate_account_types, sender=AccountType,
+                  dispatch_uid='oscar_accounts.registry.save_type')
+post_delete.connect(invalidate_account_types, sender=AccountType,
+                    dispatch_uid='oscar_accounts.registry.delete_type')
@@ -0,0 +1,207 @@
+"""
+Optional cache of the results of the dashboard reports, by report and date
+range, using Django's cache framework.
+
+The results for a range that is over (ie that ends before the current day)
+can only change if a transfer dated within it is posted late, such as one
+committed just after midnight.  They are kept until that happens: each late
+posting is recorded, in order, and a cached result is only served if none of
+the late postings recorded since it was cached fall within its range.  The
+results for a range that includes the current day are kept for a short time
+only.
+
+Adding or changing accounts invalidates the cached deferred income reports,
+which count and bucket them, and changing the account types (or the cash and
+unpaid source accounts) invalidates all cached results.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+from oscar.core.loading import get_model
+
+from oscar_accounts import names, registry, rollups, signals
+
+Account = get_model('oscar_accounts', 'Account')
+AccountType = get_model('oscar_accounts', 'AccountType')
+
+# Whether report results are cached
+ENABLED = getattr(settings, 'ACCOUNTS_REPORT_CACHE', False)
+
+# The cache to use, from the CACHES setting
+CACHE_ALIAS = getattr(settings, 'ACCOUNTS_REPORT_CACHE_ALIAS', 'default')
+
+# How long (in seconds) the results for a range including the current day are
+# kept
+TIMEOUT = getattr(settings, 'ACCOUNTS_REPORT_CACHE_TIMEOUT', 60)
+
+# Results cached before more late postings than this were recorded are
+# recalculated rather than checked against each of them
+MAX_LATE_POSTINGS = 100
+
+DEFERRED_INCOME, PROFIT_LOSS = 'deferred-income', 'profit-loss'
+
+# The account fields that appear in (or affect) the reports
+REPORTED_FIELDS = {'name', 'account_type', 'account_type_id', 'end_date'}
+
+PREFIX = 'oscar_accounts:report'
+LATE_POSTINGS_KEY = '%s:late' % PREFIX
+
+
+def _cache():
+    return caches[CACHE_ALIAS]
+
+
+def _timestamp(value):
+    return None if value is None else rollups.as_datetime(value).timestamp()
+
+
+def _version(report=None):
+    cache = _cache()
+    key = '%s:version:%s' % (PREFIX, report or 'all')
+    version = cache.get(key)
+    if version is None:
+        # Start from a value that wasn't used before, in case an earlier
+        # version number was evicted while its results weren't
+        cache.add(key, int(time.time() * 1000000), None)
+        version = cache.get(key)
+    return version
+
+
+def _key(report, start, end, current):
+    raw = '%s:%s:%s:%s' % (report, _timestamp(start), _timestamp(end),
+                           'current' if current else 'past')
+    digest = hashlib.md5(raw.encode('utf-8')).hexdigest()
+    return '%s:%s:%s:%s' % (PREFIX, _version(), _version(report), digest)
+
+
+def _num_late_postings():
+    return _cache().get(LATE_POSTINGS_KEY)
+
+
+def _is_stale(entry, start, end, num_late_postings):
+    # Has a transfer dated within the range been posted since the result was
+    # cached?
+    if num_late_postings is None or num_late_postings < entry['num_late']:
+        # The record of late postings was evicted
+        return True
+    if num_late_postings - entry['num_late'] > MAX_LATE_POSTINGS:
+        return True
+    keys = ['%s:%d' % (LATE_POSTINGS_KEY, number) for number in range(
+        entry['num_late'] + 1, num_late_postings + 1)]
+    dates = _cache().get_many(keys)
+    if len(dates) < len(keys):
+        return True
+    start, end = _timestamp(start), _timestamp(end)
+    for date in dates.values():
+        if date < end and (start is None or date >= start):
+            return True
+    return False
+
+
+def get_or_run(report, start, end, run):
+    """
+    Return the cached result of the named report for the range from ``start``
+    (or the beginning of the ledger, if None) to ``end``, or call ``run`` to
+    calculate it.
+    """
+    if not ENABLED:
+        return run()
+    cache = _cache()
+    today = rollups.day_of(timezone.now())
+    if rollups.as_datetime(end) > today:
+        key = _key(report, start, end, current=True)
+        result = cache.get(key)
+        if result is None:
+            result = run()
+            cache.set(key, result, TIMEOUT)
+        return result
+
+    key = _key(report, start, end, current=False)
+    # Read before calculating the result, so that postings made meanwhile
+    # are checked when it's next read
+    num_late_postings = _num_late_postings()
+    if num_late_postings is None:
+        cache.add(LATE_POSTINGS_KEY, 0, None)
+        num_late_postings = _num_late_postings() or 0
+    entry = cache.get(key)
+    if entry is not None and not _is_stale(
+            entry, start, end, num_late_postings):
+        return entry['result']
+    result = run()
+    cache.set(key, {'num_late': num_late_postings, 'result': result}, None)
+    return result
+
+
+def record_late_posting(date):
+    """
+    Record that a transfer dated at the passed (past) date has been posted
+    """
+    cache = _cache()
+    try:
+        number = cache.incr(LATE_POSTINGS_KEY)
+    except ValueError:
+        # Nothing has been cached since the record was evicted
+        return
+    cache.set('%s:%d' % (LATE_POSTINGS_KEY, number), date.timestamp(), None)
+
+
+def invalidate(report=None):
+    """
+    Stop serving the cached results of the named report, or of all reports
+    """
+    try:
+        _cache().incr('%s:version:%s' % (PREFIX, report or 'all'))
+    except ValueError:
+        # No version, so nothing has been cached
+        pass
+
+
+def _transfers_posted(sender, transfers, **kwargs):
+    if not ENABLED:
+        return
+    today = rollups.day_of(timezone.now())
+    for transfer in transfers:
+        if transfer.date_created < today:
+            record_late_posting(transfer.date_created)
+
+
+def _account_changed(sender, instance, update_fields=None, **kwargs):
+    if not ENABLED:
+        return
+    if update_fields is not None and not REPORTED_FIELDS.intersection(
+            update_fields):
+        # Eg an account being closed
+        return
+    report = DEFERRED_INCOME
+    for name in (names.CASH, names.UNPAID_ACCOUNT_TYPE):
+        try:
+            source_type = registry.account_type(name=name)
+        except AccountType.DoesNotExist:
+            continue
+        if instance.account_type_id == source_type.id:
+            # The cash and unpaid source accounts are listed in the profit
+            # and loss report
+            report = None
+    transaction.on_commit(lambda: invalidate(report))
+
+
+def _account_type_changed(sender, instance, **kwargs):
+    if ENABLED:
+        transaction.on_commit(invalidate)
+
+
+signals.transfers_posted.connect(
+    _transfers_posted, dispatch_uid='oscar_accounts.report_cache.posted')
+post_save.connect(_account_changed, sender=Account,
+                  dispatch_uid='oscar_accounts.report_cache.account_save')
+post_delete.connect(_account_changed, sender=Account,
+                    dispatch_uid='oscar_accounts.report_cache.account_delete')
+post_save.connect(_account_type_changed, sender=AccountType,
+                  dispatch_uid='oscar_accounts.report_cache.type_save')
+post_delete.connect(_account_type_changed, sender=AccountType,
+                    dispatch_uid='oscar_accounts.report_cache.type_delete')
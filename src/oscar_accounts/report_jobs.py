@@ -0,0 +1,171 @@
+"""
+Dashboard reports run in the background, so that long date ranges don't
+exceed the HTTP timeout.
+
+A submitted job is run by a pool of worker threads in the submitting process
+(see ``ACCOUNTS_REPORT_JOB_WORKERS``), or by the ``run_report_jobs`` command.
+Either way a job is claimed with a conditional update, so it is only run
+once, and no queue service is needed.  The worker threads also run any jobs
+left pending by a process that was restarted before it could start them.  A
+job left running by a process that died, or still pending, is failed once it
+is older than ``ACCOUNTS_REPORT_JOB_TIMEOUT``.
+"""
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal as D
+from threading import Lock
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.utils import timezone
+from oscar.core.loading import get_model
+
+ReportJob = get_model('oscar_accounts', 'ReportJob')
+
+# Number of threads running report jobs in each process that submits them.
+# With 0, jobs are only run by the run_report_jobs command.
+WORKERS = getattr(settings, 'ACCOUNTS_REPORT_JOB_WORKERS', 1)
+
+# Seconds after which a job that is still running, or still waiting to be run,
+# is assumed to have been interrupted (eg by its process being restarted)
+TIMEOUT = getattr(settings, 'ACCOUNTS_REPORT_JOB_TIMEOUT', 3600)
+
+_executor = None
+_lock = Lock()
+
+
+class ResultEncoder(DjangoJSONEncoder):
+    # Amounts are stored as tagged strings so that they are decoded as
+    # decimals rather than floats
+
+    def default(self, o):
+        if isinstance(o, D):
+            return {'__decimal__': str(o)}
+        return super().default(o)
+
+
+def _decode(obj):
+    if list(obj) == ['__decimal__']:
+        return D(obj['__decimal__'])
+    return obj
+
+
+def encode_result(result):
+    return json.dumps(result, cls=ResultEncoder)
+
+
+def decode_result(result):
+    return json.loads(result, object_hook=_decode)
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=WORKERS)
+        return _executor
+
+
+def submit(report, start_date=None, end_date=None, user=None):
+    """
+    Create a job for the named report and, if there are worker threads, start
+    it once it is committed.  Returns the job.
+    """
+    fail_stale_jobs()
+    job = ReportJob.objects.create(
+        report=report, start_date=start_date, end_date=end_date, user=user)
+    if WORKERS > 0:
+        transaction.on_commit(
+            lambda: _get_executor().submit(_run_in_thread, job.id))
+    return job
+
+
+def _run_in_thread(job_id):
+    try:
+        run_job(job_id)
+        # Pick up any jobs that were handed to the workers of a process that
+        # has since been restarted
+        run_pending_jobs()
+    finally:
+        # Each thread has its own connection, which Django won't close
+        connection.close()
+
+
+def claim(job_id):
+    """
+    Mark the passed job as running, and return whether it was still pending
+    (ie whether the caller should run it)
+    """
+    return bool(ReportJob.objects.filter(
+        id=job_id, status=ReportJob.PENDING).update(
+            status=ReportJob.RUNNING, date_started=timezone.now()))
+
+
+def run_job(job_id):
+    """
+    Run the passed job, unless it has already been claimed, and return
+    whether it was run
+    """
+    # Imported here as the dashboard app may not be installed
+    from oscar_accounts.dashboard import reports
+
+    if not claim(job_id):
+        return False
+    job = ReportJob.objects.get(id=job_id)
+
+    def progress(percent):
+        ReportJob.objects.filter(id=job_id).update(progress=percent)
+
+    try:
+        result = reports.run_report(
+            job.report, job.start_date, job.end_date, progress)
+    except Exception as e:
+        changes = {'status': ReportJob.FAILED, 'error': str(e)}
+    else:
+        changes = {'status': ReportJob.COMPLETE,
+                   'result': encode_result(result), 'progress': 100}
+    # Unless the job was failed meanwhile for taking too long
+    ReportJob.objects.filter(id=job_id, status=ReportJob.RUNNING).update(
+        date_finished=timezone.now(), **changes)
+    return True
+
+
+def stale_before():
+    """
+    Return the time before which a job that is still running must have been
+    interrupted
+    """
+    return timezone.now() - timedelta(seconds=TIMEOUT)
+
+
+def fail_stale_jobs():
+    """
+    Mark the jobs that have been running, or waiting to be run, for longer
+    than the timeout as failed, and return the number failed
+    """
+    before = stale_before()
+    num_failed = ReportJob.objects.filter(
+        status=ReportJob.RUNNING, date_started__lt=before).update(
+            status=ReportJob.FAILED, date_finished=timezone.now(),
+            error="The job didn't finish within %d seconds" % TIMEOUT)
+    num_failed += ReportJob.objects.filter(
+        status=ReportJob.PENDING, date_created__lt=before).update(
+            status=ReportJob.FAILED, date_finished=timezone.now(),
+            error="The job wasn't started within %d seconds" % TIMEOUT)
+    return num_failed
+
+
+def run_pending_jobs():
+    """
+    Run the pending jobs, oldest first, and return the number run
+    """
+    fail_stale_jobs()
+    num_run = 0
+    ids = ReportJob.objects.filter(status=ReportJob.PENDING).order_by(
+        'date_created', 'id').values_list('id', flat=True)
+    for job_id in list(ids):
+        if run_job(job_id):
+            num_run += 1
+    return num_run
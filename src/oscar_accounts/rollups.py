@@ -0,0 +1,279 @@
+import datetime
+from collections import OrderedDict
+from decimal import Decimal as D
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import (
+    Count, DecimalField, F, Max, OuterRef, Subquery, Sum, Value)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from oscar.core.loading import get_model
+
+from oscar_accounts import checkpoints
+
+BalanceCheckpoint = get_model('oscar_accounts', 'BalanceCheckpoint')
+DailyFlow = get_model('oscar_accounts', 'DailyFlow')
+DailyMovement = get_model('oscar_accounts', 'DailyMovement')
+RollupDay = get_model('oscar_accounts', 'RollupDay')
+Transaction = get_model('oscar_accounts', 'Transaction')
+Transfer = get_model('oscar_accounts', 'Transfer')
+
+# Whether postings keep the rollups up to date and the reports use them
+ENABLED = getattr(settings, 'ACCOUNTS_ROLLUPS', False)
+
+# How long after the end of a day it is rolled up, so that postings still
+# being committed at midnight are included
+SETTLE_TIME = checkpoints.SETTLE_TIME
+
+ONE_DAY = datetime.timedelta(days=1)
+
+
+def day_start(day):
+    return datetime.datetime.combine(day, datetime.time(tzinfo=timezone.utc))
+
+
+def day_of(value):
+    """
+    Return the start (midnight UTC) of the day containing the passed datetime,
+    whatever the checkpoint interval is
+    """
+    return checkpoints.period_start(value, checkpoints.DAILY)
+
+
+def as_datetime(value):
+    # Dates are treated as midnight in the current time zone, as they are
+    # when used to filter a DateTimeField
+    if not isinstance(value, datetime.datetime):
+        value = timezone.make_aware(
+            datetime.datetime.combine(value, datetime.time()))
+    return value
+
+
+def latest_day():
+    """
+    Return the latest day that has been rolled up, or None
+    """
+    return RollupDay.objects.aggregate(date=Max('date'))['date']
+
+
+def covered_until():
+    """
+    Return the end of the latest day that has been rolled up (every
+    transaction before it is included in the rollups), or None if the
+    rollups are disabled or haven't been made.
+    """
+    if not ENABLED:
+        return None
+    day = latest_day()
+    if day is None:
+        return None
+    return day_start(day) + ONE_DAY
+
+
+def split_range(start, end):
+    """
+    Split the range of datetimes from ``start`` to (but excluding) ``end``
+    into the days that can be answered from the rollups and the rest.
+
+    Returns a ``(first_day, end_day)`` pair of dates (or None if no whole day
+    in the range has been rolled up) and a list of the ``(start, end)`` ranges
+    that are left over, such as the current day.
+    """
+    start, end = as_datetime(start), as_datetime(end)
+    until = covered_until()
+    if until is None:
+        return None, [(start, end)]
+    first = day_of(start)
+    if first < start:
+        first += ONE_DAY
+    last = min(day_of(end), until)
+    if last <= first:
+        return None, [(start, end)]
+    leftover = []
+    if start < first:
+        leftover.append((start, first))
+    if last < end:
+        leftover.append((last, end))
+    return (first.date(), last.date()), leftover
+
+
+def balance_expression(date):
+    """
+    Return an expression for the balance of each account at the passed date,
+    to annotate an ``Account`` queryset with.
+
+    The balance starts from the latest checkpoint, as without rollups, but
+    the movements on the days since it that have been rolled up are added
+    instead of their transactions, followed by the transactions since.
+    """
+    until = covered_until()
+    if until is None:
+        return checkpoints.balance_expression(date)
+    until = min(until, day_of(date))
+    output_field = DecimalField(max_digits=12, decimal_places=2)
+    zero = Value(D('0.00'), output_field=output_field)
+
+    def total(queryset, field):
+        queryset = queryset.filter(account=OuterRef('pk')).order_by().values(
+            'account').annotate(total=Sum(field)).values('total')
+        return Coalesce(Subquery(queryset, output_field=output_field), zero)
+
+    balance = zero
+    movements = DailyMovement.objects.filter(date__lt=until.date())
+    checkpoint_date = checkpoints.latest_checkpoint_date(date)
+    if checkpoint_date is not None:
+        first = day_of(checkpoint_date)
+        if first < checkpoint_date:
+            first += ONE_DAY
+        if first >= until:
+            # None of the days since the checkpoint have been rolled up
+            return checkpoints.balance_expression(date)
+        checkpoint = BalanceCheckpoint.objects.filter(
+            account=OuterRef('pk'), date=checkpoint_date).values('balance')
+        balance = Coalesce(
+            Subquery(checkpoint, output_field=output_field), zero)
+        if checkpoint_date < first:
+            # A checkpoint taken during a day
+            balance = balance + total(Transaction.objects.filter(
+                date_created__gte=checkpoint_date, date_created__lt=first),
+                'amount')
+        movements = movements.filter(date__gte=first.date())
+    deltas = Transaction.objects.filter(
+        date_created__gte=until, date_created__lt=date)
+    return balance + total(movements, 'total') + total(deltas, 'amount')
+
+
+def rollup_day(day):
+    """
+    (Re)build the flows and movements of the passed day from its transfers
+    and transactions, and mark it as rolled up
+    """
+    start = day_start(day)
+    end = start + ONE_DAY
+    with transaction.atomic():
+        DailyFlow.objects.filter(date=day).delete()
+        DailyMovement.objects.filter(date=day).delete()
+        flows = Transfer.objects.filter(
+            date_created__gte=start, date_created__lt=end).values(
+                'source', 'destination').annotate(
+                    total=Sum('amount'), num_transfers=Count('id')).order_by()
+        DailyFlow.objects.bulk_create([
+            DailyFlow(date=day, source_id=row['source'],
+                      destination_id=row['destination'], total=row['total'],
+                      num_transfers=row['num_transfers'])
+            for row in flows])
+        movements = Transaction.objects.filter(
+            date_created__gte=start, date_created__lt=end).values(
+                'account').annotate(
+                    total=Sum('amount'), num_transactions=Count('id')).order_by()
+        DailyMovement.objects.bulk_create([
+            DailyMovement(date=day, account_id=row['account'],
+                          total=row['total'],
+                          num_transactions=row['num_transactions'])
+            for row in movements])
+        RollupDay.objects.get_or_create(date=day)
+
+
+def due_days(now=None):
+    """
+    Return the days that are over but haven't been rolled up yet
+    """
+    if now is None:
+        now = timezone.now()
+    end = day_of(now - SETTLE_TIME).date()
+    day = latest_day()
+    if day is not None:
+        day += ONE_DAY
+    else:
+        first = Transaction.objects.order_by('date_created').values_list(
+            'date_created', flat=True).first()
+        if first is None:
+            return []
+        day = day_of(first).date()
+    days = []
+    while day < end:
+        days.append(day)
+        day += ONE_DAY
+    return days
+
+
+def create_due_rollups(now=None):
+    """
+    Roll up every day that is over and hasn't been rolled up yet, in order,
+    and return them
+    """
+    days = due_days(now)
+    for day in days:
+        rollup_day(day)
+    return days
+
+
+def rebuild(since):
+    """
+    Roll up again every day from the passed one on (up to the latest rolled up
+    day) and return them
+    """
+    last = latest_day()
+    days = []
+    day = since
+    while last is not None and day <= last:
+        rollup_day(day)
+        days.append(day)
+        day += ONE_DAY
+    return days
+
+
+def _increment(model, key, total, counts):
+    changes = dict((name, F(name) + count) for name, count in counts.items())
+    changes['total'] = F('total') + total
+    if model.objects.filter(**key).update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(total=total, **dict(key, **counts))
+    except IntegrityError:
+        # Created by a concurrent posting
+        model.objects.filter(**key).update(**changes)
+
+
+def add_transfers(transfers):
+    """
+    Add the passed (just posted) transfers to the rollups of their day, if
+    that day has already been rolled up.
+
+    Postings are normally made on the current day, which is only rolled up
+    once it is over, so this does nothing unless a posting was dated before
+    the latest rollup (eg one committed just after midnight).
+    """
+    if not ENABLED:
+        return
+    today = day_of(timezone.now())
+    late = [t for t in transfers if t.date_created < today]
+    if not late:
+        return
+    days = set(RollupDay.objects.filter(date__in=set(
+        day_of(t.date_created).date() for t in late
+    )).values_list('date', flat=True))
+
+    flows = OrderedDict()
+    movements = OrderedDict()
+    for t in late:
+        day = day_of(t.date_created).date()
+        if day not in days:
+            continue
+        key = (day, t.source_id, t.destination_id)
+        total, num = flows.get(key, (D('0.00'), 0))
+        flows[key] = (total + t.amount, num + 1)
+        for account_id, amount in ((t.source_id, -t.amount),
+                                   (t.destination_id, t.amount)):
+            total, num = movements.get((day, account_id), (D('0.00'), 0))
+            movements[(day, account_id)] = (total + amount, num + 1)
+
+    for (day, source_id, destination_id), (total, num) in flows.items():
+        _increment(DailyFlow, {'date': day, 'source_id': source_id,
+                               'destination_id': destination_id},
+                   total, {'num_transfers': num})
+    for (day, account_id), (total, num) in movements.items():
+        _increment(DailyMovement, {'date': day, 'account_id': account_id},
+                   total, {'num_transactions': num})
@@ -0,0 +1,4 @@
+from django.dispatch import Signal
+
+# Sent once the database transaction that posted the transfers is committed
+transfers_posted = Signal(providing_args=['transfers'])
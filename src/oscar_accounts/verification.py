@@ -0,0 +1,137 @@
+import multiprocessing
+from decimal import Decimal as D
+
+from django.db import connections
+from django.db.models import Count, Sum
+from oscar.core.loading import get_model
+
+Account = get_model('oscar_accounts', 'Account')
+BalanceShard = get_model('oscar_accounts', 'BalanceShard')
+Transaction = get_model('oscar_accounts', 'Transaction')
+
+CHUNK_SIZE = 2000
+
+LEDGER_NOT_BALANCED = 'ledger_not_balanced'
+TRANSFER_NOT_BALANCED = 'transfer_not_balanced'
+BALANCE_MISMATCH = 'balance_mismatch'
+
+
+def verify_ledger_total():
+    """
+    Check that the amounts of all transactions sum to zero
+    """
+    total = Transaction.objects.aggregate(sum=Sum('amount'))['sum']
+    if total:
+        yield {'type': LEDGER_NOT_BALANCED, 'total': "%.2f" % total}
+
+
+def verify_transfers(chunk_size=CHUNK_SIZE):
+    """
+    Check that each transfer has two transactions which sum to zero
+    """
+    rows = Transaction.objects.values('transfer_id').annotate(
+        total=Sum('amount'), num_transactions=Count('id')).order_by()
+    for row in rows.iterator(chunk_size=chunk_size):
+        if row['total'] or row['num_transactions'] != 2:
+            yield {'type': TRANSFER_NOT_BALANCED,
+                   'transfer_id': row['transfer_id'],
+                   'total': "%.2f" % row['total'],
+                   'num_transactions': row['num_transactions']}
+
+
+def verify_balances(start_id=None, end_id=None, chunk_size=CHUNK_SIZE):
+    """
+    Check that the cached balance of each account (with an ID in the passed
+    range) matches the sum of its transactions.
+
+    Both the accounts and the per-account transaction totals are streamed in
+    ID order and merged, so memory use doesn't depend on the size of the
+    ledger.
+    """
+    accounts = Account.objects.order_by('id')
+    totals = Transaction.objects.values('account_id').annotate(
+        total=Sum('amount')).order_by('account_id')
+    shards = BalanceShard.objects.values('account_id').annotate(
+        total=Sum('balance')).order_by()
+    if start_id is not None:
+        accounts = accounts.filter(id__gte=start_id)
+        totals = totals.filter(account_id__gte=start_id)
+        shards = shards.filter(account_id__gte=start_id)
+    if end_id is not None:
+        accounts = accounts.filter(id__lt=end_id)
+        totals = totals.filter(account_id__lt=end_id)
+        shards = shards.filter(account_id__lt=end_id)
+    # Only a handful of (system) accounts are striped
+    shard_balances = dict((row['account_id'], row['total']) for row in shards)
+
+    totals = totals.iterator(chunk_size=chunk_size)
+    total = next(totals, None)
+    for account_id, balance in accounts.values_list(
+            'id', 'balance').iterator(chunk_size=chunk_size):
+        actual = D('0.00')
+        # Both streams are ordered by account ID
+        while total is not None and total['account_id'] <= account_id:
+            if total['account_id'] == account_id:
+                actual = total['total']
+            total = next(totals, None)
+        cached = shard_balances.get(account_id, balance)
+        # A NULL cached balance never matches
+        if cached is None or cached != actual:
+            yield {'type': BALANCE_MISMATCH,
+                   'account_id': account_id,
+                   'cached_balance': _format(cached),
+                   'actual_balance': "%.2f" % actual}
+
+
+def _format(amount):
+    return "%.2f" % amount if amount is not None else None
+
+
+def account_id_ranges(num_ranges):
+    """
+    Split the account IDs into (start, end) ranges of similar width
+    """
+    ids = Account.objects.order_by('id').values_list('id', flat=True)
+    first, last = ids.first(), ids.last()
+    if first is None:
+        return []
+    width = max(1, (last - first + num_ranges) // num_ranges)
+    return [(start, start + width)
+            for start in range(first, last + 1, width)]
+
+
+def _init_worker():
+    # Connections must not be shared with the parent process
+    connections.close_all()
+
+
+def _verify_balances_in_range(args):
+    return list(verify_balances(*args))
+
+
+def verify_ledger(workers=1, chunk_size=CHUNK_SIZE):
+    """
+    Run all the ledger checks and yield each discrepancy found as a dict.
+
+    With more than one worker, the account balances are checked in a pool of
+    processes, each handling a range of account IDs.
+    """
+    for discrepancy in verify_ledger_total():
+        yield discrepancy
+    for discrepancy in verify_transfers(chunk_size):
+        yield discrepancy
+    if workers <= 1:
+        for discrepancy in verify_balances(chunk_size=chunk_size):
+            yield discrepancy
+        return
+    ranges = [(start, end, chunk_size)
+              for start, end in account_id_ranges(workers * 4)]
+    connections.close_all()
+    # The workers are forked so that they inherit the configured Django
+    # project; a spawned worker would import this module (and so load the
+    # models) before Django is set up
+    context = multiprocessing.get_context('fork')
+    with context.Pool(workers, initializer=_init_worker) as pool:
+        for discrepancies in pool.imap(_verify_balances_in_range, ranges):
+            for discrepancy in discrepancies:
+                yield discrepancy
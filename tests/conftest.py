@@ -1,6 +1,7 @@
 import os
 
 import django
+import pytest
 
 
 # It should be possible to just set DJANGO_SETTINGS_MODULE in setup.cfg
@@ -10,3 +11,10 @@ import django
 def pytest_configure():
     os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tests.settings')
     django.setup()
+
+
+@pytest.fixture(autouse=True)
+def clear_registry():
+    # Registered accounts don't survive the rollback at the end of a test
+    from oscar_accounts import registry
+    registry.clear()
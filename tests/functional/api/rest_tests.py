@@ -4,7 +4,9 @@ from decimal import Decimal as D
 
 from django import test
 from django.contrib.auth.models import User
+from django.db import connection
 from django.test.client import Client
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from freezegun import freeze_time
@@ -31,14 +33,15 @@ def get(url):
     return Client().get(url, **get_headers())
 
 
-def post(url, payload):
+def post(url, payload, **headers):
     """
     POST a JSON-encoded payload
     """
+    headers.update(get_headers())
     return Client().post(
         url, json.dumps(payload),
         content_type="application/json",
-        **get_headers())
+        **headers)
 
 
 def to_json(response):
@@ -211,6 +214,13 @@ class TestMakingARedemption(test.TestCase):
         self.assertEqual('50.00', data['amount'])
         self.assertIsNone(data['destination_code'])
 
+    def test_loads_the_accounts_of_a_transfer_with_it(self):
+        with CaptureQueriesContext(connection) as queries:
+            get(self.redeem_response['Location'])
+        table = 'FROM "%s"' % models.Account._meta.db_table
+        self.assertFalse([query for query in queries.captured_queries
+                          if table in query['sql']])
+
     def test_works_without_merchant_reference(self):
         self.redeem_payload = {
             'amount': '10.00',
@@ -351,3 +361,62 @@ class TestMakingARedemptionThenTransferRefund(test.TestCase):
         refund_url = transfer_dict['refunds_url']
         response = post(refund_url, self.refund_payload)
         self.assertEqual(403, response.status_code)
+
+
+@freeze_time('2019-01-01')
+class TestRetryingRequestsWithAnIdempotencyKey(test.TestCase):
+
+    def setUp(self):
+        create_default_accounts()
+        self.create_payload = {
+            'start_date': '2012-01-01T09:00:00+03:00',
+            'end_date': '2019-06-01T09:00:00+03:00',
+            'amount': '100.00',
+            'account_type': 'Test accounts',
+        }
+
+    def create_account(self, key='create-1'):
+        return post(reverse('oscar_accounts_api:accounts'),
+                    self.create_payload, HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_returns_the_same_account_for_a_retried_creation(self):
+        first, second = self.create_account(), self.create_account()
+        self.assertEqual(201, second.status_code)
+        self.assertEqual(first['Location'], second['Location'])
+        self.assertEqual(1, models.Account.objects.filter(
+            code__isnull=False).count())
+
+    def test_returns_the_same_transfer_for_a_retried_redemption(self):
+        account_dict = to_json(get(self.create_account()['Location']))
+        payload = {'amount': '100.00'}
+        first = post(account_dict['redemptions_url'], payload,
+                     HTTP_IDEMPOTENCY_KEY='redeem-1')
+        # The account is now empty, but the retry still succeeds
+        second = post(account_dict['redemptions_url'], payload,
+                      HTTP_IDEMPOTENCY_KEY='redeem-1')
+        self.assertEqual(201, second.status_code)
+        self.assertEqual(first['Location'], second['Location'])
+        self.assertEqual(2, models.Transfer.objects.count())
+
+    def test_returns_the_same_transfer_for_a_retried_refund(self):
+        account_dict = to_json(get(self.create_account()['Location']))
+        redeem_response = post(account_dict['redemptions_url'],
+                               {'amount': '100.00'})
+        transfer_dict = to_json(get(redeem_response['Location']))
+        payload = {'amount': '100.00'}
+        first = post(transfer_dict['refunds_url'], payload,
+                     HTTP_IDEMPOTENCY_KEY='refund-1')
+        second = post(transfer_dict['refunds_url'], payload,
+                      HTTP_IDEMPOTENCY_KEY='refund-1')
+        self.assertEqual(201, second.status_code)
+        self.assertEqual(first['Location'], second['Location'])
+        self.assertEqual(3, models.Transfer.objects.count())
+
+    def test_rejects_a_key_reused_for_a_different_request(self):
+        account_dict = to_json(get(self.create_account()['Location']))
+        post(account_dict['redemptions_url'], {'amount': '10.00'},
+             HTTP_IDEMPOTENCY_KEY='redeem-1')
+        response = post(account_dict['redemptions_url'], {'amount': '20.00'},
+                        HTTP_IDEMPOTENCY_KEY='redeem-1')
+        self.assertEqual(403, response.status_code)
+        self.assertEqual('T103', to_json(response)['code'])
@@ -1,10 +1,16 @@
+import datetime
 from decimal import Decimal as D
+from unittest import mock
 
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from oscar.test.factories import UserFactory
 
 from django_webtest import WebTest
-from oscar_accounts import models
+from oscar_accounts import facade, models, names, report_jobs
+from oscar_accounts.dashboard import forms
 from oscar_accounts.setup import create_default_accounts
 
 
@@ -18,6 +24,20 @@ class TestAStaffMember(WebTest):
         list_page = self.app.get(reverse('accounts_dashboard:accounts-list'), user=self.staff)
         self.assertEqual(200, list_page.status_code)
 
+    def test_can_browse_accounts_in_a_constant_number_of_queries(self):
+        url = reverse('accounts_dashboard:accounts-list')
+        self.app.get(url, user=self.staff)
+        with CaptureQueriesContext(connection) as few_accounts:
+            self.app.get(url, user=self.staff)
+        source = models.Account.objects.get(name=names.BANK)
+        for i in range(10):
+            account = models.Account.objects.create(code='CODE%d' % i)
+            facade.transfer(source, account, D('10.00'))
+        with CaptureQueriesContext(connection) as many_accounts:
+            page = self.app.get(url, user=self.staff)
+        self.assertEqual(len(few_accounts), len(many_accounts))
+        self.assertIn('CODE9', page.text)
+
     def test_can_create_a_new_account(self):
         list_page = self.app.get(reverse('accounts_dashboard:accounts-list'), user=self.staff)
         create_page = list_page.click(linkid="create_new_account")
@@ -28,3 +48,207 @@ class TestAStaffMember(WebTest):
 
         acc = models.Account.objects.get(name='Test account')
         self.assertEqual(D('120.00'), acc.balance)
+
+    def test_can_freeze_an_account_without_touching_its_balance(self):
+        account = models.Account.objects.create(name='Test account')
+        models.Account.objects.filter(id=account.id).update(balance=D('12.00'))
+        freeze_page = self.app.get(
+            reverse('accounts_dashboard:accounts-freeze', kwargs={'pk': account.id}), user=self.staff)
+        response = freeze_page.form.submit()
+        self.assertEqual(302, response.status_code)
+        account = models.Account.objects.get(id=account.id)
+        self.assertTrue(account.is_frozen())
+        self.assertEqual(D('12.00'), account.balance)
+
+    def test_can_update_an_account_without_undoing_a_freeze(self):
+        account = models.Account.objects.create(name='Test account')
+        # Frozen (and its credit limit changed) once the form has loaded the
+        # account
+        models.Account.objects.filter(id=account.id).update(
+            status=models.Account.FROZEN, credit_limit=D('5.00'),
+            balance=D('12.00'))
+        form = forms.UpdateAccountForm(
+            instance=account, data={'name': 'Renamed account'})
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save()
+        account = models.Account.objects.get(id=account.id)
+        self.assertEqual('Renamed account', account.name)
+        self.assertTrue(account.is_frozen())
+        self.assertEqual(D('5.00'), account.credit_limit)
+        self.assertEqual(D('12.00'), account.balance)
+
+    def test_can_find_the_transfers_for_an_order(self):
+        bank = models.Account.objects.get(name=names.BANK)
+        account = models.Account.objects.create(name='Test account')
+        facade.transfer(bank, account, D('10.00'), merchant_reference='100001')
+        facade.transfer(bank, account, D('20.00'))
+        list_page = self.app.get(reverse('accounts_dashboard:transfers-list'), user=self.staff)
+        list_page.form['merchant_reference'] = '100001'
+        results = list_page.form.submit()
+        self.assertEqual(1, len(results.context['transfers']))
+
+    def test_can_page_through_an_account_statement(self):
+        bank = models.Account.objects.get(name=names.BANK)
+        account = models.Account.objects.create(name='Test account')
+        for i in range(25):
+            facade.transfer(bank, account, D('1.00'))
+        url = reverse('accounts_dashboard:accounts-detail', kwargs={'pk': account.id})
+        first_page = self.app.get(url, user=self.staff)
+        self.assertEqual(20, len(first_page.context['transactions']))
+        second_page = first_page.click(href='cursor=', description='next')
+        self.assertEqual(5, len(second_page.context['transactions']))
+        self.assertFalse(second_page.context['page_obj'].has_next())
+        back = second_page.click(href='cursor=', description='previous')
+        self.assertEqual(
+            [txn.id for txn in first_page.context['transactions']],
+            [txn.id for txn in back.context['transactions']])
+
+    def test_gets_a_404_for_an_invalid_page(self):
+        response = self.app.get(
+            reverse('accounts_dashboard:transfers-list'), {'cursor': 'nonsense'},
+            user=self.staff, status=404)
+        self.assertEqual(404, response.status_code)
+
+    def test_can_export_the_transfers_for_an_order(self):
+        bank = models.Account.objects.get(name=names.BANK)
+        account = models.Account.objects.create(name='Test account')
+        facade.transfer(bank, account, D('10.00'), merchant_reference='100001')
+        facade.transfer(bank, account, D('20.00'))
+        list_page = self.app.get(reverse('accounts_dashboard:transfers-list'), user=self.staff)
+        list_page.form['merchant_reference'] = '100001'
+        # The export button submits the search form to the export view
+        export = self.app.get(
+            reverse('accounts_dashboard:transfers-export'),
+            dict(list_page.form.submit_fields()), user=self.staff)
+        self.assertEqual('text/csv', export.content_type)
+        lines = b''.join(export.app_iter).decode('utf8').splitlines()
+        self.assertEqual(2, len(lines))
+        self.assertIn('100001', lines[1])
+
+    def test_can_export_an_account_statement(self):
+        bank = models.Account.objects.get(name=names.BANK)
+        account = models.Account.objects.create(name='Test account')
+        facade.transfer(bank, account, D('10.00'))
+        detail_page = self.app.get(
+            reverse('accounts_dashboard:accounts-detail', kwargs={'pk': account.id}), user=self.staff)
+        export = detail_page.click(description='Export CSV')
+        self.assertIn('attachment', export.headers['Content-Disposition'])
+        self.assertEqual(2, len(export.text.splitlines()))
+
+    def test_can_issue_accounts_in_bulk(self):
+        list_page = self.app.get(reverse('accounts_dashboard:accounts-list'), user=self.staff)
+        form = list_page.click(linkid='issue_accounts').forms['issue_accounts_form']
+        form['count'] = 3
+        form['initial_amount'] = '50'
+        response = form.submit()
+        self.assertEqual('text/csv', response.content_type)
+        rows = response.text.splitlines()
+        self.assertEqual('code,amount,start_date,end_date', rows[0])
+        self.assertEqual(4, len(rows))
+        for row in rows[1:]:
+            account = models.Account.objects.get(code=row.split(',')[0])
+            self.assertEqual(D('50.00'), account.balance)
+
+    def test_can_choose_the_type_of_the_issued_accounts(self):
+        deferred_income = models.AccountType.objects.get(
+            name=names.DEFERRED_INCOME)
+        vouchers = deferred_income.add_child(name='Vouchers')
+        url = reverse('accounts_dashboard:accounts-issue')
+        form = self.app.get(url, user=self.staff).forms['issue_accounts_form']
+        form['count'] = 2
+        form['initial_amount'] = '50'
+        form['account_type'] = vouchers.pk
+        form.submit()
+        self.assertEqual(2, models.Account.objects.filter(
+            account_type=vouchers).count())
+
+    def test_cannot_issue_more_accounts_than_fit_in_a_request(self):
+        url = reverse('accounts_dashboard:accounts-issue')
+        form = self.app.get(url, user=self.staff).forms['issue_accounts_form']
+        form['count'] = forms.IssueAccountsForm.base_fields[
+            'count'].max_value + 1
+        form['initial_amount'] = '50'
+        response = form.submit()
+        self.assertEqual(200, response.status_code)
+        self.assertIn('count', response.context['form'].errors)
+        self.assertIn('issue_accounts management command', response.text)
+        self.assertFalse(models.Account.objects.filter(
+            code__isnull=False).exists())
+
+
+class TestTheDeferredIncomeReport(WebTest):
+
+    def setUp(self):
+        create_default_accounts()
+        self.staff = UserFactory(is_staff=True)
+        acc_type = models.AccountType.objects.get(name='Test accounts')
+        bank = models.Account.objects.get(name=names.BANK)
+        now = timezone.now()
+        for days, amount in ((10, '10.00'), (45, '20.00'), (200, '40.00'),
+                             (None, '80.00')):
+            end_date = now + datetime.timedelta(days=days) if days else None
+            account = models.Account.objects.create(
+                account_type=acc_type, end_date=end_date)
+            models.Transfer.objects.create(bank, account, D(amount))
+
+    def test_buckets_balances_by_expiry(self):
+        tomorrow = timezone.now().date() + datetime.timedelta(days=1)
+        response = self.app.get(
+            reverse('accounts_dashboard:report-deferred-income'),
+            params={'date': tomorrow.strftime('%Y-%m-%d')}, user=self.staff)
+        row = response.context['rows'][0]
+        self.assertEqual(D('150.00'), row['total'])
+        self.assertEqual(4, row['num_accounts'])
+        self.assertEqual(D('10.00'), row['total_expiring_within_30'])
+        self.assertEqual(D('20.00'), row['total_expiring_within_60'])
+        self.assertEqual(0, row['num_expiring_within_90'])
+        self.assertEqual(D('40.00'), row['total_expiring_outside_90'])
+        self.assertEqual(D('80.00'), row['total_open_ended'])
+        self.assertEqual(D('150.00'), response.context['totals']['total'])
+
+
+@mock.patch.object(report_jobs, 'WORKERS', 0)
+class TestABackgroundReport(WebTest):
+
+    def setUp(self):
+        create_default_accounts()
+        self.staff = UserFactory(is_staff=True)
+        bank = models.Account.objects.get(name=names.BANK)
+        account = models.Account.objects.create(
+            account_type=models.AccountType.objects.get(name='Test accounts'))
+        models.Transfer.objects.create(bank, account, D('10.00'))
+
+    def test_can_be_run_viewed_and_downloaded(self):
+        today = timezone.now().strftime('%Y-%m-%d')
+        report_page = self.app.get(
+            reverse('accounts_dashboard:report-deferred-income'),
+            params={'date': today}, user=self.staff)
+        form_page = report_page.click(href='jobs/create')
+        form = form_page.forms['report_job_form']
+        self.assertEqual('deferred-income', form['report'].value)
+        self.assertEqual(today, form['end_date'].value)
+
+        detail_page = form.submit().follow()
+        self.assertContains(detail_page, 'Pending')
+
+        report_jobs.run_pending_jobs()
+        detail_page = self.app.get(detail_page.request.url, user=self.staff)
+        self.assertEqual(D('10.00'), detail_page.context['totals']['total'])
+
+        download = detail_page.click(href='download')
+        self.assertEqual('text/csv', download.content_type)
+        self.assertIn('Test accounts,10.00,1', download.text)
+
+    def test_shows_a_job_that_has_been_running_too_long_as_stale(self):
+        job = report_jobs.submit(
+            'deferred-income', end_date=timezone.now().date())
+        report_jobs.claim(job.id)
+        models.ReportJob.objects.filter(id=job.id).update(
+            date_started=timezone.now() - datetime.timedelta(
+                seconds=report_jobs.TIMEOUT + 1))
+        list_page = self.app.get(
+            reverse('accounts_dashboard:report-jobs-list'), user=self.staff)
+        self.assertContains(list_page, 'Stale')
+        detail_page = list_page.click(href='jobs/%d/$' % job.id)
+        self.assertContains(detail_page, 'Stale')
+        self.assertNotContains(detail_page, 'http-equiv="refresh"')
@@ -0,0 +1,85 @@
+from decimal import Decimal as D
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import transaction
+from django.test import TransactionTestCase
+
+from oscar_accounts import balance_cache, facade
+from oscar_accounts.models import Account
+from oscar_accounts.test_factories import AccountFactory
+
+
+@mock.patch.object(balance_cache, 'ENABLED', True)
+class TestTheBalanceCache(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.source = AccountFactory(primary_user=None, credit_limit=None)
+        self.account = AccountFactory(code='ABCD1234', primary_user=None)
+        facade.transfer(self.source, self.account, D('20.00'))
+
+    def test_serves_repeated_lookups_without_queries(self):
+        balance_cache.get_account('ABCD1234')
+        with self.assertNumQueries(0):
+            account = balance_cache.get_account('ABCD1234')
+        self.assertEqual(self.account.pk, account.pk)
+        self.assertEqual(D('20.00'), account.balance)
+
+    def test_serves_the_balance_after_a_committed_transfer(self):
+        balance_cache.get_account('ABCD1234')
+        facade.transfer(self.account, self.source, D('5.00'))
+        self.assertEqual(
+            D('15.00'), balance_cache.get_account('ABCD1234').balance)
+
+    def test_keeps_serving_the_committed_balance_until_commit(self):
+        balance_cache.get_account('ABCD1234')
+        with transaction.atomic():
+            facade.transfer(self.account, self.source, D('5.00'))
+            self.assertEqual(
+                D('20.00'), balance_cache.get_account('ABCD1234').balance)
+        self.assertEqual(
+            D('15.00'), balance_cache.get_account('ABCD1234').balance)
+
+    def test_ignores_rolled_back_transfers(self):
+        balance_cache.get_account('ABCD1234')
+        try:
+            with transaction.atomic():
+                facade.transfer(self.account, self.source, D('5.00'))
+                raise RuntimeError()
+        except RuntimeError:
+            pass
+        self.assertEqual(
+            D('20.00'), balance_cache.get_account('ABCD1234').balance)
+
+    def test_serves_the_balance_to_lookups_in_another_case(self):
+        get = Account.objects.get
+
+        def get_ignoring_case(code):
+            # As on databases with case-insensitive collations
+            return get(code=code.upper())
+
+        with mock.patch.object(Account.objects, 'get', get_ignoring_case):
+            balance_cache.get_account('abcd1234')
+            facade.transfer(self.account, self.source, D('5.00'))
+            self.assertEqual(
+                D('15.00'), balance_cache.get_account('abcd1234').balance)
+
+    def test_serves_the_status_after_an_account_is_changed(self):
+        balance_cache.get_account('ABCD1234')
+        self.account.status = Account.FROZEN
+        self.account.save(update_fields=['status'])
+        self.assertTrue(balance_cache.get_account('ABCD1234').is_frozen())
+
+    def test_serves_the_balance_after_it_is_reconciled(self):
+        # A drifted balance is cached
+        Account.objects.filter(id=self.account.id).update(balance=D('7.00'))
+        self.assertEqual(
+            D('7.00'), balance_cache.get_account('ABCD1234').balance)
+        self.account.reconcile_balance()
+        self.assertEqual(
+            D('20.00'), balance_cache.get_account('ABCD1234').balance)
+
+    def test_raises_for_an_unknown_code(self):
+        with self.assertRaises(Account.DoesNotExist):
+            balance_cache.get_account('UNKNOWN')
@@ -0,0 +1,79 @@
+import datetime
+from decimal import Decimal as D
+
+from django.test import TestCase
+from django.utils import timezone
+
+from freezegun import freeze_time
+from oscar_accounts import checkpoints
+from oscar_accounts.models import BalanceCheckpoint, Transfer
+from oscar_accounts.test_factories import AccountFactory
+
+
+def utc(*args):
+    return datetime.datetime(*args, tzinfo=timezone.utc)
+
+
+class TestBalanceCheckpoints(TestCase):
+
+    def setUp(self):
+        self.source = AccountFactory(primary_user=None, credit_limit=None)
+        self.account = AccountFactory()
+        for day, amount in ((1, '10.00'), (2, '20.00'), (3, '5.00')):
+            with freeze_time(utc(2019, 1, day, 12)):
+                Transfer.objects.create(self.source, self.account, D(amount))
+
+    def test_records_the_balance_of_each_account(self):
+        checkpoints.create_checkpoint(utc(2019, 1, 2))
+        self.assertEqual(D('10.00'), BalanceCheckpoint.objects.get(
+            account=self.account).balance)
+        self.assertEqual(D('-10.00'), BalanceCheckpoint.objects.get(
+            account=self.source).balance)
+
+    def test_builds_on_the_previous_checkpoint(self):
+        checkpoints.create_checkpoint(utc(2019, 1, 2))
+        checkpoints.create_checkpoint(utc(2019, 1, 3))
+        self.assertEqual(D('30.00'), BalanceCheckpoint.objects.get(
+            account=self.account, date=utc(2019, 1, 3)).balance)
+
+    def test_cannot_be_created_out_of_order(self):
+        checkpoints.create_checkpoint(utc(2019, 1, 3))
+        with self.assertRaises(ValueError):
+            checkpoints.create_checkpoint(utc(2019, 1, 2))
+
+    def test_gives_the_balance_at_a_date(self):
+        checkpoints.create_checkpoint(utc(2019, 1, 2))
+        # Make sure the checkpoint is used rather than the transactions
+        BalanceCheckpoint.objects.filter(account=self.account).update(
+            balance=D('100.00'))
+        self.assertEqual(D('120.00'), checkpoints.balance_at(
+            self.account, utc(2019, 1, 3)))
+        self.assertEqual(D('0.00'), checkpoints.balance_at(
+            self.account, utc(2019, 1, 1)))
+
+    def test_gives_the_balance_at_a_date_without_checkpoints(self):
+        self.assertEqual(D('30.00'), checkpoints.balance_at(
+            self.account, utc(2019, 1, 3)))
+
+    def test_creates_the_due_daily_checkpoints(self):
+        dates = checkpoints.create_due_checkpoints(
+            now=utc(2019, 1, 4, 8), interval=checkpoints.DAILY)
+        self.assertEqual(
+            [utc(2019, 1, 2), utc(2019, 1, 3), utc(2019, 1, 4)], dates)
+        self.assertEqual([], checkpoints.due_checkpoint_dates(
+            now=utc(2019, 1, 4, 20), interval=checkpoints.DAILY))
+
+    def test_waits_for_postings_at_the_boundary_to_settle(self):
+        dates = checkpoints.due_checkpoint_dates(
+            now=utc(2019, 1, 4, 0, 1), interval=checkpoints.DAILY)
+        self.assertEqual([utc(2019, 1, 2), utc(2019, 1, 3)], dates)
+        dates = checkpoints.due_checkpoint_dates(
+            now=utc(2019, 1, 4, 0, 10), interval=checkpoints.DAILY)
+        self.assertEqual(utc(2019, 1, 4), dates[-1])
+
+    def test_creates_the_due_monthly_checkpoints(self):
+        dates = checkpoints.create_due_checkpoints(
+            now=utc(2019, 3, 4), interval=checkpoints.MONTHLY)
+        self.assertEqual([utc(2019, 2, 1), utc(2019, 3, 1)], dates)
+        self.assertEqual(D('35.00'), BalanceCheckpoint.objects.get(
+            account=self.account, date=utc(2019, 3, 1)).balance)
@@ -3,6 +3,7 @@ import string
 from django.test import TestCase
 
 from oscar_accounts import codes
+from oscar_accounts.models import Account
 
 
 class TestCodeGeneration(TestCase):
@@ -23,3 +24,17 @@ class TestCodeGeneration(TestCase):
         code = codes.generate(chars=chars)
         for char in code:
             self.assertTrue(char in chars)
+
+
+class TestBulkCodeGeneration(TestCase):
+
+    def test_creates_distinct_codes(self):
+        generated = codes.generate_many(100, size=4)
+        self.assertEqual(100, len(set(generated)))
+        for code in generated:
+            self.assertEqual(4, len(code))
+
+    def test_skips_codes_that_are_taken(self):
+        # Only two codes of one character are possible
+        Account.objects.create(code='A')
+        self.assertEqual(['B'], codes.generate_many(1, size=1, chars='AB'))
@@ -0,0 +1,93 @@
+import csv
+import datetime
+import json
+from decimal import Decimal as D
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from freezegun import freeze_time
+from oscar_accounts import exports
+from oscar_accounts.models import Transfer
+from oscar_accounts.test_factories import AccountFactory
+
+
+def utc(*args):
+    return datetime.datetime(*args, tzinfo=timezone.utc)
+
+
+class TestExports(TestCase):
+
+    def setUp(self):
+        self.source = AccountFactory(
+            code='SOURCE', primary_user=None, credit_limit=None)
+        self.account = AccountFactory(code='GIFT')
+        for day, amount, order in ((1, '10.00', '100001'),
+                                   (2, '20.00', '100002'),
+                                   (3, '5.00', None)):
+            with freeze_time(utc(2019, 1, day, 12)):
+                Transfer.objects.create(
+                    self.source, self.account, D(amount),
+                    merchant_reference=order)
+
+    def read_csv(self, lines):
+        return list(csv.DictReader(StringIO(''.join(lines))))
+
+    def test_exports_transfers_as_csv(self):
+        rows = self.read_csv(exports.export_transfers(Transfer.objects.all()))
+        self.assertEqual(
+            ['10.00', '20.00', '5.00'], [row['amount'] for row in rows])
+        self.assertEqual('SOURCE', rows[0]['source'])
+        self.assertEqual('GIFT', rows[0]['destination'])
+        self.assertEqual('100001', rows[0]['merchant_reference'])
+
+    def test_exports_transactions_as_json_lines(self):
+        lines = list(exports.export_transactions(
+            self.account.transactions.all(), exports.JSONL))
+        rows = [json.loads(line) for line in lines]
+        self.assertEqual(
+            ['10.00', '20.00', '5.00'], [row['amount'] for row in rows])
+
+    def test_reads_related_objects_in_each_chunk_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            list(exports.export_transfers(
+                Transfer.objects.all(), chunk_size=1))
+        self.assertEqual(1, len(queries))
+
+    def test_filters_transfers_like_the_dashboard(self):
+        queryset = exports.filter_transfers(
+            Transfer.objects.all(), start_date=datetime.date(2019, 1, 2),
+            end_date=datetime.date(2019, 1, 2))
+        self.assertEqual([D('20.00')], [t.amount for t in queryset])
+        queryset = exports.filter_transfers(
+            Transfer.objects.all(), merchant_reference='100001')
+        self.assertEqual([D('10.00')], [t.amount for t in queryset])
+
+    def test_rejects_unknown_formats(self):
+        with self.assertRaises(ValueError):
+            exports.export_transfers(Transfer.objects.all(), 'xml')
+
+    def test_can_be_made_with_a_management_command(self):
+        out = StringIO()
+        call_command('export_transfers', '--start-date=2019-01-02',
+                     stdout=out)
+        rows = self.read_csv([out.getvalue()])
+        self.assertEqual(
+            ['20.00', '5.00'], [row['amount'] for row in rows])
+
+    def test_can_export_an_account_statement_with_a_command(self):
+        out = StringIO()
+        call_command('export_transfers', '--account=SOURCE', '--format=jsonl',
+                     stdout=out)
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(
+            ['-10.00', '-20.00', '-5.00'], [row['amount'] for row in rows])
+
+    def test_command_rejects_unknown_accounts(self):
+        with self.assertRaises(CommandError):
+            call_command('export_transfers', '--account=NOPE',
+                         stdout=StringIO())
@@ -96,6 +96,146 @@ class TestAnAnonymousTransaction(TestCase):
         facade.transfer(source, destination, D('1'))
 
 
+class TestTransferringInBulk(TestCase):
+
+    def setUp(self):
+        self.source = AccountFactory(credit_limit=None, primary_user=None)
+        self.destinations = [AccountFactory() for i in range(3)]
+
+    def legs(self, amount=D('10.00')):
+        return [{'source': self.source, 'destination': destination,
+                 'amount': amount, 'description': "Bulk load"}
+                for destination in self.destinations]
+
+    def test_creates_a_transfer_per_leg(self):
+        transfers = facade.transfer_many(self.legs())
+        self.assertEqual(3, len(transfers))
+        self.assertEqual(3, Transfer.objects.filter(
+            description="Bulk load").count())
+        self.assertEqual(6, Transaction.objects.all().count())
+
+    def test_returns_transfers_with_references(self):
+        transfers = facade.transfer_many(self.legs())
+        for transfer in transfers:
+            self.assertEqual(transfer, Transfer.objects.get(
+                reference=transfer.reference))
+
+    def test_updates_the_balances(self):
+        facade.transfer_many(self.legs())
+        self.assertEqual(D('-30.00'), self.source.balance)
+        self.assertEqual(D('-30.00'), Account.objects.get(
+            id=self.source.id).balance)
+        for destination in self.destinations:
+            self.assertEqual(D('10.00'), Account.objects.get(
+                id=destination.id).balance)
+
+    def test_checks_the_combined_debits_of_an_account(self):
+        customer = self.destinations[0]
+        facade.transfer(self.source, customer, D('15.00'))
+        legs = [{'source': customer, 'destination': destination,
+                 'amount': D('10.00')}
+                for destination in self.destinations[1:]]
+        with self.assertRaises(exceptions.InsufficientFunds):
+            facade.transfer_many(legs)
+        self.assertEqual(1, Transfer.objects.all().count())
+        self.assertEqual(D('15.00'), Account.objects.get(
+            id=customer.id).balance)
+
+    def test_writes_each_balance_once(self):
+        self.destinations = [AccountFactory() for i in range(10)]
+        # Savepoint, lock, 2 bulk inserts, reference lookup, a balance update
+        # for the source and one for all the destinations, and release
+        with self.assertNumQueries(8):
+            facade.transfer_many(self.legs())
+
+
+class TestASplitTransfer(TestCase):
+
+    def setUp(self):
+        bank = AccountFactory(primary_user=None, credit_limit=None)
+        self.sources = [AccountFactory(primary_user=None) for i in range(3)]
+        for source in self.sources:
+            facade.transfer(bank, source, D('10.00'))
+        self.destination = AccountFactory(primary_user=None)
+
+    def test_creates_a_transfer_per_source(self):
+        transfers = facade.split_transfer(
+            [(source, D('5.00')) for source in self.sources],
+            self.destination, merchant_reference="1234")
+        self.assertEqual(3, len(transfers))
+        self.assertEqual(3, Transfer.objects.filter(
+            merchant_reference="1234").count())
+        self.assertEqual(D('15.00'), Account.objects.get(
+            id=self.destination.id).balance)
+
+    def test_groups_the_legs(self):
+        transfers = facade.split_transfer(
+            [(source, D('5.00')) for source in self.sources],
+            self.destination)
+        self.assertEqual(
+            set(transfers), set(transfers[2].group()))
+        self.assertEqual(transfers[0].reference,
+                         Transfer.objects.get(
+                             id=transfers[1].id).group_reference)
+        # Ungrouped transfers are a group of their own
+        other = facade.transfer(self.sources[0], self.destination, D('1.00'))
+        self.assertEqual([other], list(other.group()))
+
+    def test_is_all_or_nothing(self):
+        amounts = [D('5.00'), D('5.00'), D('50.00')]
+        with self.assertRaises(exceptions.InsufficientFunds):
+            facade.split_transfer(list(zip(self.sources, amounts)),
+                                  self.destination)
+        self.assertEqual(D('0.00'), Account.objects.get(
+            id=self.destination.id).balance)
+        for source in self.sources:
+            self.assertEqual(D('10.00'), Account.objects.get(
+                id=source.id).balance)
+
+
+class TestATransferWithAnIdempotencyKey(TestCase):
+
+    def setUp(self):
+        self.source = AccountFactory(primary_user=None, credit_limit=None)
+        self.destination = AccountFactory(primary_user=None)
+        self.transfer = facade.transfer(self.source, self.destination,
+                                        D('10.00'), idempotency_key='abc')
+
+    def test_returns_the_original_transfer_when_replayed(self):
+        with self.assertNumQueries(1):
+            transfer = facade.transfer(self.source, self.destination,
+                                       D('10.00'), idempotency_key='abc')
+        self.assertEqual(self.transfer, transfer)
+        self.assertEqual(1, Transfer.objects.count())
+        self.assertEqual(D('10.00'), Account.objects.get(
+            id=self.destination.id).balance)
+
+    def test_describes_the_replayed_transfer_without_queries(self):
+        transfer = facade.transfer(self.source, self.destination,
+                                   D('10.00'), idempotency_key='abc')
+        with self.assertNumQueries(0):
+            transfer.as_dict()
+
+    def test_rejects_a_key_used_for_a_different_transfer(self):
+        with self.assertRaises(exceptions.IdempotencyKeyReused):
+            facade.transfer(self.source, self.destination, D('20.00'),
+                            idempotency_key='abc')
+
+    def test_returns_the_transfer_when_a_concurrent_request_posted_it(self):
+        # Simulate the other request posting between the lookup and insert
+        with mock.patch('oscar_accounts.abstract_models.PostingManager.replay',
+                        side_effect=[None, self.transfer]):
+            transfer = facade.transfer(self.source, self.destination,
+                                       D('10.00'), idempotency_key='abc')
+        self.assertEqual(self.transfer, transfer)
+        self.assertEqual(1, Transfer.objects.count())
+
+    def test_makes_a_new_transfer_for_a_new_key(self):
+        facade.transfer(self.source, self.destination, D('10.00'),
+                        idempotency_key='def')
+        self.assertEqual(2, Transfer.objects.count())
+
+
 class TestErrorHandling(TransactionTestCase):
 
     def tearDown(self):
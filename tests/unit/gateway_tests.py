@@ -0,0 +1,48 @@
+from decimal import Decimal as D
+
+from django.test import TestCase
+from oscar.apps.payment.exceptions import UnableToTakePayment
+from oscar.test.factories import UserFactory
+
+from oscar_accounts import core, facade
+from oscar_accounts.checkout import gateway
+from oscar_accounts.checkout.allocation import Allocations
+from oscar_accounts.models import Account, Transfer
+from oscar_accounts.setup import create_default_accounts
+from oscar_accounts.test_factories import AccountFactory
+
+
+class TestRedeemingAllocations(TestCase):
+
+    def setUp(self):
+        create_default_accounts()
+        self.user = UserFactory()
+        source = AccountFactory(primary_user=None, credit_limit=None)
+        self.accounts = [AccountFactory(code=code, primary_user=self.user)
+                         for code in ('AAAA', 'BBBB')]
+        for account in self.accounts:
+            facade.transfer(source, account, D('20.00'))
+        self.allocations = Allocations()
+        self.allocations.add('AAAA', D('15.00'))
+        self.allocations.add('BBBB', D('5.00'))
+
+    def test_posts_a_transfer_per_allocation(self):
+        transfers = gateway.redeem('100001', self.user, self.allocations)
+        self.assertEqual(2, len(transfers))
+        self.assertEqual(2, Transfer.objects.filter(
+            merchant_reference='100001').count())
+        self.assertEqual(D('20.00'), core.redemptions_account().balance)
+        self.assertEqual(set(transfers), set(transfers[0].group()))
+
+    def test_posts_nothing_if_any_allocation_is_invalid(self):
+        self.allocations.add('BBBB', D('25.00'))
+        with self.assertRaises(UnableToTakePayment):
+            gateway.redeem('100001', self.user, self.allocations)
+        self.assertEqual(0, Transfer.objects.filter(
+            merchant_reference='100001').count())
+        self.assertEqual(D('20.00'), Account.objects.get(code='AAAA').balance)
+
+    def test_rejects_an_unknown_account(self):
+        self.allocations.add('CCCC', D('5.00'))
+        with self.assertRaises(UnableToTakePayment):
+            gateway.redeem('100001', self.user, self.allocations)
@@ -0,0 +1,165 @@
+import datetime
+from decimal import Decimal as D
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from oscar.test.factories import UserFactory
+
+from oscar_accounts import checkpoints, names, report_cache
+from oscar_accounts.dashboard import reports
+from oscar_accounts.models import Account, AccountType, Transaction, Transfer
+from oscar_accounts.setup import create_default_accounts
+from oscar_accounts.test_factories import AccountFactory
+
+
+@skipUnless(connection.vendor == 'sqlite',
+            "Query plans are checked against SQLite")
+class TestLedgerQueriesUseIndexes(TestCase):
+
+    def setUp(self):
+        self.account = AccountFactory()
+        self.other = AccountFactory()
+        self.end = timezone.now()
+        self.start = self.end - datetime.timedelta(days=30)
+
+    def assertUsesIndex(self, name, queryset, sorts=False):
+        plan = queryset.explain()
+        self.assertIn(name, plan)
+        if not sorts:
+            # The index should also provide the ordering
+            self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_account_statement(self):
+        self.assertUsesIndex(
+            'accounts_txn_account_date',
+            self.account.transactions.all().order_by('-date_created'))
+
+    def test_transfers_between_accounts_over_a_date_range(self):
+        self.assertUsesIndex(
+            'accounts_transfer_src_dst_date',
+            self.account.source_transfers.filter(
+                destination=self.other, date_created__gte=self.start,
+                date_created__lt=self.end).order_by())
+
+    def test_transfer_list(self):
+        self.assertUsesIndex('accounts_transfer_date', Transfer.objects.all())
+
+    def test_transfer_list_filtered_by_date(self):
+        self.assertUsesIndex(
+            'accounts_transfer_date',
+            Transfer.objects.filter(date_created__gte=self.start))
+
+    def test_transfers_for_an_order(self):
+        self.assertUsesIndex(
+            'accounts_transfer_merchant_ref',
+            Transfer.objects.filter(merchant_reference='100001'), sorts=True)
+
+    def test_expired_open_accounts(self):
+        self.assertUsesIndex(
+            'accounts_account_status_end',
+            Account.expired.filter(status=Account.OPEN))
+
+
+@skipUnless(connection.vendor == 'sqlite',
+            "Query plans are checked against SQLite")
+class TestDashboardQueriesUseIndexes(TestCase):
+    """
+    Check the plans of the queries the dashboard views and reports actually
+    make
+    """
+
+    def setUp(self):
+        create_default_accounts()
+        bank = Account.objects.get(name=names.BANK)
+        redemptions = Account.objects.get(name=names.REDEMPTIONS)
+        self.account = Account.objects.create(
+            account_type=AccountType.objects.get(name='Test accounts'))
+        Transfer.objects.create(bank, self.account, D('10.00'))
+        Transfer.objects.create(self.account, redemptions, D('5.00'),
+                                merchant_reference='100001')
+        self.client.force_login(UserFactory(is_staff=True))
+        self.today = timezone.now().date()
+
+    def query_plans(self, model, run):
+        """
+        Call ``run`` and return the plan of each query it made that reads
+        from the table of the passed model
+        """
+        table = 'FROM "%s"' % model._meta.db_table
+        with CaptureQueriesContext(connection) as queries:
+            run()
+        plans = []
+        with connection.cursor() as cursor:
+            for query in queries.captured_queries:
+                if table in query['sql']:
+                    cursor.execute('EXPLAIN QUERY PLAN ' + query['sql'])
+                    plans.append(
+                        '\n'.join(row[-1] for row in cursor.fetchall()))
+        self.assertTrue(plans)
+        return plans
+
+    def assertSearches(self, model, plans):
+        # Each query looks rows up with an index rather than reading the
+        # whole table
+        for plan in plans:
+            self.assertNotIn('SCAN %s\n' % model._meta.db_table, plan + '\n')
+
+    def get(self, name, params=None, **kwargs):
+        response = self.client.get(
+            reverse('accounts_dashboard:%s' % name, kwargs=kwargs), params)
+        self.assertEqual(200, response.status_code)
+
+    def test_profit_and_loss_report(self):
+        plans = self.query_plans(Transfer, lambda: reports.run_report(
+            report_cache.PROFIT_LOSS, self.today - datetime.timedelta(
+                days=30), self.today))
+        self.assertSearches(Transfer, plans)
+        # The transfers to the redemptions and expired accounts, and from the
+        # redemptions account
+        self.assertEqual(2, sum('accounts_transfer_src_dst_date' in plan
+                                for plan in plans))
+
+    def test_deferred_income_report(self):
+        run = lambda: reports.run_report(
+            report_cache.DEFERRED_INCOME, end_date=self.today)
+        for plan in self.query_plans(Transaction, run):
+            self.assertIn('accounts_txn_account_date', plan)
+        # And from a checkpoint
+        checkpoints.create_checkpoint(
+            timezone.now() - datetime.timedelta(seconds=1))
+        for plan in self.query_plans(Transaction, run):
+            self.assertIn('accounts_txn_account_date', plan)
+
+    def test_transfer_list(self):
+        plans = self.query_plans(Transfer, lambda: self.get('transfers-list'))
+        for plan in plans:
+            self.assertIn('accounts_transfer_date', plan)
+            self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_transfer_list_filtered_by_date(self):
+        params = {'reference': '', 'merchant_reference': '',
+                  'start_date': self.today - datetime.timedelta(days=30),
+                  'end_date': self.today}
+        plans = self.query_plans(
+            Transfer, lambda: self.get('transfers-list', params))
+        for plan in plans:
+            self.assertIn('accounts_transfer_date', plan)
+            self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_transfer_list_filtered_by_order(self):
+        params = {'reference': '', 'merchant_reference': '100001'}
+        plans = self.query_plans(
+            Transfer, lambda: self.get('transfers-list', params))
+        self.assertSearches(Transfer, plans)
+        self.assertIn('accounts_transfer_merchant_ref', plans[0])
+
+    def test_account_statement(self):
+        plans = self.query_plans(Transaction, lambda: self.get(
+            'accounts-detail', pk=self.account.id))
+        for plan in plans:
+            self.assertIn('accounts_txn_account_date', plan)
+            self.assertNotIn('TEMP B-TREE', plan)
@@ -0,0 +1,110 @@
+import csv
+from decimal import Decimal as D
+from io import StringIO
+from unittest import mock
+
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+
+from oscar_accounts import codes, exceptions, exports, issuance, names
+from oscar_accounts.models import Account, AccountType, Transaction, Transfer
+from oscar_accounts.setup import create_default_accounts
+
+
+class TestIssuingAccounts(TestCase):
+
+    def setUp(self):
+        create_default_accounts()
+        self.bank = Account.objects.get(name=names.BANK)
+        self.account_type = AccountType.objects.get(name='Test accounts')
+
+    def issue(self, count=5, amount=D('20.00'), **kwargs):
+        return issuance.issue_accounts(
+            self.account_type, count, amount, self.bank, **kwargs)
+
+    def test_creates_accounts_with_distinct_codes(self):
+        accounts = self.issue(batch_size=2)
+        self.assertEqual(5, len(accounts))
+        self.assertEqual(5, len(set(account.code for account in accounts)))
+        for account in accounts:
+            self.assertEqual(account, Account.objects.get(code=account.code))
+            self.assertEqual(self.account_type, account.account_type)
+
+    def test_loads_each_account(self):
+        accounts = self.issue(batch_size=2)
+        for account in accounts:
+            self.assertEqual(D('20.00'), account.balance)
+            self.assertEqual(
+                D('20.00'), Account.objects.get(id=account.id).balance)
+            self.assertEqual(1, Transfer.objects.filter(
+                source=self.bank, destination=account).count())
+        self.assertEqual(D('-100.00'), Account.objects.get(
+            id=self.bank.id).balance)
+        self.assertEqual(10, Transaction.objects.filter(
+            transfer__destination__in=accounts).count())
+
+    def test_writes_a_batch_with_a_fixed_number_of_queries(self):
+        self.issue(count=1)
+        # Savepoint, code check, bulk insert (within its own savepoint) and
+        # lookup of the accounts, then the 9 queries of
+        # Transfer.objects.create_many
+        with self.assertNumQueries(15):
+            self.issue(count=50)
+
+    def test_generates_the_codes_again_if_one_is_taken_meanwhile(self):
+        taken = Account.objects.create(code='TAKEN')
+        generate_many = codes.generate_many
+        batches = [['TAKEN', 'FREE1']]
+
+        def generate_taken_code_first(count):
+            # As if the code was taken by a concurrent issuer after it was
+            # checked
+            return batches.pop() if batches else generate_many(count)
+
+        with mock.patch.object(codes, 'generate_many',
+                               generate_taken_code_first):
+            accounts = self.issue(count=2)
+        self.assertEqual(2, len(accounts))
+        self.assertNotIn(taken.code, [account.code for account in accounts])
+
+    def test_raises_an_exception_if_the_codes_keep_being_taken(self):
+        Account.objects.create(code='TAKEN')
+        with mock.patch.object(codes, 'generate_many',
+                               return_value=['TAKEN']):
+            with self.assertRaises(exceptions.AccountException):
+                self.issue(count=1)
+        self.assertEqual(1, Account.objects.filter(
+            code__isnull=False).count())
+
+    def test_issues_nothing_if_a_load_is_not_permitted(self):
+        self.bank.status = Account.CLOSED
+        self.bank.save()
+        with self.assertRaises(exceptions.AccountException):
+            self.issue(batch_size=2)
+        self.assertFalse(Account.objects.filter(
+            account_type=self.account_type).exists())
+
+    def test_lists_the_codes_as_csv(self):
+        accounts = self.issue(count=2)
+        lines = exports.csv_lines(
+            issuance.csv_rows(accounts, D('20.00')), issuance.CSV_FIELDS)
+        rows = list(csv.DictReader(StringIO(''.join(lines))))
+        self.assertEqual([account.code for account in accounts],
+                         [row['code'] for row in rows])
+        self.assertEqual(['20.00', '20.00'], [row['amount'] for row in rows])
+
+    def test_can_be_made_with_a_management_command(self):
+        out = StringIO()
+        call_command('issue_accounts', '--type=Test accounts', '--count=3',
+                     '--amount=15.00', '--end-date=2030-01-01', stdout=out)
+        rows = list(csv.DictReader(StringIO(out.getvalue())))
+        self.assertEqual(3, len(rows))
+        for row in rows:
+            account = Account.objects.get(code=row['code'])
+            self.assertEqual(D('15.00'), account.balance)
+            self.assertEqual(2030, account.end_date.year)
+
+    def test_command_rejects_unknown_account_types(self):
+        with self.assertRaises(CommandError):
+            call_command('issue_accounts', '--type=Nope', '--count=3',
+                         '--amount=15.00', stdout=StringIO())
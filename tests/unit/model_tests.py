@@ -82,6 +82,43 @@ class TestAnAccountWithFunds(TestCase):
         self.assertEqual(D('100.00'), amt)
 
 
+class TestSavingAnAccount(TestCase):
+
+    def setUp(self):
+        self.account = AccountFactory(primary_user=None)
+        source = AccountFactory(primary_user=None, credit_limit=None)
+        Transfer.objects.create(source, self.account, D('10.00'))
+        # A copy loaded before the transfer was made
+        self.stale = Account.objects.get(id=self.account.id)
+        self.stale.balance = D('0.00')
+
+    def test_recalculates_the_balance_by_default(self):
+        self.stale.save()
+        self.assertEqual(D('10.00'), self.stale.balance)
+
+    def test_leaves_the_balance_untouched_when_asked(self):
+        self.stale.description = "Updated"
+        with self.assertNumQueries(1):
+            self.stale.save(update_balance=False)
+        account = Account.objects.get(id=self.account.id)
+        self.assertEqual("Updated", account.description)
+        self.assertEqual(D('10.00'), account.balance)
+
+    def test_only_writes_the_passed_fields(self):
+        self.stale.status = Account.FROZEN
+        with self.assertNumQueries(1):
+            self.stale.save(update_fields=['status'])
+        account = Account.objects.get(id=self.account.id)
+        self.assertEqual(Account.FROZEN, account.status)
+        self.assertEqual(D('10.00'), account.balance)
+
+    def test_only_writes_the_status_when_closing(self):
+        account = AccountFactory(primary_user=None)
+        with self.assertNumQueries(1):
+            account.close()
+        self.assertTrue(Account.objects.get(id=account.id).is_closed())
+
+
 class TestAnAccountWithFundsButOnlyForProducts(TestCase):
 
     def setUp(self):
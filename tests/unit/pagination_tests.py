@@ -0,0 +1,61 @@
+import datetime
+from decimal import Decimal as D
+
+from django.test import TestCase
+from django.utils import timezone
+
+from freezegun import freeze_time
+from oscar_accounts import pagination
+from oscar_accounts.models import Transfer
+from oscar_accounts.test_factories import AccountFactory
+
+
+class TestKeysetPagination(TestCase):
+
+    def setUp(self):
+        source = AccountFactory(primary_user=None, credit_limit=None)
+        destination = AccountFactory()
+        now = timezone.now()
+        # Pairs of transfers share a timestamp, so ties are broken by ID
+        for i in range(7):
+            with freeze_time(now + datetime.timedelta(minutes=i // 2)):
+                Transfer.objects.create(source, destination, D('1.00'))
+        self.expected = list(Transfer.objects.order_by(
+            '-date_created', '-id').values_list('id', flat=True))
+        self.paginator = pagination.KeysetPaginator(
+            Transfer.objects.all(), 3)
+
+    def ids(self, page):
+        return [transfer.id for transfer in page]
+
+    def test_pages_forwards_newest_first(self):
+        pages = [self.paginator.page()]
+        while pages[-1].has_next():
+            pages.append(self.paginator.page(pages[-1].next_cursor))
+        self.assertEqual([3, 3, 1], [len(page) for page in pages])
+        self.assertEqual(self.expected, sum(map(self.ids, pages), []))
+        self.assertFalse(pages[0].has_previous())
+        self.assertTrue(pages[-1].has_previous())
+
+    def test_pages_backwards(self):
+        first = self.paginator.page()
+        second = self.paginator.page(first.next_cursor)
+        third = self.paginator.page(second.next_cursor)
+        back = self.paginator.page(third.previous_cursor)
+        self.assertEqual(self.ids(second), self.ids(back))
+        self.assertTrue(back.has_next())
+        back = self.paginator.page(back.previous_cursor)
+        self.assertEqual(self.ids(first), self.ids(back))
+        self.assertFalse(back.has_previous())
+
+    def test_rejects_invalid_cursors(self):
+        for cursor in ('nonsense', 'W10=', '¬'):
+            with self.assertRaises(pagination.InvalidCursor):
+                self.paginator.page(cursor)
+
+    def test_only_estimates_the_count_when_asked_to(self):
+        self.assertIsNone(self.paginator.estimated_count)
+        paginator = pagination.KeysetPaginator(
+            Transfer.objects.all(), 3, estimate_count=True)
+        # SQLite keeps no row estimates
+        self.assertIsNone(paginator.estimated_count)
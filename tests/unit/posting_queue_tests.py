@@ -0,0 +1,179 @@
+from decimal import Decimal as D
+from unittest import mock
+
+from django.db import IntegrityError
+from django.test import TestCase, TransactionTestCase
+
+from oscar_accounts import exceptions, facade, posting_queue
+from oscar_accounts.models import Account, PostingRequest, Transfer
+from oscar_accounts.test_factories import AccountFactory
+
+
+class TestThePostingQueue(TestCase):
+
+    def setUp(self):
+        self.source = AccountFactory(primary_user=None, credit_limit=None)
+        self.customer = AccountFactory(primary_user=None)
+
+    def test_posts_pending_requests_in_a_batch(self):
+        requests = [posting_queue.submit(self.source, self.customer, D('5.00'))
+                    for i in range(3)]
+        self.assertEqual(0, Transfer.objects.count())
+        self.assertEqual(3, posting_queue.drain())
+        self.assertEqual(3, Transfer.objects.count())
+        for request in requests:
+            request.refresh_from_db()
+            self.assertEqual(PostingRequest.POSTED, request.status)
+            self.assertIsNotNone(request.transfer)
+        self.assertEqual(D('15.00'), Account.objects.get(
+            id=self.customer.id).balance)
+
+    def test_fails_invalid_requests_without_affecting_the_batch(self):
+        other = AccountFactory()
+        posting_queue.submit(self.source, self.customer, D('5.00'))
+        invalid = posting_queue.submit(self.customer, other, D('10.00'))
+        posting_queue.submit(self.source, self.customer, D('5.00'))
+        posting_queue.drain()
+        invalid.refresh_from_db()
+        self.assertEqual(PostingRequest.FAILED, invalid.status)
+        self.assertEqual(2, Transfer.objects.count())
+
+    def test_fails_requests_that_raise_other_errors_on_their_own(self):
+        posting_queue.submit(self.source, self.customer, D('5.00'))
+        broken = posting_queue.submit(self.source, self.customer, D('6.00'))
+        create = Transfer.objects.create
+
+        def create_or_fail(source, destination, amount, *args, **kwargs):
+            if amount == D('6.00'):
+                raise IntegrityError("Broken")
+            return create(source, destination, amount, *args, **kwargs)
+
+        with mock.patch.object(Transfer.objects, 'create', create_or_fail):
+            self.assertEqual(2, posting_queue.drain())
+        broken.refresh_from_db()
+        self.assertEqual(PostingRequest.FAILED, broken.status)
+        self.assertEqual("Broken", broken.error)
+        self.assertEqual(1, Transfer.objects.count())
+        self.assertEqual(0, posting_queue.drain())
+
+    def test_locks_the_accounts_of_a_batch_before_posting_it(self):
+        other = AccountFactory(primary_user=None, credit_limit=None)
+        posting_queue.submit(other, self.customer, D('5.00'))
+        posting_queue.submit(self.source, self.customer, D('5.00'))
+        lock_accounts = Transfer.objects.lock_accounts
+        calls = []
+
+        def record_lock(accounts, debited=()):
+            calls.append(sorted(set(account.pk for account in accounts)))
+            return lock_accounts(accounts, debited)
+
+        with mock.patch.object(Transfer.objects, 'lock_accounts',
+                               record_lock):
+            posting_queue.drain()
+        # Before the first request is posted
+        self.assertEqual(
+            sorted([self.source.pk, other.pk, self.customer.pk]), calls[0])
+        self.assertEqual(3, len(calls))
+
+    def test_limits_the_size_of_a_batch(self):
+        for i in range(3):
+            posting_queue.submit(self.source, self.customer, D('5.00'))
+        self.assertEqual(2, posting_queue.drain(batch_size=2))
+        self.assertEqual(1, posting_queue.drain(batch_size=2))
+        self.assertEqual(0, posting_queue.drain(batch_size=2))
+
+    def test_returns_the_pending_request_for_a_retried_transfer(self):
+        first = posting_queue.submit(self.source, self.customer, D('5.00'),
+                                     idempotency_key='k1')
+        retried = posting_queue.submit(self.source, self.customer, D('5.00'),
+                                       idempotency_key='k1')
+        self.assertEqual(first, retried)
+        self.assertEqual(1, PostingRequest.objects.count())
+
+    def test_links_requests_sharing_an_idempotency_key_to_one_transfer(self):
+        # Eg retries submitted concurrently
+        requests = [PostingRequest.objects.create(
+            source=self.source, destination=self.customer, amount=D('5.00'),
+            idempotency_key='k1') for i in range(2)]
+        other = posting_queue.submit(self.source, self.customer, D('5.00'))
+        self.assertEqual(3, posting_queue.drain())
+        self.assertEqual(2, Transfer.objects.count())
+        for request in requests + [other]:
+            request.refresh_from_db()
+            self.assertEqual(PostingRequest.POSTED, request.status)
+        self.assertEqual(requests[0].transfer, requests[1].transfer)
+
+    def test_confirms_a_posted_transfer(self):
+        transfer = posting_queue.post(self.source, self.customer, D('5.00'),
+                                      description="Queued")
+        self.assertEqual("Queued", transfer.description)
+        self.assertEqual(D('5.00'), self.customer.balance)
+
+    def test_describes_a_posted_transfer_without_queries(self):
+        transfer = posting_queue.post(self.source, self.customer, D('5.00'))
+        with self.assertNumQueries(0):
+            transfer.as_dict()
+
+    def test_raises_an_exception_for_a_failed_transfer(self):
+        with self.assertRaises(exceptions.AccountException):
+            posting_queue.post(self.customer, self.source, D('5.00'))
+
+    def test_raises_the_same_exception_as_a_direct_transfer(self):
+        with self.assertRaises(exceptions.InsufficientFunds):
+            posting_queue.post(self.customer, self.source, D('5.00'))
+        self.customer.close()
+        with self.assertRaises(exceptions.ClosedAccount):
+            posting_queue.post(self.source, self.customer, D('5.00'))
+
+    def test_raises_an_exception_for_a_reused_idempotency_key(self):
+        # Eg a concurrent request with the same key got there first
+        request = posting_queue.submit(self.source, self.customer, D('5.00'),
+                                       idempotency_key='k1')
+        Transfer.objects.create(self.source, self.customer, D('6.00'),
+                                idempotency_key='k1')
+        with self.assertRaises(exceptions.IdempotencyKeyReused):
+            posting_queue.wait_for(request)
+
+    def test_times_out_when_a_request_is_not_processed(self):
+        request = posting_queue.submit(self.source, self.customer, D('5.00'))
+        with mock.patch.object(posting_queue, 'drain', return_value=0):
+            with self.assertRaises(exceptions.PostingTimeout):
+                posting_queue.wait_for(request, timeout=0.01)
+
+    def test_does_not_post_a_request_that_timed_out(self):
+        request = posting_queue.submit(self.source, self.customer, D('5.00'))
+        with mock.patch.object(posting_queue, 'drain', return_value=0):
+            with self.assertRaises(exceptions.PostingTimeout):
+                posting_queue.wait_for(request, timeout=0.01)
+        request.refresh_from_db()
+        self.assertEqual(PostingRequest.FAILED, request.status)
+        self.assertEqual(0, posting_queue.drain())
+        self.assertEqual(0, Transfer.objects.count())
+        with self.assertRaises(exceptions.PostingTimeout):
+            posting_queue.wait_for(request)
+
+    def test_returns_a_request_posted_as_it_times_out(self):
+        request = posting_queue.submit(self.source, self.customer, D('5.00'))
+        refresh = request.refresh_from_db
+        drain = posting_queue.drain
+
+        def refresh_then_post(*args, **kwargs):
+            refresh(*args, **kwargs)
+            # Posted by another process once the request has been read
+            drain()
+
+        with mock.patch.object(request, 'refresh_from_db', refresh_then_post), \
+                mock.patch.object(posting_queue, 'drain', return_value=0):
+            transfer = posting_queue.wait_for(request, timeout=0)
+        self.assertEqual(Transfer.objects.get(), transfer)
+
+
+@mock.patch.object(posting_queue, 'ENABLED', True)
+class TestTransferringWithGroupCommit(TransactionTestCase):
+
+    def test_goes_through_the_posting_queue(self):
+        source = AccountFactory(primary_user=None, credit_limit=None)
+        customer = AccountFactory(primary_user=None)
+        transfer = facade.transfer(source, customer, D('5.00'))
+        self.assertEqual(transfer, PostingRequest.objects.get().transfer)
+        self.assertEqual(D('5.00'), customer.balance)
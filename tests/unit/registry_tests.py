@@ -0,0 +1,133 @@
+from decimal import Decimal as D
+from unittest import mock
+
+from django.test import TestCase
+
+from oscar_accounts import core, facade, names, registry
+from oscar_accounts.models import Account, AccountType
+from oscar_accounts.setup import create_default_accounts
+from oscar_accounts.test_factories import AccountFactory
+
+
+class TestTheSystemAccountRegistry(TestCase):
+
+    def setUp(self):
+        create_default_accounts()
+        self.redemptions = Account.objects.get(name=names.REDEMPTIONS)
+
+    def test_looks_up_an_account_once(self):
+        core.redemptions_account()
+        with self.assertNumQueries(0):
+            account = core.redemptions_account()
+        self.assertEqual(self.redemptions.pk, account.pk)
+        self.assertEqual(names.REDEMPTIONS, account.name)
+
+    def test_loads_the_balance_when_it_is_used(self):
+        account = core.redemptions_account()
+        Account.objects.filter(pk=account.pk).update(balance=D('12.00'))
+        self.assertEqual(D('12.00'), account.balance)
+
+    def test_is_invalidated_when_an_account_is_saved(self):
+        core.redemptions_account()
+        self.redemptions.name = 'Old redemptions'
+        self.redemptions.save()
+        new = AccountFactory(name=names.REDEMPTIONS)
+        self.assertEqual(new.pk, core.redemptions_account().pk)
+
+    def test_is_invalidated_when_an_account_is_deleted(self):
+        core.redemptions_account()
+        self.redemptions.delete()
+        with self.assertRaises(Account.DoesNotExist):
+            core.redemptions_account()
+
+    def test_returns_handles_that_can_be_posted_to(self):
+        customer = AccountFactory(primary_user=None)
+        facade.transfer(core.bank_account(), customer, D('20.00'))
+        redemptions = core.redemptions_account()
+        facade.transfer(customer, redemptions, D('5.00'))
+        self.assertEqual(D('5.00'), redemptions.balance)
+        self.assertEqual(D('5.00'), Account.objects.get(
+            pk=redemptions.pk).balance)
+
+    def test_returns_the_primary_key_of_an_account(self):
+        self.assertEqual(self.redemptions.pk,
+                         registry.account_id(names.REDEMPTIONS))
+
+
+class TestTheAccountTypeTree(TestCase):
+
+    def setUp(self):
+        create_default_accounts()
+        self.deferred_income = AccountType.objects.get(
+            name=names.DEFERRED_INCOME)
+
+    def test_builds_full_names_without_queries(self):
+        child = self.deferred_income.get_children()[0]
+        registry.account_type(name=names.CASH)
+        with self.assertNumQueries(0):
+            full_name = child.full_name
+        self.assertEqual(
+            "Liabilities / Deferred income / %s" % child.name, full_name)
+
+    def test_looks_up_types_by_name_and_code(self):
+        self.deferred_income.code = 'DEFERRED'
+        self.deferred_income.save()
+        self.assertEqual(self.deferred_income.pk, registry.account_type(
+            name=names.DEFERRED_INCOME).pk)
+        self.assertEqual(self.deferred_income.pk, registry.account_type(
+            code='DEFERRED').pk)
+        with self.assertRaises(AccountType.DoesNotExist):
+            registry.account_type(name='Unknown')
+
+    def test_returns_children_in_tree_order(self):
+        self.assertEqual(
+            list(self.deferred_income.get_children()),
+            registry.account_type_children(self.deferred_income))
+
+    def test_is_invalidated_when_a_type_is_added(self):
+        registry.account_type_children(self.deferred_income)
+        child = self.deferred_income.add_child(name='Vouchers')
+        self.assertIn(child, registry.account_type_children(
+            self.deferred_income))
+
+    def test_is_invalidated_when_a_type_is_moved(self):
+        child = self.deferred_income.add_child(name='Vouchers')
+        self.assertTrue(child.full_name.endswith("Deferred income / Vouchers"))
+        child.move(AccountType.objects.get(name=names.ASSETS), 'last-child')
+        child = AccountType.objects.get(pk=child.pk)
+        self.assertEqual("Assets / Vouchers", child.full_name)
+
+    def test_is_rebuilt_when_another_process_changes_the_tree(self):
+        registry.account_type_children(self.deferred_income)
+        # Changed behind the cache, as by another process, which then bumps
+        # the generation once its change is committed
+        AccountType.objects.filter(pk=self.deferred_income.pk).update(
+            name='Gift cards')
+        self.assertEqual(self.deferred_income.pk, registry.account_type(
+            name=names.DEFERRED_INCOME).pk)
+        registry._bump_generation()
+        self.assertEqual(self.deferred_income.pk, registry.account_type(
+            name='Gift cards').pk)
+        with self.assertRaises(AccountType.DoesNotExist):
+            registry.account_type(name=names.DEFERRED_INCOME)
+
+    def test_bumps_the_generation_once_a_change_is_committed(self):
+        generation = registry._generation()
+        with mock.patch.object(registry.transaction, 'on_commit') as on_commit:
+            self.deferred_income.add_child(name='Vouchers')
+        on_commit.assert_called_with(registry._bump_generation)
+        self.assertEqual(generation, registry._generation())
+        on_commit.call_args[0][0]()
+        self.assertNotEqual(generation, registry._generation())
+
+
+@mock.patch.dict(names.STRIPED_ACCOUNTS, {'Redemptions': 4})
+class TestAStripedSystemAccountHandle(TestCase):
+
+    def test_reads_its_balance_from_the_shards(self):
+        create_default_accounts()
+        customer = AccountFactory(primary_user=None)
+        facade.transfer(core.bank_account(), customer, D('20.00'))
+        facade.transfer(customer, core.redemptions_account(), D('5.00'))
+        facade.transfer(customer, core.redemptions_account(), D('5.00'))
+        self.assertEqual(D('10.00'), core.redemptions_account().balance)
@@ -0,0 +1,115 @@
+import datetime
+from decimal import Decimal as D
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TransactionTestCase
+from django.utils import timezone
+
+from freezegun import freeze_time
+from oscar_accounts import checkpoints, names, registry, report_cache
+from oscar_accounts.dashboard import reports
+from oscar_accounts.models import Account, AccountType, Transfer
+from oscar_accounts.setup import create_default_accounts
+
+
+def utc(*args):
+    return datetime.datetime(*args, tzinfo=timezone.utc)
+
+
+@mock.patch.object(report_cache, 'ENABLED', True)
+class TestTheReportCache(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        registry.clear()
+        create_default_accounts()
+        self.bank = Account.objects.get(name=names.BANK)
+        self.account = Account.objects.create(
+            account_type=AccountType.objects.get(name='Test accounts'))
+        with freeze_time(utc(2019, 1, 10)):
+            Transfer.objects.create(self.bank, self.account, D('10.00'))
+
+    def profit_loss(self, start, end):
+        report = reports.ProfitLossReport(start, end)
+        return report_cache.get_or_run(
+            report_cache.PROFIT_LOSS, start, end, report.run)
+
+    def post_late(self, date, amount):
+        # A transfer dated in the past, as if it was committed after midnight
+        transfer = Transfer.objects.create(self.bank, self.account, amount)
+        Transfer.objects.filter(id=transfer.id).update(date_created=date)
+        transfer.refresh_from_db()
+        report_cache._transfers_posted(Transfer, [transfer])
+
+    @freeze_time(utc(2019, 2, 1, 12))
+    def test_serves_past_ranges_without_queries(self):
+        self.profit_loss(utc(2019, 1, 1), utc(2019, 2, 1))
+        with self.assertNumQueries(0):
+            data = self.profit_loss(utc(2019, 1, 1), utc(2019, 2, 1))
+        self.assertEqual(D('10.00'), data['cash_total'])
+
+    @freeze_time(utc(2019, 2, 1, 12))
+    def test_keeps_past_ranges_when_postings_are_made_today(self):
+        self.profit_loss(utc(2019, 1, 1), utc(2019, 2, 1))
+        Transfer.objects.create(self.bank, self.account, D('5.00'))
+        with self.assertNumQueries(0):
+            data = self.profit_loss(utc(2019, 1, 1), utc(2019, 2, 1))
+        self.assertEqual(D('10.00'), data['cash_total'])
+
+    @freeze_time(utc(2019, 2, 1, 12))
+    def test_recalculates_past_ranges_touched_by_a_late_posting(self):
+        self.profit_loss(utc(2019, 1, 1), utc(2019, 1, 20))
+        self.profit_loss(utc(2019, 1, 20), utc(2019, 2, 1))
+        self.post_late(utc(2019, 1, 31, 23, 59), D('5.00'))
+        with self.assertNumQueries(0):
+            data = self.profit_loss(utc(2019, 1, 1), utc(2019, 1, 20))
+        self.assertEqual(D('10.00'), data['cash_total'])
+        data = self.profit_loss(utc(2019, 1, 20), utc(2019, 2, 1))
+        self.assertEqual(D('5.00'), data['cash_total'])
+
+    @freeze_time(utc(2019, 2, 10, 12))
+    def test_treats_ranges_ending_before_today_as_past(self):
+        # As with ACCOUNTS_CHECKPOINT_INTERVAL = 'monthly'
+        with mock.patch.object(checkpoints.period_start, '__defaults__',
+                               (checkpoints.MONTHLY,)):
+            self.profit_loss(utc(2019, 1, 1), utc(2019, 2, 5))
+            self.post_late(utc(2019, 2, 4, 12), D('5.00'))
+            data = self.profit_loss(utc(2019, 1, 1), utc(2019, 2, 5))
+        self.assertEqual(D('15.00'), data['cash_total'])
+
+    def test_expires_ranges_including_today(self):
+        with freeze_time(utc(2019, 1, 10, 12)):
+            self.profit_loss(utc(2019, 1, 1), utc(2019, 1, 11))
+            Transfer.objects.create(self.bank, self.account, D('5.00'))
+            with self.assertNumQueries(0):
+                data = self.profit_loss(utc(2019, 1, 1), utc(2019, 1, 11))
+            self.assertEqual(D('10.00'), data['cash_total'])
+        later = utc(2019, 1, 10, 12) + datetime.timedelta(
+            seconds=report_cache.TIMEOUT + 1)
+        with freeze_time(later):
+            data = self.profit_loss(utc(2019, 1, 1), utc(2019, 1, 11))
+        self.assertEqual(D('15.00'), data['cash_total'])
+
+    @freeze_time(utc(2019, 2, 1, 12))
+    def test_recalculates_the_deferred_income_report_for_new_accounts(self):
+        report = reports.DeferredIncomeReport(utc(2019, 1, 20))
+        report_cache.get_or_run(
+            report_cache.DEFERRED_INCOME, None, utc(2019, 1, 20), report.run)
+        self.profit_loss(utc(2019, 1, 1), utc(2019, 2, 1))
+        Account.objects.create(
+            account_type=AccountType.objects.get(name='Test accounts'))
+        data = report_cache.get_or_run(
+            report_cache.DEFERRED_INCOME, None, utc(2019, 1, 20), report.run)
+        self.assertEqual(2, data['totals']['num_accounts'])
+        with self.assertNumQueries(0):
+            self.profit_loss(utc(2019, 1, 1), utc(2019, 2, 1))
+
+    @freeze_time(utc(2019, 2, 1, 12))
+    def test_does_nothing_when_disabled(self):
+        with mock.patch.object(report_cache, 'ENABLED', False):
+            self.profit_loss(utc(2019, 1, 1), utc(2019, 2, 1))
+            Transfer.objects.filter(amount=D('10.00')).update(
+                amount=D('20.00'))
+            data = self.profit_loss(utc(2019, 1, 1), utc(2019, 2, 1))
+        self.assertEqual(D('20.00'), data['cash_total'])
@@ -0,0 +1,156 @@
+import datetime
+from decimal import Decimal as D
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from oscar_accounts import names, registry, report_cache, report_jobs
+from oscar_accounts.dashboard import reports
+from oscar_accounts.models import Account, AccountType, ReportJob, Transfer
+from oscar_accounts.setup import create_default_accounts
+
+
+class TestTheResultEncoding(TestCase):
+
+    def test_round_trips_decimals(self):
+        result = {'rows': [{'name': 'Test', 'total': D('10.50')}],
+                  'total': D('0.00'), 'num': 3}
+        decoded = report_jobs.decode_result(report_jobs.encode_result(result))
+        self.assertEqual(result, decoded)
+        self.assertIsInstance(decoded['rows'][0]['total'], D)
+
+
+@mock.patch.object(report_jobs, 'WORKERS', 0)
+class TestAReportJob(TestCase):
+
+    def setUp(self):
+        registry.clear()
+        create_default_accounts()
+        bank = Account.objects.get(name=names.BANK)
+        account = Account.objects.create(
+            account_type=AccountType.objects.get(name='Test accounts'))
+        Transfer.objects.create(bank, account, D('10.00'))
+        self.today = datetime.date.today()
+
+    def test_stores_the_results_of_the_report(self):
+        job = report_jobs.submit(
+            report_cache.PROFIT_LOSS, self.today, self.today)
+        self.assertEqual(ReportJob.PENDING, job.status)
+        self.assertTrue(report_jobs.run_job(job.id))
+
+        job.refresh_from_db()
+        self.assertEqual(ReportJob.COMPLETE, job.status)
+        self.assertEqual(100, job.progress)
+        self.assertIsNotNone(job.date_finished)
+        expected = reports.run_report(
+            report_cache.PROFIT_LOSS, self.today, self.today)
+        self.assertEqual(expected, report_jobs.decode_result(job.result))
+
+    def test_is_only_run_once(self):
+        job = report_jobs.submit(
+            report_cache.DEFERRED_INCOME, end_date=self.today)
+        self.assertTrue(report_jobs.run_job(job.id))
+        self.assertFalse(report_jobs.run_job(job.id))
+        self.assertFalse(report_jobs.claim(job.id))
+
+    def test_records_errors(self):
+        job = report_jobs.submit('unknown', end_date=self.today)
+        report_jobs.run_job(job.id)
+        job.refresh_from_db()
+        self.assertEqual(ReportJob.FAILED, job.status)
+        self.assertIn('unknown', job.error)
+        self.assertTrue(job.is_finished())
+
+    def test_pending_jobs_are_run_by_the_command(self):
+        jobs = [report_jobs.submit(report_cache.DEFERRED_INCOME,
+                                   end_date=self.today) for i in range(2)]
+        call_command('run_report_jobs', once=True)
+        for job in jobs:
+            job.refresh_from_db()
+            self.assertEqual(ReportJob.COMPLETE, job.status)
+
+    def test_is_failed_once_it_has_been_running_too_long(self):
+        job = report_jobs.submit(
+            report_cache.DEFERRED_INCOME, end_date=self.today)
+        report_jobs.claim(job.id)
+        ReportJob.objects.filter(id=job.id).update(
+            date_started=timezone.now() - datetime.timedelta(
+                seconds=report_jobs.TIMEOUT + 1))
+        self.assertEqual(0, report_jobs.run_pending_jobs())
+        job.refresh_from_db()
+        self.assertEqual(ReportJob.FAILED, job.status)
+        self.assertIn("didn't finish", job.error)
+
+    def test_is_failed_once_it_has_been_pending_too_long(self):
+        job = report_jobs.submit(
+            report_cache.DEFERRED_INCOME, end_date=self.today)
+        ReportJob.objects.filter(id=job.id).update(
+            date_created=timezone.now() - datetime.timedelta(
+                seconds=report_jobs.TIMEOUT + 1))
+        self.assertEqual(1, report_jobs.fail_stale_jobs())
+        job.refresh_from_db()
+        self.assertEqual(ReportJob.FAILED, job.status)
+        self.assertIn("wasn't started", job.error)
+
+    def test_stays_failed_if_failed_while_running(self):
+        job = report_jobs.submit(
+            report_cache.DEFERRED_INCOME, end_date=self.today)
+
+        def run_too_long(*args, **kwargs):
+            # As if failed as stale by another process meanwhile
+            ReportJob.objects.filter(id=job.id).update(
+                status=ReportJob.FAILED, error="Too long")
+            return {}
+
+        with mock.patch.object(reports, 'run_report', run_too_long):
+            self.assertTrue(report_jobs.run_job(job.id))
+        job.refresh_from_db()
+        self.assertEqual(ReportJob.FAILED, job.status)
+        self.assertEqual("Too long", job.error)
+        self.assertEqual('', job.result)
+
+    def test_worker_threads_run_jobs_left_pending_by_other_processes(self):
+        # Eg handed to the workers of a process that was then restarted
+        orphan = report_jobs.submit(
+            report_cache.DEFERRED_INCOME, end_date=self.today)
+        job = report_jobs.submit(
+            report_cache.DEFERRED_INCOME, end_date=self.today)
+        with mock.patch.object(report_jobs, 'connection'):
+            report_jobs._run_in_thread(job.id)
+        for job in (orphan, job):
+            job.refresh_from_db()
+            self.assertEqual(ReportJob.COMPLETE, job.status)
+
+    def test_is_not_failed_while_running_within_the_timeout(self):
+        job = report_jobs.submit(
+            report_cache.DEFERRED_INCOME, end_date=self.today)
+        report_jobs.claim(job.id)
+        self.assertEqual(0, report_jobs.fail_stale_jobs())
+        job.refresh_from_db()
+        self.assertEqual(ReportJob.RUNNING, job.status)
+
+    def test_can_be_exported_as_csv(self):
+        job = report_jobs.submit(
+            report_cache.DEFERRED_INCOME, end_date=self.today)
+        report_jobs.run_job(job.id)
+        job.refresh_from_db()
+        header, rows = reports.csv_rows(
+            job.report, report_jobs.decode_result(job.result))
+        self.assertEqual(['account_type', 'total', 'num_accounts'],
+                         header[:3])
+        self.assertEqual(['', '10.00', 1], rows[-1])
+
+
+class TestSubmittingAReportJob(TransactionTestCase):
+
+    def test_hands_it_to_the_workers_once_committed(self):
+        executor = mock.Mock()
+        with mock.patch.object(report_jobs, 'WORKERS', 1), \
+                mock.patch.object(report_jobs, '_get_executor',
+                                  return_value=executor):
+            job = report_jobs.submit(
+                report_cache.DEFERRED_INCOME, end_date=datetime.date.today())
+        executor.submit.assert_called_once_with(
+            report_jobs._run_in_thread, job.id)
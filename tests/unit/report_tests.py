@@ -0,0 +1,172 @@
+import datetime
+from decimal import Decimal as D
+
+from django.test import TestCase
+from django.utils import timezone
+
+from freezegun import freeze_time
+from oscar_accounts import checkpoints, names, registry
+from oscar_accounts.dashboard import reports
+from oscar_accounts.models import Account, AccountType, Transfer
+from oscar_accounts.setup import create_default_accounts
+
+
+def utc(*args):
+    return datetime.datetime(*args, tzinfo=timezone.utc)
+
+
+def bucket(days_remaining):
+    if days_remaining is None:
+        return 'open_ended'
+    if days_remaining <= 30:
+        return 'expiring_within_30'
+    if days_remaining <= 60:
+        return 'expiring_within_60'
+    if days_remaining <= 90:
+        return 'expiring_within_90'
+    return 'expiring_outside_90'
+
+
+class TestDeferredIncomeReport(TestCase):
+
+    def setUp(self):
+        create_default_accounts()
+        self.threshold = utc(2019, 3, 1)
+        self.bank = Account.objects.get(name=names.BANK)
+        acc_type = AccountType.objects.get(name='Test accounts')
+        # Either side of each bucket boundary, plus expired and open-ended
+        # accounts
+        ends = [None, utc(2019, 1, 1), self.threshold]
+        for days in (30, 31, 60, 61, 90, 91, 400):
+            ends.append(self.threshold + datetime.timedelta(days=days))
+            ends.append(self.threshold + datetime.timedelta(
+                days=days, seconds=-1))
+        for i, end_date in enumerate(ends):
+            account = Account.objects.create(
+                account_type=acc_type, end_date=end_date)
+            with freeze_time(utc(2019, 1, 10)):
+                Transfer.objects.create(self.bank, account, D('10.00') + i)
+            with freeze_time(utc(2019, 2, 10)):
+                Transfer.objects.create(account, self.bank, D('1.50'))
+            with freeze_time(utc(2019, 3, 10)):
+                # After the threshold, so not counted
+                Transfer.objects.create(self.bank, account, D('100.00'))
+
+    def expected_row(self):
+        # The balances as the report used to calculate them, account by
+        # account
+        acc_type = registry.account_type(name='Test accounts')
+        accounts = list(acc_type.accounts.all())
+        balances = checkpoints.balances_at(accounts, self.threshold)
+        row = {'total': D('0.00'), 'num_accounts': len(accounts)}
+        for account in accounts:
+            name = bucket(account.days_remaining(self.threshold))
+            row['total'] += balances[account.id]
+            row['num_' + name] = row.get('num_' + name, 0) + 1
+            row['total_' + name] = row.get(
+                'total_' + name, D('0.00')) + balances[account.id]
+        return row
+
+    def assertMatchesThePerAccountCalculation(self):
+        rows = reports.DeferredIncomeReport(self.threshold).run()['rows']
+        row = dict(rows[0])
+        del row['name']
+        expected = self.expected_row()
+        for key, value in row.items():
+            self.assertEqual(expected.get(key, 0), value, key)
+
+    def test_matches_the_per_account_calculation(self):
+        self.assertMatchesThePerAccountCalculation()
+
+    def test_matches_the_per_account_calculation_from_a_checkpoint(self):
+        checkpoints.create_checkpoint(utc(2019, 2, 1))
+        self.assertMatchesThePerAccountCalculation()
+
+    def test_runs_one_query_for_the_balances(self):
+        report = reports.DeferredIncomeReport(self.threshold)
+        report.run()
+        # One query for the latest checkpoint and one for the totals, once
+        # the account types are cached
+        with self.assertNumQueries(2):
+            report.run()
+
+    def test_includes_account_types_without_accounts(self):
+        Account.objects.all().delete()
+        data = reports.DeferredIncomeReport(self.threshold).run()
+        self.assertEqual(D('0.00'), data['rows'][0]['total'])
+        self.assertEqual(0, data['rows'][0]['num_open_ended'])
+        self.assertEqual(0, data['totals']['num_accounts'])
+
+
+class TestProfitLossReport(TestCase):
+
+    def setUp(self):
+        create_default_accounts()
+        self.start, self.end = utc(2019, 2, 1), utc(2019, 3, 1)
+        bank = Account.objects.get(name=names.BANK)
+        unpaid = Account.objects.get(name=names.UNPAID_ACCOUNTS[0])
+        redemptions = Account.objects.get(name=names.REDEMPTIONS)
+        lapsed = Account.objects.get(name=names.LAPSED)
+        acc_type = AccountType.objects.get(name='Test accounts')
+        for i, day in enumerate((1, 15, 28)):
+            with freeze_time(utc(2019, 1 + i, day)):
+                # Only the transfers made in February are counted
+                for source in (bank, unpaid):
+                    account = Account.objects.create(account_type=acc_type)
+                    Transfer.objects.create(source, account, D('50.00') + i)
+                    Transfer.objects.create(account, redemptions, D('20.00'))
+                    Transfer.objects.create(redemptions, account, D('5.00'))
+                    Transfer.objects.create(account, lapsed, D('7.00') + i)
+
+    def expected(self):
+        # The totals as the report used to calculate them, account by
+        # account
+        def total(qs):
+            return sum((t.amount for t in qs.filter(
+                date_created__gte=self.start, date_created__lt=self.end)),
+                D('0.00'))
+
+        expected = {}
+        for key, type_name in (('cash', names.CASH),
+                               ('unpaid', names.UNPAID_ACCOUNT_TYPE)):
+            accounts = AccountType.objects.get(name=type_name).accounts.all()
+            expected[key + '_rows'] = [
+                {'name': account.name,
+                 'total': total(account.source_transfers.all())}
+                for account in accounts]
+        redemptions = Account.objects.get(name=names.REDEMPTIONS)
+        lapsed = Account.objects.get(name=names.LAPSED)
+        children = AccountType.objects.get(
+            name=names.DEFERRED_INCOME).get_children()
+        for key in ('redeem', 'closure', 'refund'):
+            expected[key + '_rows'] = []
+        for child in children:
+            accounts = child.accounts.all()
+            expected['redeem_rows'].append({'name': child.name, 'total': sum(
+                (total(a.source_transfers.filter(destination=redemptions))
+                 for a in accounts), D('0.00'))})
+            expected['closure_rows'].append({'name': child.name, 'total': sum(
+                (total(a.source_transfers.filter(destination=lapsed))
+                 for a in accounts), D('0.00'))})
+            expected['refund_rows'].append({'name': child.name, 'total': sum(
+                (total(redemptions.source_transfers.filter(destination=a))
+                 for a in accounts), D('0.00'))})
+        return expected
+
+    def test_matches_the_per_account_calculation(self):
+        data = reports.ProfitLossReport(self.start, self.end).run()
+        for key, rows in self.expected().items():
+            self.assertEqual(rows, data[key], key)
+        self.assertEqual(D('112.00'), data['increase_total'])
+        self.assertEqual(D('56.00'), data['reduction_total'])
+
+    def test_runs_a_fixed_number_of_queries(self):
+        report = reports.ProfitLossReport(self.start, self.end)
+        report.run()
+        acc_type = AccountType.objects.get(name='Test accounts')
+        for i in range(5):
+            Account.objects.create(account_type=acc_type)
+        # Two queries for each of the cash and unpaid sections and two for
+        # the deferred income accounts
+        with self.assertNumQueries(6):
+            report.run()
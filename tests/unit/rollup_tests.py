@@ -0,0 +1,182 @@
+import datetime
+from decimal import Decimal as D
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from freezegun import freeze_time
+from oscar_accounts import checkpoints, names, rollups
+from oscar_accounts.dashboard import reports
+from oscar_accounts.models import (
+    Account, AccountType, DailyFlow, DailyMovement, RollupDay, Transfer)
+from oscar_accounts.setup import create_default_accounts
+from oscar_accounts.test_factories import AccountFactory
+
+
+def utc(*args):
+    return datetime.datetime(*args, tzinfo=timezone.utc)
+
+
+@mock.patch.object(rollups, 'ENABLED', True)
+class TestRollups(TestCase):
+
+    def setUp(self):
+        self.source = AccountFactory(primary_user=None, credit_limit=None)
+        self.account = AccountFactory()
+        for day, hour, amount in ((1, 10, '10.00'), (1, 20, '20.00'),
+                                  (3, 12, '5.00')):
+            with freeze_time(utc(2019, 1, day, hour)):
+                Transfer.objects.create(self.source, self.account, D(amount))
+
+    def test_rolls_up_the_days_that_are_over(self):
+        days = rollups.create_due_rollups(now=utc(2019, 1, 3, 12))
+        self.assertEqual([datetime.date(2019, 1, 1),
+                          datetime.date(2019, 1, 2)], days)
+        flow = DailyFlow.objects.get(date=datetime.date(2019, 1, 1))
+        self.assertEqual(
+            (self.source.id, self.account.id, D('30.00'), 2),
+            (flow.source_id, flow.destination_id, flow.total,
+             flow.num_transfers))
+        movement = DailyMovement.objects.get(
+            date=datetime.date(2019, 1, 1), account=self.source)
+        self.assertEqual(D('-30.00'), movement.total)
+        self.assertFalse(DailyFlow.objects.filter(
+            date=datetime.date(2019, 1, 2)).exists())
+
+    def test_waits_for_postings_made_at_midnight_to_settle(self):
+        days = rollups.create_due_rollups(now=utc(2019, 1, 2, 0, 1))
+        self.assertEqual([], days)
+
+    def test_are_updated_by_postings_dated_in_a_rolled_up_day(self):
+        rollups.create_due_rollups(now=utc(2019, 1, 3, 12))
+        # As if posted just before midnight and committed after the day was
+        # rolled up
+        with freeze_time(utc(2019, 1, 3, 12)):
+            late = Transfer.objects.create(
+                self.source, self.account, D('2.00'))
+        Transfer.objects.filter(id=late.id).update(
+            date_created=utc(2019, 1, 2, 23, 59))
+        late.refresh_from_db()
+        with freeze_time(utc(2019, 1, 3, 12)):
+            rollups.add_transfers([late])
+        flow = DailyFlow.objects.get(date=datetime.date(2019, 1, 2))
+        self.assertEqual((D('2.00'), 1), (flow.total, flow.num_transfers))
+        movement = DailyMovement.objects.get(
+            date=datetime.date(2019, 1, 2), account=self.account)
+        self.assertEqual(D('2.00'), movement.total)
+
+    def test_ignores_postings_dated_today(self):
+        rollups.create_due_rollups(now=utc(2019, 1, 3, 12))
+        with freeze_time(utc(2019, 1, 3, 13)):
+            with mock.patch.object(rollups, 'add_transfers') as add:
+                transfer = Transfer.objects.create(
+                    self.source, self.account, D('2.00'))
+            add.assert_called_once_with([transfer])
+            with self.assertNumQueries(0):
+                rollups.add_transfers([transfer])
+
+    def test_splits_ranges_into_rolled_up_days_and_the_rest(self):
+        rollups.create_due_rollups(now=utc(2019, 1, 3, 12))
+        days, rest = rollups.split_range(
+            utc(2018, 12, 31, 12), utc(2019, 1, 4))
+        self.assertEqual(
+            (datetime.date(2019, 1, 1), datetime.date(2019, 1, 3)), days)
+        self.assertEqual([(utc(2018, 12, 31, 12), utc(2019, 1, 1)),
+                          (utc(2019, 1, 3), utc(2019, 1, 4))], rest)
+
+    def test_are_made_daily_whatever_the_checkpoint_interval(self):
+        # As with ACCOUNTS_CHECKPOINT_INTERVAL = 'monthly'
+        with mock.patch.object(checkpoints.period_start, '__defaults__',
+                               (checkpoints.MONTHLY,)):
+            days = rollups.create_due_rollups(now=utc(2019, 1, 4, 12))
+            self.assertEqual(3, len(days))
+            days, rest = rollups.split_range(
+                utc(2019, 1, 2, 12), utc(2019, 1, 4))
+        self.assertEqual(
+            (datetime.date(2019, 1, 3), datetime.date(2019, 1, 4)), days)
+        self.assertEqual([(utc(2019, 1, 2, 12), utc(2019, 1, 3))], rest)
+
+    def test_are_not_used_when_disabled(self):
+        rollups.create_due_rollups(now=utc(2019, 1, 3, 12))
+        with mock.patch.object(rollups, 'ENABLED', False):
+            days, rest = rollups.split_range(utc(2019, 1, 1), utc(2019, 1, 4))
+        self.assertIsNone(days)
+
+    def test_can_be_made_with_a_management_command(self):
+        with freeze_time(utc(2019, 1, 3, 12)):
+            call_command('update_rollups', stdout=StringIO())
+            self.assertEqual(2, RollupDay.objects.count())
+            DailyFlow.objects.all().delete()
+            call_command('update_rollups', '--rebuild-from=2019-01-01',
+                         stdout=StringIO())
+        self.assertEqual(1, DailyFlow.objects.count())
+
+
+@mock.patch.object(rollups, 'ENABLED', True)
+class TestReportsFromRollups(TestCase):
+
+    def setUp(self):
+        create_default_accounts()
+        bank = Account.objects.get(name=names.BANK)
+        redemptions = Account.objects.get(name=names.REDEMPTIONS)
+        lapsed = Account.objects.get(name=names.LAPSED)
+        acc_type = AccountType.objects.get(name='Test accounts')
+        for day, hour, amount in ((1, 9, '10.00'), (2, 18, '20.00'),
+                                  (3, 11, '40.00'), (4, 8, '80.00')):
+            with freeze_time(utc(2019, 1, day, hour)):
+                account = Account.objects.create(
+                    account_type=acc_type,
+                    end_date=utc(2019, 1, 10) if day % 2 else None)
+                Transfer.objects.create(bank, account, D(amount))
+                Transfer.objects.create(account, redemptions, D('3.00'))
+                Transfer.objects.create(redemptions, account, D('1.00'))
+                Transfer.objects.create(account, lapsed, D('2.00'))
+        rollups.create_due_rollups(now=utc(2019, 1, 4, 12))
+
+    def assertSameWithoutRollups(self, run):
+        with_rollups = run()
+        with mock.patch.object(rollups, 'ENABLED', False):
+            without_rollups = run()
+        self.assertEqual(without_rollups, with_rollups)
+
+    def test_answer_the_profit_and_loss_report(self):
+        for start, end in ((utc(2019, 1, 1), utc(2019, 1, 5)),
+                           (utc(2019, 1, 1, 12), utc(2019, 1, 3, 12)),
+                           (datetime.date(2019, 1, 2),
+                            datetime.date(2019, 1, 4))):
+            self.assertSameWithoutRollups(
+                reports.ProfitLossReport(start, end).run)
+
+    def test_answer_the_deferred_income_report(self):
+        for threshold in (utc(2019, 1, 2), utc(2019, 1, 3, 12),
+                          utc(2019, 1, 5)):
+            self.assertSameWithoutRollups(
+                reports.DeferredIncomeReport(threshold).run)
+
+    def test_are_used_for_the_days_rolled_up(self):
+        DailyFlow.objects.filter(date=datetime.date(2019, 1, 1)).update(
+            total=D('1000.00'))
+        data = reports.ProfitLossReport(utc(2019, 1, 1), utc(2019, 1, 2)).run()
+        self.assertEqual(D('1000.00'), data['cash_total'])
+
+    def test_answer_the_deferred_income_report_from_a_checkpoint(self):
+        # Including checkpoints taken during a day
+        for date in (utc(2019, 1, 1, 12), utc(2019, 1, 2),
+                     utc(2019, 1, 3, 6)):
+            checkpoints.create_checkpoint(date)
+            for threshold in (utc(2019, 1, 2, 12), utc(2019, 1, 3, 12),
+                              utc(2019, 1, 5)):
+                self.assertSameWithoutRollups(
+                    reports.DeferredIncomeReport(threshold).run)
+
+    def test_start_balances_from_the_latest_checkpoint(self):
+        checkpoints.create_checkpoint(utc(2019, 1, 2))
+        expected = reports.DeferredIncomeReport(utc(2019, 1, 5)).run()
+        # Movements before the checkpoint aren't read
+        DailyMovement.objects.filter(date=datetime.date(2019, 1, 1)).update(
+            total=D('1000.00'))
+        self.assertEqual(
+            expected, reports.DeferredIncomeReport(utc(2019, 1, 5)).run())
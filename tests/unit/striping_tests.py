@@ -0,0 +1,94 @@
+from decimal import Decimal as D
+from unittest import mock
+
+from django.test import TestCase
+
+from oscar_accounts import core, exceptions, facade, names, registry
+from oscar_accounts.models import Account, Transfer
+from oscar_accounts.test_factories import AccountFactory
+
+
+@mock.patch.dict(names.STRIPED_ACCOUNTS, {'Redemptions': 4})
+class TestAStripedAccount(TestCase):
+
+    def setUp(self):
+        self.source = AccountFactory(primary_user=None, credit_limit=None)
+        self.redemptions = AccountFactory(name='Redemptions')
+
+    def test_spreads_its_balance_over_shards(self):
+        for i in range(10):
+            Transfer.objects.create(self.source, self.redemptions, D('10.00'))
+        self.assertEqual(4, self.redemptions.balance_shards.count())
+        self.assertEqual(D('100.00'), self.redemptions.shard_balance())
+
+    def test_reads_its_balance_from_the_shards(self):
+        Transfer.objects.create(self.source, self.redemptions, D('10.00'))
+        Transfer.objects.create(self.source, self.redemptions, D('15.00'))
+        self.assertEqual(D('25.00'), Account.objects.get(
+            id=self.redemptions.id).balance)
+
+    def test_only_reads_the_shards_when_the_balance_is_used(self):
+        for i in range(5):
+            Transfer.objects.create(self.source, self.redemptions, D('10.00'))
+        with self.assertNumQueries(1):
+            transfers = list(Transfer.objects.select_related('destination'))
+            for transfer in transfers:
+                str(transfer.destination)
+        self.assertEqual(D('50.00'), transfers[0].destination.balance)
+
+    def test_seeds_the_shards_with_the_existing_balance(self):
+        with mock.patch.dict(names.STRIPED_ACCOUNTS, clear=True):
+            Transfer.objects.create(self.source, self.redemptions, D('10.00'))
+        Transfer.objects.create(self.source, self.redemptions, D('5.00'))
+        self.assertEqual(D('15.00'), self.redemptions.shard_balance())
+
+    def test_checks_the_sum_of_its_shards_when_debited(self):
+        customer = AccountFactory()
+        Transfer.objects.create(self.source, self.redemptions, D('10.00'))
+        with self.assertRaises(exceptions.InsufficientFunds):
+            Transfer.objects.create(self.redemptions, customer, D('20.00'))
+        Transfer.objects.create(self.redemptions, customer, D('10.00'))
+        self.assertEqual(D('0.00'), self.redemptions.shard_balance())
+
+    def test_has_the_right_balance_in_memory_after_posting(self):
+        redemptions = Account.objects.get(name='Redemptions')
+        Transfer.objects.create(self.source, redemptions, D('10.00'))
+        Transfer.objects.create(self.source, redemptions, D('5.00'))
+        self.assertEqual(D('15.00'), redemptions.balance)
+        Transfer.objects.create_many([
+            {'source': self.source, 'destination': redemptions,
+             'amount': D('1.00')},
+            {'source': self.source, 'destination': redemptions,
+             'amount': D('2.00')}])
+        self.assertEqual(D('18.00'), redemptions.balance)
+        self.assertEqual(D('18.00'), redemptions.shard_balance())
+
+    def test_has_the_right_balance_in_a_registry_handle_after_posting(self):
+        registry.clear()
+        redemptions = core.redemptions_account()
+        facade.transfer(self.source, redemptions, D('10.00'))
+        self.assertEqual(D('10.00'), redemptions.balance)
+
+    def test_checks_its_current_status_when_posting(self):
+        # Eg closed by another process since it was loaded
+        self.redemptions.credit_limit = None
+        Account.objects.filter(id=self.redemptions.id).update(
+            status=Account.CLOSED, credit_limit=None)
+        with self.assertRaises(exceptions.ClosedAccount):
+            Transfer.objects.create(self.source, self.redemptions, D('10.00'))
+        with self.assertRaises(exceptions.ClosedAccount):
+            Transfer.objects.create(self.redemptions, self.source, D('10.00'))
+
+    def test_checks_its_current_credit_limit_when_debited(self):
+        customer = AccountFactory()
+        self.redemptions.credit_limit = None
+        Account.objects.filter(id=self.redemptions.id).update(
+            credit_limit=D('0.00'))
+        with self.assertRaises(exceptions.InsufficientFunds):
+            Transfer.objects.create(self.redemptions, customer, D('10.00'))
+
+    def test_can_be_reconciled(self):
+        Transfer.objects.create(self.source, self.redemptions, D('10.00'))
+        self.redemptions.balance_shards.update(balance=D('3.00'))
+        self.assertEqual(D('10.00'), self.redemptions.reconcile_balance())
+        self.assertEqual(D('10.00'), self.redemptions.shard_balance())
@@ -1,11 +1,17 @@
 from decimal import Decimal as D
+from importlib import import_module
+from io import StringIO
 
+from django.apps import apps
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 from oscar.test.factories import UserFactory
 
 from oscar_accounts import exceptions
-from oscar_accounts.models import Transfer
+from oscar_accounts.models import Account, Transfer
 from oscar_accounts.test_factories import AccountFactory
 
 
@@ -41,6 +47,94 @@ class TestASuccessfulTransfer(TestCase):
         self.assertEqual('barry', transfer.authorisor_username)
 
 
+class TestTransferReferences(TestCase):
+
+    def setUp(self):
+        self.source = AccountFactory(primary_user=None, credit_limit=None)
+        self.destination = AccountFactory()
+
+    def test_are_32_uppercase_hex_characters(self):
+        transfer = Transfer.objects.create(
+            self.source, self.destination, D('10.00'))
+        self.assertRegex(transfer.reference, r'^[A-F0-9]{32}$')
+
+    def test_are_set_before_the_row_is_inserted(self):
+        with CaptureQueriesContext(connection) as ctx:
+            Transfer.objects.create(self.source, self.destination, D('10.00'))
+        updates = [q['sql'] for q in ctx.captured_queries
+                   if q['sql'].startswith('UPDATE "oscar_accounts_transfer"')]
+        self.assertEqual([], updates)
+
+    def test_are_unique(self):
+        references = set(
+            Transfer.objects.create(
+                self.source, self.destination, D('1.00')).reference
+            for i in range(20))
+        self.assertEqual(20, len(references))
+
+    def test_are_not_changed_by_later_saves(self):
+        transfer = Transfer.objects.create(
+            self.source, self.destination, D('10.00'))
+        Transfer.objects.filter(id=transfer.id).update(reference='A' * 32)
+        transfer = Transfer.objects.get(id=transfer.id)
+        transfer.description = "Updated"
+        transfer.save()
+        self.assertEqual('A' * 32, Transfer.objects.get(
+            id=transfer.id).reference)
+
+
+class TestBalanceMaintenance(TestCase):
+
+    def setUp(self):
+        self.source = AccountFactory(primary_user=None, credit_limit=None)
+        self.destination = AccountFactory()
+
+    def test_applies_the_delta_without_aggregating_transactions(self):
+        Transfer.objects.create(self.source, self.destination, D('10.00'))
+        with CaptureQueriesContext(connection) as ctx:
+            Transfer.objects.create(self.source, self.destination, D('5.00'))
+        for query in ctx.captured_queries:
+            self.assertNotIn('SUM(', query['sql'])
+        self.assertEqual(D('15.00'), self.destination.balance)
+        self.assertEqual(D('15.00'), Account.objects.get(
+            id=self.destination.id).balance)
+
+    def test_can_reconcile_a_drifted_balance(self):
+        Transfer.objects.create(self.source, self.destination, D('10.00'))
+        Account.objects.filter(id=self.destination.id).update(
+            balance=D('999.00'))
+        self.assertEqual(D('10.00'), self.destination.reconcile_balance())
+        self.assertEqual(D('10.00'), Account.objects.get(
+            id=self.destination.id).balance)
+
+
+class TestATransferFromAStaleAccount(TestCase):
+
+    def setUp(self):
+        self.source = AccountFactory(primary_user=None, credit_limit=D('0.00'))
+        self.destination = AccountFactory()
+        bank = AccountFactory(primary_user=None, credit_limit=None)
+        Transfer.objects.create(bank, self.source, D('20.00'))
+
+    def test_is_verified_against_the_locked_row(self):
+        # Another process spends the funds after our instance was loaded
+        other = Account.objects.get(id=self.source.id)
+        Transfer.objects.create(other, self.destination, D('20.00'))
+        self.assertEqual(D('20.00'), self.source.balance)
+
+        with self.assertRaises(exceptions.InsufficientFunds):
+            Transfer.objects.create(self.source, self.destination, D('20.00'))
+        self.assertEqual(D('0.00'), Account.objects.get(
+            id=self.source.id).balance)
+
+    def test_returns_locked_accounts_keyed_by_primary_key(self):
+        locked = Transfer.objects.lock_accounts(
+            [self.destination, self.source])
+        self.assertEqual(
+            {self.source.id, self.destination.id}, set(locked.keys()))
+        self.assertEqual(D('20.00'), locked[self.source.id].balance)
+
+
 class TestATransferToAnInactiveAccount(TestCase):
 
     def test_is_permitted(self):
@@ -105,3 +199,64 @@ class TestAnAttemptedTransfer(TestCase):
         with self.assertRaises(exceptions.ClosedAccount):
             Transfer.objects.create(
                 source, destination, D('20.00'), user=self.user)
+
+
+class TestRefundingATransfer(TestCase):
+
+    def setUp(self):
+        self.source = AccountFactory(primary_user=None, credit_limit=None)
+        self.customer = AccountFactory(primary_user=None)
+        self.redemptions = AccountFactory(primary_user=None)
+        Transfer.objects.create(self.source, self.customer, D('100.00'))
+        self.redemption = Transfer.objects.create(
+            self.customer, self.redemptions, D('40.00'))
+
+    def refund(self, amount):
+        return Transfer.objects.create(
+            self.redemptions, self.customer, amount, parent=self.redemption)
+
+    def test_records_the_refunded_amount_on_the_parent(self):
+        self.refund(D('15.00'))
+        self.refund(D('5.00'))
+        self.assertEqual(D('20.00'), self.redemption.refunded_amount)
+        self.assertEqual(D('20.00'), Transfer.objects.get(
+            id=self.redemption.id).refunded_amount)
+
+    def test_works_out_the_max_refund_without_queries(self):
+        self.refund(D('15.00'))
+        redemption = Transfer.objects.get(id=self.redemption.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(D('25.00'), redemption.max_refund())
+
+    def test_records_refunds_made_in_bulk(self):
+        Transfer.objects.create_many([
+            {'source': self.redemptions, 'destination': self.customer,
+             'amount': D('10.00'), 'parent': self.redemption}
+            for i in range(2)])
+        self.assertEqual(D('20.00'), self.redemption.refunded_amount)
+        self.assertEqual(D('20.00'), Transfer.objects.get(
+            id=self.redemption.id).refunded_amount)
+
+    def test_ignores_related_transfers_that_are_not_refunds(self):
+        Transfer.objects.create(self.source, self.customer, D('10.00'),
+                                parent=self.redemption)
+        self.assertEqual(D('0.00'), Transfer.objects.get(
+            id=self.redemption.id).refunded_amount)
+
+    def test_can_backfill_refunded_amounts(self):
+        self.refund(D('15.00'))
+        Transfer.objects.update(refunded_amount=D('0.00'))
+        call_command('backfill_refunded_amounts', stdout=StringIO())
+        self.assertEqual(D('15.00'), Transfer.objects.get(
+            id=self.redemption.id).refunded_amount)
+        self.assertEqual(0, Transfer.objects.exclude(
+            id=self.redemption.id).exclude(refunded_amount=0).count())
+
+    def test_refunded_amounts_are_backfilled_by_the_migration(self):
+        migration = import_module(
+            'oscar_accounts.migrations.0009_transfer_refunded_amount')
+        self.refund(D('15.00'))
+        Transfer.objects.update(refunded_amount=D('0.00'))
+        migration.backfill_refunded_amounts(apps, None)
+        self.assertEqual(D('15.00'), Transfer.objects.get(
+            id=self.redemption.id).refunded_amount)
@@ -0,0 +1,81 @@
+import json
+from decimal import Decimal as D
+from io import StringIO
+from unittest import mock
+
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+
+from oscar_accounts import verification
+from oscar_accounts.models import Account, Transaction, Transfer
+from oscar_accounts.test_factories import AccountFactory
+
+
+class TestVerifyingTheLedger(TestCase):
+
+    def setUp(self):
+        self.source = AccountFactory(primary_user=None, credit_limit=None)
+        self.accounts = [AccountFactory() for i in range(5)]
+        for account in self.accounts:
+            self.transfer = Transfer.objects.create(
+                self.source, account, D('10.00'))
+
+    def verify(self, **kwargs):
+        out = StringIO()
+        try:
+            call_command('verify_ledger', stdout=out, **kwargs)
+        except CommandError:
+            pass
+        return [json.loads(line) for line in out.getvalue().splitlines()]
+
+    def test_finds_nothing_in_a_consistent_ledger(self):
+        call_command('verify_ledger', stdout=StringIO())
+
+    def test_reports_a_drifted_balance(self):
+        account = self.accounts[2]
+        Account.objects.filter(id=account.id).update(balance=D('7.00'))
+        self.assertEqual([{
+            'type': verification.BALANCE_MISMATCH,
+            'account_id': account.id,
+            'cached_balance': '7.00',
+            'actual_balance': '10.00'}], self.verify())
+
+    def test_reports_a_null_balance(self):
+        account = self.accounts[2]
+        Account.objects.filter(id=account.id).update(balance=None)
+        self.assertEqual([{
+            'type': verification.BALANCE_MISMATCH,
+            'account_id': account.id,
+            'cached_balance': None,
+            'actual_balance': '10.00'}], self.verify())
+
+    def test_reports_an_unbalanced_transfer(self):
+        Transaction.objects.filter(
+            transfer=self.transfer, amount__gt=0).update(amount=D('11.00'))
+        types = [d['type'] for d in self.verify()]
+        self.assertIn(verification.LEDGER_NOT_BALANCED, types)
+        self.assertIn(verification.TRANSFER_NOT_BALANCED, types)
+        self.assertIn(verification.BALANCE_MISMATCH, types)
+
+    def test_raises_an_error_for_discrepancies(self):
+        Account.objects.filter(id=self.source.id).update(balance=D('0.00'))
+        with self.assertRaises(CommandError):
+            call_command('verify_ledger', stdout=StringIO())
+
+    def test_checks_balances_by_account_id_range(self):
+        Account.objects.filter(id=self.accounts[0].id).update(balance=D('0.00'))
+        ranges = verification.account_id_ranges(3)
+        discrepancies = []
+        for start, end in ranges:
+            discrepancies.extend(verification.verify_balances(
+                start, end, chunk_size=2))
+        self.assertEqual([self.accounts[0].id],
+                         [d['account_id'] for d in discrepancies])
+
+    def test_forks_the_workers(self):
+        with mock.patch.object(verification.multiprocessing,
+                               'get_context') as get_context:
+            pool = get_context.return_value.Pool.return_value
+            pool.__enter__.return_value.imap.return_value = []
+            list(verification.verify_ledger(workers=2))
+        get_context.assert_called_once_with('fork')